@@ -1,3 +1,3 @@
 __version__ = "0.1.0"
 
-from .decorators import undocumented
+from .decorators import undocumented, single_flight
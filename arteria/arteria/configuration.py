@@ -1,15 +1,56 @@
+import hashlib
 import logging
-import yaml
+import marshal
+import os
+import signal
+import sys
+import tempfile
 import threading
+import time
+import yaml
+from arteria.schema import Schema, SchemaError
+
+# Use the libyaml based loader if PyYAML was built with it, it's several times faster
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+
+class _CacheEntry(object):
+    """
+    A parsed config file and its compiled snapshot, together with the stat info it was read with.
+
+    Entries are never mutated. A new entry is swapped into the cache instead,
+    which lets readers use them without taking a lock.
+    """
+    __slots__ = ("config", "snapshot", "stat_key", "checked_at", "generation")
+
+    def __init__(self, config, snapshot, stat_key, checked_at, generation):
+        self.config = config
+        self.snapshot = snapshot
+        self.stat_key = stat_key
+        self.checked_at = checked_at
+        self.generation = generation
+
 
 class ConfigurationService:
-    def __init__(self, logger=None, logger_config_path=None, app_config_path=None):
+    def __init__(self, logger=None, logger_config_path=None, app_config_path=None,
+                 revalidate_interval=None, app_config_schema=None, parse_cache_dir=None):
         """
         Initializes a configuration service
 
         :param logger: The logger instance to use. Will default to one named like the module
         :param logger_config_path: The path to the logger config file
         :param app_config_path: The path to the application specific config file
+        :param revalidate_interval: If set, the number of seconds a cached config file is
+                                    trusted before it is checked for changes on disk. If
+                                    None (default), config files are cached forever.
+        :param app_config_schema: An arteria.schema.Schema the app config is validated and
+                                  compiled with when it's loaded. Defaults to an empty schema.
+        :param parse_cache_dir: If set, parsed config files are cached on disk in this directory,
+                                so that restarts and new processes can skip parsing the YAML.
+                                See read_yaml.
 
         Usage example:
         config_svc = ConfigurationService(logger_config_path="/opt/product/etc/logger.config",
@@ -19,15 +60,42 @@ class ConfigurationService:
         config_svc.get_app_config()
         config_svc.get_logger_config()
 
+        # The app config is also available as an immutable snapshot, compiled with the
+        # app_config_schema once per load. Declared keys can be read as attributes:
+        config_svc.get_app_snapshot().monitored_directories
+
         # Config files are cached in-memory
         # The config files should be YAML
+
+        # With revalidate_interval set, a changed file is detected with a single os.stat
+        # (size, mtime and inode) at most once per interval and path, and a freshly parsed
+        # config is swapped in. Reloads can also be forced with reload() or by installing
+        # a signal handler with install_reload_signal_handler() and sending SIGHUP.
         """
         self._logger = logger or logging.getLogger(__name__)
         self._logger_config_path = logger_config_path
         self._app_config_path = app_config_path
+        self._revalidate_interval = revalidate_interval
+        self._schemas = {app_config_path: app_config_schema or Schema()}
+        self._parse_cache_dir = parse_cache_dir
         self._cache_lock = threading.Lock()
         self._cache = {}
 
+        # Bumped by reload() to invalidate all cached entries without taking the lock,
+        # which makes it safe to call from a signal handler
+        self._generation = 0
+        self._reload_requested_at = None
+
+        self._stats = {
+            "reloads": 0,
+            "reload_errors": 0,
+            "revalidations": 0,
+            "last_parse_seconds": 0.0,
+            "total_parse_seconds": 0.0,
+            "last_reload_latency_seconds": 0.0,
+            "total_reload_latency_seconds": 0.0
+        }
+
     def get_app_config(self):
         """Returns the application specific config file"""
         return self._load_config_file(self._app_config_path)
@@ -36,27 +104,207 @@ class ConfigurationService:
         """Returns the logger config file"""
         return self._load_config_file(self._logger_config_path)
 
+    def get_app_snapshot(self):
+        """Returns the application specific config, compiled with the app config schema"""
+        return self._load_entry(self._app_config_path).snapshot
+
     def __getitem__(self, key):
         """Returns the value for the key from the app config"""
-        app_config = self.get_app_config()
-        return app_config[key]
+        return self._load_entry(self._app_config_path).snapshot[key]
+
+    def reload(self):
+        """
+        Marks all cached config files as stale, so that they are read
+        from disk on next access
+        """
+        self._reload_requested_at = time.time()
+        self._generation += 1
+
+    def install_reload_signal_handler(self, signum=signal.SIGHUP):
+        """Reloads the config files when the process receives the signal (SIGHUP by default)"""
+        signal.signal(signum, lambda received_signum, frame: self.reload())
+
+    def get_cache_stats(self):
+        """Returns a copy of the reload counters, including parse times and reload latency"""
+        return dict(self._stats)
 
     def _load_config_file(self, path, from_cache=True):
         """Loads the config file, possibly from cache"""
-        must_fetch = lambda: (not from_cache) or (path not in self._cache)
-        if must_fetch():
-            # TODO: Code review threading code
-            with self._cache_lock:
-                if must_fetch():
-                    config_file = ConfigurationService.read_yaml(path)
-                    self._cache[path] = config_file
-                    self._logger.info("Read config file from {0}, format={1}, from_cache={2}"
-                                      .format(path, format, from_cache))
-        return self._cache[path]
+        return self._load_entry(path, from_cache).config
+
+    def _load_entry(self, path, from_cache=True):
+        """Returns the cache entry for the config file, loading it if required"""
+        entry = self._cache.get(path)
+        if from_cache and entry is not None and entry.generation == self._generation:
+            if self._revalidate_interval is None:
+                return entry
+            now = time.time()
+            if now - entry.checked_at < self._revalidate_interval:
+                return entry
+            return self._revalidate(path, entry, now)
+        return self._reload(path, force=not from_cache)
+
+    def _revalidate(self, path, entry, now):
+        """Checks the file on disk, and only re-reads it if it has changed"""
+        try:
+            stat_key = ConfigurationService._stat_key(path)
+        except OSError as e:
+            self._logger.error("Not able to stat config file {0}, keeping the cached version: {1}"
+                               .format(path, e))
+            stat_key = entry.stat_key
+
+        with self._cache_lock:
+            self._stats["revalidations"] += 1
+            if stat_key == entry.stat_key:
+                current = self._cache.get(path)
+                if current is not entry:
+                    # Reloaded or revalidated by another thread while the file was checked,
+                    # so the current entry is at least as new as this one
+                    return current
+                entry = _CacheEntry(entry.config, entry.snapshot, entry.stat_key, now, entry.generation)
+                self._cache[path] = entry
+                return entry
+        return self._reload(path, force=False)
+
+    def _reload(self, path, force):
+        with self._cache_lock:
+            generation = self._generation
+            entry = self._cache.get(path)
+            stat_key = ConfigurationService._stat_key(path) if os.path.exists(path) else None
+            now = time.time()
+
+            # Another thread may have reloaded the file while we waited for the lock
+            if (not force and entry is not None and entry.generation == generation and
+                    entry.stat_key == stat_key):
+                return entry
+
+            try:
+                config = ConfigurationService.read_yaml(path, self._parse_cache_dir)
+                snapshot = self._compile(path, config)
+            except Exception as e:
+                if entry is None:
+                    raise
+                # Keep serving the last good snapshot, but try again after the next interval
+                self._stats["reload_errors"] += 1
+                self._logger.error("Not able to reload config file {0}, keeping the cached version: {1}"
+                                   .format(path, e))
+                entry = _CacheEntry(entry.config, entry.snapshot, entry.stat_key, now, generation)
+                self._cache[path] = entry
+                return entry
+
+            parse_seconds = time.time() - now
+            new_entry = _CacheEntry(config, snapshot, stat_key, time.time(), generation)
+            self._cache[path] = new_entry
+
+            if entry is not None:
+                self._record_reload(stat_key, parse_seconds)
+            self._stats["last_parse_seconds"] = parse_seconds
+            self._stats["total_parse_seconds"] += parse_seconds
+            self._logger.info("Read config file from {0}, from_cache={1}, reloaded={2}"
+                              .format(path, not force, entry is not None))
+            return new_entry
+
+    def _compile(self, path, config):
+        """
+        Compiles the config with the schema registered for the path, if any
+
+        :raises ConfigurationError if the config doesn't match the schema
+        """
+        schema = self._schemas.get(path)
+        if schema is None:
+            return None
+        try:
+            return schema.compile(config or {})
+        except SchemaError as e:
+            raise ConfigurationError("Invalid config file {0}: {1}".format(path, e))
+
+    def _record_reload(self, stat_key, parse_seconds):
+        """
+        Updates the reload counters. The reload latency is the time from the change
+        (the file's mtime or a reload request) until the new config was swapped in
+        """
+        changed_at = self._reload_requested_at
+        if stat_key is not None and (changed_at is None or stat_key[1] > changed_at):
+            changed_at = stat_key[1]
+        latency = max(time.time() - changed_at, parse_seconds) if changed_at else parse_seconds
+        self._stats["reloads"] += 1
+        self._stats["last_reload_latency_seconds"] = latency
+        self._stats["total_reload_latency_seconds"] += latency
 
     @staticmethod
-    def read_yaml(path):
-        """Deserializes the content of the yaml file"""
-        with open(path, 'r') as f:
-            config = yaml.load(f.read())
-            return config
+    def _stat_key(path):
+        """Returns a key that changes when the file at path is modified or replaced"""
+        st = os.stat(path)
+        return st.st_size, st.st_mtime, st.st_ino
+
+    @staticmethod
+    def read_yaml(path, cache_dir=None):
+        """
+        Deserializes the content of the yaml file
+
+        If cache_dir is set, the parsed content is cached there, keyed by the path and a
+        hash of the file content. A cached file is only used if the content is unchanged,
+        so the file still has to be read, but it doesn't have to be parsed.
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        cache_path = None
+        if cache_dir:
+            cache_path = ConfigurationService._parse_cache_path(path, content, cache_dir)
+            try:
+                with open(cache_path, 'rb') as f:
+                    return marshal.load(f)
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                pass
+
+        config = yaml.load(content, Loader=YamlLoader)
+        if cache_path:
+            ConfigurationService._write_parse_cache(cache_path, config)
+        return config
+
+    @staticmethod
+    def _parse_cache_path(path, content, cache_dir):
+        """
+        Returns the path of the cached, parsed content. The name is <path hash>-<content hash>,
+        which makes it possible to find earlier versions of the same config file
+        """
+        path_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        content_hash = hashlib.sha1(content)
+        # The marshal format may change between Python versions
+        content_hash.update("{0}-{1}".format(sys.version_info[:2], marshal.version).encode("utf-8"))
+        return os.path.join(cache_dir, "{0}-{1}.marshal".format(path_hash, content_hash.hexdigest()))
+
+    @staticmethod
+    def _write_parse_cache(cache_path, config):
+        """
+        Writes the parsed config to the cache. The file is written to a temporary file
+        and renamed, so that concurrent readers never see a partially written file.
+        Failures are ignored, the cache is only an optimization.
+        """
+        cache_dir, cache_name = os.path.split(cache_path)
+        try:
+            data = marshal.dumps(config)
+        except ValueError:
+            # E.g. dates, which marshal doesn't support. Parse the file each time instead.
+            return
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, cache_path)
+
+            # Remove cached versions of earlier content of the same file
+            path_hash = cache_name.split("-")[0]
+            for name in os.listdir(cache_dir):
+                if name.startswith(path_hash) and name != cache_name:
+                    os.remove(os.path.join(cache_dir, name))
+        except (IOError, OSError):
+            logging.getLogger(__name__).warning(
+                "Not able to write the config parse cache {0}".format(cache_path), exc_info=True)
+
+
+class ConfigurationError(Exception):
+    pass
@@ -1,3 +1,8 @@
+import functools
+import threading
+import time
+
+
 def undocumented(f):
     """
     Apply the undocumented decorator to handler methods if they should not turn up in the API help
@@ -5,3 +10,111 @@ def undocumented(f):
     f.undocumented = True
     return f
 
+
+def single_flight(ttl=0, key=None):
+    """
+    Coalesces concurrent calls with the same arguments into one: the first call does the
+    work, and calls made while it's in flight get its result, or its exception, too.
+    With a ttl, the result is also returned to calls made up to ttl seconds after it was
+    computed. Exceptions are never kept.
+
+    Works for blocking functions called from several threads, e.g. service methods called
+    through BaseRestHandler.run_in_thread, and for functions returning futures, e.g.
+    coroutines, whose future is shared while it's pending. Results are shared rather than
+    copied, so they shouldn't be modified, and generators can't be shared.
+
+    Usage example, for a blocking call whose result many clients poll for:
+        class StatusService:
+            @single_flight(ttl=1)
+            def get_status(self):
+                return self._read_status_files()
+
+    :param ttl: The number of seconds a result is returned to later calls
+    :param key: A function of the arguments returning the hashable key that identifies
+                identical calls. Defaults to the arguments themselves, including self.
+    """
+    def decorator(f):
+        flights = {}
+        lock = threading.Lock()
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            flight_key = key(*args, **kwargs) if key else (args, frozenset(kwargs.items()))
+            with lock:
+                flight = flights.get(flight_key)
+                if flight is not None and flight.is_expired():
+                    flight = None
+                if flight is None:
+                    _remove_expired(flights)
+                    flight = flights[flight_key] = _Flight()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                return flight.wait()
+
+            def finish(error=None):
+                with lock:
+                    if error is not None or not ttl:
+                        if flights.get(flight_key) is flight:
+                            del flights[flight_key]
+                    else:
+                        flight.expires_at = time.time() + ttl
+
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                # Including e.g. KeyboardInterrupt, or the followers, and every later call
+                # with the same key, would wait for the flight forever
+                finish(e)
+                flight.set_error(e)
+                raise
+
+            if _is_future(result) and not result.done():
+                # Kept in flight until the future is done
+                result.add_done_callback(lambda future: finish(future.exception()))
+            else:
+                finish(result.exception() if _is_future(result) else None)
+            flight.set_result(result)
+            return result
+
+        return wrapper
+    return decorator
+
+
+class _Flight(object):
+    """A call in flight, or a result kept until expires_at"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        # Not set until the call has finished
+        self.expires_at = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= time.time()
+
+
+def _remove_expired(flights):
+    for flight_key in [k for k, flight in flights.items() if flight.is_expired()]:
+        del flights[flight_key]
+
+
+def _is_future(obj):
+    return hasattr(obj, "add_done_callback") and hasattr(obj, "done")
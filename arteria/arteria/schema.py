@@ -0,0 +1,206 @@
+"""
+Declarative schemas for config files, validated once when they are loaded.
+
+Usage example:
+    schema = Schema(
+        Field("monitored_directories", list, required=True,
+              convert=lambda dirs: [os.path.normpath(d) for d in dirs]),
+        Field("port", int, default=10000),
+        Computed("monitored_count", lambda values: len(values["monitored_directories"])),
+        name="RunfolderConfig")
+
+    snapshot = schema.compile(yaml_dict)
+
+    # Declared keys are read as attributes, or by key for backwards compatibility:
+    snapshot.monitored_directories
+    snapshot["port"]
+
+Schemas are also used to validate JSON request bodies, see BaseRestHandler.body_as_object:
+
+    request_schema = Schema(
+        Field("barcode_mismatches", int, min_value=0, max_value=2),
+        Field("use_base_mask", string_types, max_length=1000),
+        name="StartRequest")
+"""
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class Field(object):
+    """Declares a key, its type and default value"""
+
+    def __init__(self, name, value_type=None, required=False, default=None, convert=None,
+                 min_value=None, max_value=None, max_length=None, choices=None):
+        """
+        :param name: The key in the source dict. Must be a valid Python identifier
+        :param value_type: A type or tuple of types the value must be an instance of
+        :param required: If True, a missing key is an error. Otherwise default is used
+        :param default: The value used if the key is missing
+        :param convert: A function applied to the value after validation, e.g. for normalizing it
+        :param min_value: The smallest value allowed
+        :param max_value: The largest value allowed
+        :param max_length: The maximum length of a string or list value
+        :param choices: The values allowed
+        """
+        self.name = name
+        self.value_type = value_type
+        self.required = required
+        self.default = default
+        self.convert = convert
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_length = max_length
+        self.choices = frozenset(choices) if choices is not None else None
+        # bool is a subclass of int, but true isn't a valid number in a JSON document
+        self._rejects_bool = value_type is not None and not _includes_bool(value_type)
+        self._has_limits = (min_value is not None or max_value is not None or
+                            max_length is not None or choices is not None)
+
+    def resolve(self, obj, errors):
+        """Returns the validated value of this field in obj, appending to errors on failure"""
+        if self.name not in obj:
+            if self.required:
+                errors.append({"field": self.name, "message": "Required field is missing"})
+            return self.default
+
+        value = obj[self.name]
+        if self.value_type is not None and (not isinstance(value, self.value_type) or
+                                            self._rejects_bool and isinstance(value, bool)):
+            errors.append({"field": self.name,
+                           "message": "Expected {0}, got {1}".format(
+                               _type_name(self.value_type), type(value).__name__)})
+            return self.default
+        if self._has_limits:
+            message = self._check_limits(value)
+            if message:
+                errors.append({"field": self.name, "message": message})
+                return self.default
+        if self.convert is not None:
+            value = self.convert(value)
+        return value
+
+    def _check_limits(self, value):
+        """Returns a message if the value is outside the limits of the field"""
+        if self.choices is not None and value not in self.choices:
+            return "Expected one of {0}".format(", ".join(sorted(repr(c) for c in self.choices)))
+        if self.min_value is not None and value < self.min_value:
+            return "Expected at least {0}".format(self.min_value)
+        if self.max_value is not None and value > self.max_value:
+            return "Expected at most {0}".format(self.max_value)
+        if self.max_length is not None and len(value) > self.max_length:
+            return "Expected at most {0} items or characters".format(self.max_length)
+        return None
+
+
+class Computed(object):
+    """Declares a value derived from the other values, computed once at load time"""
+
+    def __init__(self, name, compute):
+        """
+        :param name: The attribute name of the computed value
+        :param compute: A function taking a dict of the values resolved so far
+        """
+        self.name = name
+        self.compute = compute
+
+
+class Schema(object):
+    """A set of fields that can be compiled into immutable snapshots"""
+
+    def __init__(self, *fields, **kwargs):
+        self.name = kwargs.get("name", "ConfigSnapshot")
+        self.fields = [field for field in fields if isinstance(field, Field)]
+        self.computed = [field for field in fields if isinstance(field, Computed)]
+        slots = tuple(field.name for field in fields)
+        self.snapshot_class = type(self.name, (Snapshot,),
+                                   {"__slots__": slots, "_fields": frozenset(slots)})
+
+    def validate(self, obj):
+        """
+        Returns a dict with the validated and converted values of obj
+
+        :raises SchemaError if obj doesn't match the schema
+        """
+        if not isinstance(obj, dict):
+            raise SchemaError([{"field": None, "message": "Expected a dict, got {0}"
+                                .format(type(obj).__name__)}])
+        errors = []
+        values = {}
+        for field in self.fields:
+            values[field.name] = field.resolve(obj, errors)
+        if errors:
+            raise SchemaError(errors)
+        for computed in self.computed:
+            values[computed.name] = computed.compute(values)
+        return values
+
+    def compile(self, obj):
+        """
+        Validates obj and returns it as an immutable snapshot
+
+        :raises SchemaError if obj doesn't match the schema
+        """
+        return self.snapshot_class(self.validate(obj), obj)
+
+
+class Snapshot(object):
+    """
+    An immutable view of a validated dict. Subclasses are generated by Schema,
+    with one slot per declared field.
+
+    Keys that are not declared in the schema can still be read by key.
+    """
+    __slots__ = ("_source",)
+    _fields = frozenset()
+
+    def __init__(self, values, source):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_source", source)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshots are immutable, can't set '{0}'".format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError("Snapshots are immutable, can't delete '{0}'".format(name))
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        return self._source[key]
+
+    def __contains__(self, key):
+        return key in self._fields or key in self._source
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, ", ".join(
+            "{0}={1!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class SchemaError(Exception):
+    """Raised when a dict doesn't match a schema. errors is a list of dicts with field and message"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(SchemaError, self).__init__("; ".join(
+            "{0}: {1}".format(error["field"], error["message"]) for error in errors))
+
+
+def _includes_bool(value_type):
+    value_types = value_type if isinstance(value_type, tuple) else (value_type,)
+    return any(issubclass(bool, t) and t is not int for t in value_types)
+
+
+def _type_name(value_type):
+    if isinstance(value_type, tuple):
+        return " or ".join(t.__name__ for t in value_type)
+    return value_type.__name__
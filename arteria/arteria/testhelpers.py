@@ -1,10 +1,37 @@
 import time
+import threading
 import jsonpickle
 import requests
 import re
 import unittest
 
+
+def create_session(pool_size=10):
+    """Returns a requests session that keeps up to pool_size connections per host open"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class BaseRestTest(unittest.TestCase):
+    # Shared by the tests in a test case, so that connections are reused between requests
+    _session = None
+
+    @property
+    def session(self):
+        cls = type(self)
+        if cls._session is None:
+            cls._session = create_session()
+        return cls._session
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._session is not None:
+            cls._session.close()
+            cls._session = None
+
     def _base_url(self):
         raise NotImplementedError("The method base url must be implemented")
 
@@ -26,7 +53,7 @@ class BaseRestTest(unittest.TestCase):
         """
         json = jsonpickle.encode(obj)
         full_url = self._get_full_url(url)
-        resp = requests.put(full_url, json)
+        resp = self.session.put(full_url, json)
         self._validate_response(resp, expect)
         return resp
 
@@ -39,7 +66,7 @@ class BaseRestTest(unittest.TestCase):
         :param expect: The expected status code
         """
         full_url = self._get_full_url(url)
-        resp = requests.get(full_url)
+        resp = self.session.get(full_url)
         self._validate_response(resp, expect)
         try:
             resp.body_obj = jsonpickle.decode(resp.text)
@@ -47,6 +74,153 @@ class BaseRestTest(unittest.TestCase):
             resp.body_obj = None
         return resp
 
+    def load_test(self, url, clients=4, seconds=10, method="GET", obj=None):
+        """
+        Sends requests to the url from concurrent clients for a number of seconds,
+        and returns a LoadTestResult
+
+        A starting '.' is replaced with the base url
+        :param obj: A Python object to send as the body
+        """
+        full_url = self._get_full_url(url)
+        body = jsonpickle.encode(obj) if obj is not None else None
+        load_test = LoadTest(lambda session: session.request(method, full_url, data=body),
+                             clients=clients, seconds=seconds)
+        return load_test.run()
+
+
+class LoadTest:
+    """
+    Drives an endpoint with concurrent clients for a number of seconds, and reports
+    the throughput and latency percentiles.
+
+    Usage example:
+        result = LoadTest(lambda session: session.get(url), clients=8, seconds=30).run()
+        print(result)
+        result.assert_slo(self, min_throughput=100, p99=0.5)
+    """
+    def __init__(self, send_request, clients=4, seconds=10, warmup_seconds=1):
+        """
+        :param send_request: A function that sends a request, given a requests session, and
+                             returns the response. Responses with a status code of 400 or
+                             higher, and exceptions, are counted as errors.
+        :param clients: The number of concurrent clients, each with its own connection
+        :param seconds: The number of seconds to measure for
+        :param warmup_seconds: The number of seconds to send requests for before measuring
+        """
+        self._send_request = send_request
+        self._clients = clients
+        self._seconds = seconds
+        self._warmup_seconds = warmup_seconds
+
+    def run(self):
+        """Runs the load test and returns a LoadTestResult"""
+        start = time.time()
+        measure_from = start + self._warmup_seconds
+        stop_at = measure_from + self._seconds
+        lock = threading.Lock()
+        latencies = []
+        errors = []
+
+        def client():
+            session = create_session(pool_size=1)
+            client_latencies = []
+            client_errors = []
+            while True:
+                sent_at = time.time()
+                if sent_at >= stop_at:
+                    break
+                try:
+                    resp = self._send_request(session)
+                    failure = resp.status_code if resp.status_code >= 400 else None
+                except Exception as e:
+                    failure = e
+                if sent_at < measure_from:
+                    continue
+                client_latencies.append(time.time() - sent_at)
+                if failure is not None:
+                    client_errors.append(failure)
+            session.close()
+            with lock:
+                latencies.extend(client_latencies)
+                errors.extend(client_errors)
+
+        threads = [threading.Thread(target=client) for _ in range(self._clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return LoadTestResult(latencies, errors, self._seconds, self._clients)
+
+
+class LoadTestResult:
+    """The requests made during a load test"""
+    def __init__(self, latencies, errors, seconds, clients):
+        """
+        :param latencies: The latency in seconds of each request, including failed requests
+        :param errors: The status codes or exceptions of the failed requests
+        :param seconds: The number of seconds the requests were made in
+        :param clients: The number of concurrent clients
+        """
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.seconds = seconds
+        self.clients = clients
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        """Requests per second"""
+        return self.requests / float(self.seconds)
+
+    @property
+    def error_rate(self):
+        return len(self.errors) / float(self.requests) if self.requests else 0.0
+
+    def percentile(self, percentile):
+        """Returns the latency percentile (0-100) in seconds"""
+        if not self.latencies:
+            return None
+        index = min(len(self.latencies) - 1, int(len(self.latencies) * percentile / 100.0))
+        return self.latencies[index]
+
+    def assert_slo(self, asserts=None, min_throughput=None, p50=None, p95=None, p99=None, max_error_rate=0.0):
+        """
+        Asserts that the load test met the service level objectives
+
+        :param asserts: An object that provides assertion methods, e.g. a TestCase. If None,
+                        an AssertionError is raised, e.g. for pytest style tests.
+        :param min_throughput: The minimum number of requests per second
+        :param p50: The maximum median latency, in seconds. Likewise for p95 and p99.
+        :param max_error_rate: The maximum fraction of failed requests
+        """
+        def check(condition, message):
+            if asserts is not None:
+                asserts.assertTrue(condition, message)
+            elif not condition:
+                raise AssertionError(message)
+
+        check(self.requests > 0, "No requests were made: {0}".format(self))
+        if min_throughput is not None:
+            check(self.throughput >= min_throughput, "Throughput below {0}/s: {1}".format(min_throughput, self))
+        for percentile, limit in (50, p50), (95, p95), (99, p99):
+            if limit is not None:
+                check(self.percentile(percentile) <= limit,
+                      "p{0} above {1}s: {2}".format(percentile, limit, self))
+        check(self.error_rate <= max_error_rate,
+              "Error rate above {0}: {1}, errors: {2}".format(max_error_rate, self, self.errors[:10]))
+
+    def __str__(self):
+        if not self.requests:
+            return "no requests"
+        return ("{0} requests in {1}s from {2} clients, {3:.1f}/s, p50 {4:.1f} ms, p95 {5:.1f} ms, "
+                "p99 {6:.1f} ms, {7} errors").format(
+            self.requests, self.seconds, self.clients, self.throughput, 1000 * self.percentile(50),
+            1000 * self.percentile(95), 1000 * self.percentile(99), len(self.errors))
+
 
 class TestFunctionDelta:
     """
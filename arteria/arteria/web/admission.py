@@ -0,0 +1,72 @@
+import math
+import time
+
+
+class RouteLimit:
+    """
+    Limits the number of concurrent requests to a route and/or the rate of requests to it.
+    Requests over the limits are rejected right away, rather than queued.
+
+    Concurrency is limited with a counter, and the rate with a token bucket that holds
+    up to burst tokens and is refilled with rate tokens per second.
+
+    Limits are enforced per process, from the IOLoop thread, so they aren't synchronized.
+
+    Usage example:
+        app_svc.start(routes, route_limits={
+            r"/api/1.0/runfolders": RouteLimit(max_concurrent=10, rate=50, burst=100)
+        })
+    """
+
+    # The status codes of rejected requests
+    TOO_MANY_REQUESTS = 429
+    SERVICE_UNAVAILABLE = 503
+
+    def __init__(self, max_concurrent=None, rate=None, burst=None, retry_after=1, clock=time.time):
+        """
+        :param max_concurrent: The maximum number of requests handled at the same time. Requests
+                               over the limit are rejected with 503 Service Unavailable.
+        :param rate: The maximum number of requests per second, on average. Requests over the
+                     limit are rejected with 429 Too Many Requests.
+        :param burst: The number of requests that can be made at once, over the rate.
+                      Defaults to the rate, but at least 1.
+        :param retry_after: The number of seconds clients are asked to wait before retrying
+                            requests rejected because of the concurrency limit
+        :param clock: Returns the current time in seconds
+        """
+        self._max_concurrent = max_concurrent
+        self._rate = rate
+        self._burst = burst if burst is not None else max(rate or 0, 1)
+        self._retry_after = retry_after
+        self._clock = clock
+        self._active = 0
+        self._tokens = float(self._burst)
+        self._refilled_at = clock()
+
+    def try_acquire(self):
+        """
+        Admits a request if it's within the limits, in which case release must be called when
+        it's finished. Returns None if the request was admitted, otherwise a tuple of the status
+        code, the reason, and the number of seconds after which the request may be retried.
+        """
+        if self._max_concurrent is not None and self._active >= self._max_concurrent:
+            return RouteLimit.SERVICE_UNAVAILABLE, "concurrency", self._retry_after
+
+        if self._rate is not None:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                retry_after = int(math.ceil((1 - self._tokens) / self._rate))
+                return RouteLimit.TOO_MANY_REQUESTS, "rate", retry_after
+            self._tokens -= 1
+
+        self._active += 1
+        return None
+
+    def release(self):
+        """Called when an admitted request has finished"""
+        self._active -= 1
+
+    def get_active(self):
+        return self._active
@@ -1,10 +1,21 @@
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
 import tornado.web
+import copy
 import logging
-import logging.config
 import os
+import signal
+import time
 from arteria.configuration import ConfigurationService
+from arteria.web import handoff
 from arteria.web.routes import RouteService
-from arteria.web.handlers import LogLevelHandler, ApiHelpHandler
+from arteria.web.executors import ExecutorService
+from arteria.web.handlers import LogLevelHandler, ApiHelpHandler, MetricsHandler, ProfileHandler
+from arteria.web.metrics import RequestMetrics
+from arteria.web.queue_logging import QueueLogging
+from arteria.web.watchdog import IOLoopWatchdog
+from arteria.web.workers import WorkerSupervisor
 from optparse import OptionParser
 
 
@@ -35,10 +46,25 @@ class AppService:
             # Now start the service.
             # The port will come from the command line argument --port
             app_svc.start(routes)
+
+            # Routes can also be given admission limits, see arteria.web.admission:
+            app_svc.start(routes, route_limits={r"/api/1.0/endpoint1": RouteLimit(max_concurrent=10)})
     """
 
-    def __init__(self, config_svc, debug, port, logger=None):
-        """Sets up the admin service and configures logging"""
+    def __init__(self, config_svc, debug, port, logger=None, workers=1, drain_timeout=30,
+                 watchdog_threshold=None, executor_threads=10, executor_processes=None):
+        """
+        Sets up the admin service and configures logging
+
+        :param workers: The number of worker processes to pre-fork when the service is started
+        :param drain_timeout: The number of seconds in-flight requests are given to finish
+                              when the service shuts down
+        :param watchdog_threshold: If set, the stack of the code blocking the IOLoop is logged
+                                   when it has been blocked for this many seconds
+        :param executor_threads: The number of threads handlers can run blocking code in
+        :param executor_processes: The number of processes handlers can run CPU bound code in.
+                                   Defaults to the number of CPUs.
+        """
         self.config_svc = config_svc
         self.route_svc = RouteService(self, debug)
         self._debug = debug
@@ -47,16 +73,39 @@ class AppService:
             raise InvalidPortError("Invalid port: '{port}'".format(port=port))
         self._port = port
 
-        # Initialize the logger configuration:
+        if not type(workers) is int or workers < 1:
+            raise InvalidWorkersError("Invalid number of workers: '{0}'".format(workers))
+        self._workers = workers
+        self._drain_timeout = drain_timeout
+        self._watchdog_threshold = watchdog_threshold
+        self.watchdog = None
+
+        # Threads and processes are started on first use, i.e. after forking any workers
+        self.executors = ExecutorService(executor_threads, executor_processes)
+
+        # Initialize the logger configuration. Log records are written directly until start(),
+        # which moves the writing to background threads once any workers have been forked.
         self._logger_config = config_svc.get_logger_config()
-        logging.config.dictConfig(self._logger_config)
+        self._logging = QueueLogging(self._logger_config)
+        self._logging.configure(queued=False)
 
         self._logger = logger or logging.getLogger(__name__)
         self._logger.info("Logger initialized by AppService")
+
+        # Load the app config up front, so that invalid config files fail at startup
+        # rather than on the first request
+        config_svc.get_app_snapshot()
         self._tornado = None
+        self._server = None
+        self._sockets = None
+        self._in_flight = 0
+        self._draining = False
+
+        self.metrics = RequestMetrics()
+        self._register_gauges()
 
     @staticmethod
-    def create(product_name=None):
+    def create(product_name=None, app_config_schema=None):
         """
         Creates the default app service based on arguments sent from the command line
         and related services with defaults based on the product_name.
@@ -69,6 +118,13 @@ class AppService:
                                [--product <product name>]
                                [--debug]
                                [--configroot path]
+                               [--configreload seconds]
+                               [--configcache path]
+                               [--workers N]
+                               [--draintimeout seconds]
+                               [--watchdog seconds]
+                               [--threads N]
+                               [--processes N]
 
         These config files should be accessible:
             - /opt/<product_name>/app.config
@@ -77,8 +133,35 @@ class AppService:
         You can override this by supplying config_root, in which case they should be
         found at <config_root>/*.config
 
+        If configreload is supplied, the config files are checked for changes at most
+        once per that many seconds and reloaded if they have changed. Sending SIGHUP to
+        the process forces a reload.
+
+        If configcache is supplied, parsed config files are cached in that directory,
+        so that restarts skip parsing unchanged config files.
+
+        If workers is supplied, the service pre-forks that many worker processes sharing
+        the port. Dead workers are restarted. Each worker logs to its own log files, named
+        like the configured files with the worker id appended, e.g. messages.log.worker1
+
+        On SIGTERM, the service stops accepting connections and gives in-flight requests
+        draintimeout seconds (default 30) to finish before it exits.
+
+        On SIGUSR2, the service restarts without refusing any connections: a new process is
+        started with the same command line, inheriting the listening sockets, and this
+        process shuts down as above when the new process has taken over.
+
+        If watchdog is supplied, the stack of the code blocking the IOLoop is logged when it
+        has been blocked for that many seconds. The IOLoop lag is added to the metrics.
+
+        The threads and processes options set the sizes of the thread pool (default 10) and
+        process pool (default the number of CPUs) that handlers can run blocking code in,
+        see BaseRestHandler.run_in_thread. With several workers, each worker has its own pools.
+
         :param product_name: Should by convention be __package__. This value can be overriden
                              by supplying the --product parameter on the command line.
+        :param app_config_schema: An optional arteria.schema.Schema that the app config is
+                                  validated and compiled with when it's loaded
         """
 
         parser = OptionParser()
@@ -86,6 +169,14 @@ class AppService:
         parser.add_option("--port", dest="port", metavar="PORT")
         parser.add_option("--debug", dest="debug", action="store_true", default=False)
         parser.add_option("--configroot", dest="configroot", metavar="CONFIGROOT")
+        parser.add_option("--configreload", dest="configreload", metavar="SECONDS", type="float")
+        parser.add_option("--configcache", dest="configcache", metavar="CONFIGCACHE")
+        parser.add_option("--workers", dest="workers", metavar="N", type="int", default=1)
+        parser.add_option("--draintimeout", dest="draintimeout", metavar="SECONDS", type="float",
+                          default=30)
+        parser.add_option("--watchdog", dest="watchdog", metavar="SECONDS", type="float")
+        parser.add_option("--threads", dest="threads", metavar="N", type="int", default=10)
+        parser.add_option("--processes", dest="processes", metavar="N", type="int")
         (options, args) = parser.parse_args()
 
         if options.product:
@@ -99,27 +190,188 @@ class AppService:
         logger_config_path = os.path.join(config_root, "logger.config")
         app_config_path = os.path.join(config_root, "app.config")
         config_svc = ConfigurationService(logger_config_path=logger_config_path,
-                                          app_config_path=app_config_path)
-        app_svc = AppService(config_svc, options.debug, int(options.port))
+                                          app_config_path=app_config_path,
+                                          revalidate_interval=options.configreload,
+                                          app_config_schema=app_config_schema,
+                                          parse_cache_dir=options.configcache)
+        if options.configreload is not None:
+            config_svc.install_reload_signal_handler()
+        app_svc = AppService(config_svc, options.debug, int(options.port), workers=options.workers,
+                             drain_timeout=options.draintimeout, watchdog_threshold=options.watchdog,
+                             executor_threads=options.threads, executor_processes=options.processes)
         return app_svc
 
-    def start(self, routes):
+    def start(self, routes, route_limits=None):
+        """
+        Starts serving the routes, and doesn't return until the service is shut down
+
+        :param routes: A list of tornado route tuples
+        :param route_limits: An optional dict from route patterns to
+                             arteria.web.admission.RouteLimit instances. Requests over
+                             the limits are rejected with 429 or 503 and Retry-After.
+        """
+        self._tornado = self._create_application(routes, route_limits)
+        self._logger.info("Starting the service on {0} (debug={1}, workers={2})"
+                          .format(self._port, self._debug, self._workers))
+
+        # The sockets must be bound, and the IOLoop must not be created, before forking
+        self._sockets = handoff.inherited_sockets() or tornado.netutil.bind_sockets(self._port)
+        signal.signal(signal.SIGTERM, self._handle_shutdown_signal)
+        signal.signal(signal.SIGUSR2, self._handle_restart_signal)
+        handoff.notify_predecessor()
+
+        worker_id = None
+        if self._workers > 1:
+            worker_id = WorkerSupervisor(self._workers).fork()
+            # Restarts are handled by the supervisor
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+        self._start_queue_logging(worker_id)
+
+        self._server = tornado.httpserver.HTTPServer(self._tornado)
+        self._server.add_sockets(self._sockets)
+        if self._watchdog_threshold:
+            self._start_watchdog()
+        tornado.ioloop.IOLoop.current().start()
+
+    def _create_application(self, routes, route_limits=None):
         # Add the default routes, such as the API handler
         routes.extend(self._get_default_routes())
         self.route_svc.set_routes(routes)
-        self._tornado = tornado.web.Application(self.route_svc.get_routes(), debug=self._debug)
-        self._logger.info("Starting the service on {0} (debug={1})"
-                          .format(self._port, self._debug))
-        self._tornado.listen(self._port)
-        tornado.ioloop.IOLoop.current().start()
+        self.route_svc.set_route_limits(route_limits or {})
+        return tornado.web.Application(self.route_svc.get_routes(), debug=self._debug,
+                                       compress_response=True, app_svc=self)
+
+    def request_started(self):
+        """Called by BaseRestHandler when it starts handling a request"""
+        self._in_flight += 1
+
+    def request_finished(self, handler, started=True):
+        """
+        Called by BaseRestHandler when it has finished a request
+
+        :param handler: The handler that handled the request
+        :param started: False if request_started wasn't called for the request
+        """
+        if started:
+            self._in_flight -= 1
+        route = self.route_svc.get_route_pattern(handler.__class__) or "other"
+        request = handler.request
+        self.metrics.request_finished(route, request.method, handler.get_status(), request.request_time())
+
+    def _start_watchdog(self):
+        """Starts watching the IOLoop, in the process that will run it"""
+        self.watchdog = IOLoopWatchdog(self._watchdog_threshold)
+        self.watchdog.start()
+        self.metrics.register_gauge("arteria_ioloop_lag_p50_seconds",
+                                    "The median delay of IOLoop callbacks",
+                                    lambda: self.watchdog.get_lag_percentile(50))
+        self.metrics.register_gauge("arteria_ioloop_lag_p99_seconds",
+                                    "The 99th percentile delay of IOLoop callbacks",
+                                    lambda: self.watchdog.get_lag_percentile(99))
+        self.metrics.register_gauge("arteria_ioloop_stalls_total",
+                                    "The number of times the IOLoop was blocked longer than the threshold",
+                                    self.watchdog.get_stall_count, metric_type="counter")
+
+    def request_rejected(self, handler, reason):
+        """Called by BaseRestHandler when it rejects a request because of a route limit"""
+        route = self.route_svc.get_route_pattern(handler.__class__) or "other"
+        self.metrics.request_rejected(route, reason)
+
+    def is_draining(self):
+        """Returns True if the service is shutting down and waiting for requests to finish"""
+        return self._draining
+
+    def _register_gauges(self):
+        """Adds the service's own metrics to the request metrics"""
+        self.metrics.register_gauge("arteria_http_requests_in_flight",
+                                    "The number of requests being handled",
+                                    lambda: self._in_flight)
+        for name, stat, description in [
+                ("arteria_config_reloads_total", "reloads",
+                 "The number of times config files were reloaded"),
+                ("arteria_config_reload_errors_total", "reload_errors",
+                 "The number of failed config file reloads"),
+                ("arteria_config_reload_latency_seconds_total", "total_reload_latency_seconds",
+                 "The total time from config file changes until they were in use")]:
+            self.metrics.register_gauge(name, description,
+                                        lambda stat=stat: self.config_svc.get_cache_stats()[stat],
+                                        metric_type="counter")
+
+        for pool, stats in ("thread", self.executors.thread_stats), ("process", self.executors.process_stats):
+            self.metrics.register_gauge("arteria_{0}_pool_queue_depth".format(pool),
+                                        "The number of tasks waiting for a {0}".format(pool),
+                                        lambda stats=stats: stats.queued)
+            self.metrics.register_gauge("arteria_{0}_pool_active".format(pool),
+                                        "The number of tasks running in the {0} pool".format(pool),
+                                        lambda stats=stats: stats.active)
+            self.metrics.register_gauge("arteria_{0}_pool_completed_total".format(pool),
+                                        "The number of tasks completed by the {0} pool".format(pool),
+                                        lambda stats=stats: stats.completed, metric_type="counter")
+            self.metrics.register_gauge("arteria_{0}_pool_wait_seconds_total".format(pool),
+                                        "The total time tasks waited for a {0}".format(pool),
+                                        lambda stats=stats: stats.total_wait_seconds, metric_type="counter")
+
+    def _handle_restart_signal(self, signum, frame):
+        # Runs in the supervisor if there are workers, otherwise between IOLoop callbacks
+        handoff.spawn_successor(self._sockets)
+
+    def _handle_shutdown_signal(self, signum, frame):
+        tornado.ioloop.IOLoop.current().add_callback_from_signal(self.shutdown)
+
+    def shutdown(self):
+        """
+        Stops accepting connections and stops the IOLoop when the in-flight requests
+        have finished, or when the drain timeout has passed
+        """
+        if self._draining:
+            return
+        self._draining = True
+        self._logger.info("Shutting down, waiting for {0} in-flight request(s)".format(self._in_flight))
+        self._server.stop()
+        io_loop = tornado.ioloop.IOLoop.current()
+        deadline = time.time() + self._drain_timeout
+
+        def stop_when_drained():
+            if self._in_flight <= 0 or time.time() >= deadline:
+                if self._in_flight > 0:
+                    self._logger.warning("Drain timeout passed, stopping with {0} in-flight request(s)"
+                                         .format(self._in_flight))
+                io_loop.stop()
+                self.executors.shutdown(wait=False)
+            else:
+                io_loop.call_later(0.05, stop_when_drained)
+        stop_when_drained()
+
+    def _start_queue_logging(self, worker_id=None):
+        """
+        Reconfigures logging so that the log records are written from background threads.
+        This is only done in the process that serves the requests, after any fork, since a
+        listener thread running at the time of a fork could hold the lock of its queue, and
+        the worker would deadlock on its first log call.
+
+        A worker writes to log files of its own, since rotating a file shared by several
+        processes would lose log entries.
+        """
+        if worker_id is not None:
+            self._logger_config = copy.deepcopy(self._logger_config)
+            for handler in self._logger_config.get("handlers", {}).values():
+                if "filename" in handler:
+                    handler["filename"] = "{0}.worker{1}".format(handler["filename"], worker_id)
+        self._logging = QueueLogging(self._logger_config)
+        self._logging.configure()
+        if worker_id is not None:
+            self._logger.info("Worker {0} started with pid {1}".format(worker_id, os.getpid()))
 
     def set_log_level(self, log_level):
-        # TODO: Directly change via logging module if possible
-        self._logger_config["handlers"]["file_handler"]["level"] = log_level
-        logging.config.dictConfig(self._logger_config)
+        """
+        Sets the level of the file handler in place
+
+        :raises ValueError if the level isn't valid
+        """
+        self._logging.set_handler_level("file_handler", log_level)
 
     def get_log_level(self):
-        return self._logger_config["handlers"]["file_handler"]["level"]
+        return self._logging.get_handler_level("file_handler")
 
     def _get_default_routes(self):
         """
@@ -127,7 +379,9 @@ class AppService:
         """
         return [
             (r"/api", ApiHelpHandler, dict(route_svc=self.route_svc)),
-            (r"/api/1.0/admin/log_level", LogLevelHandler, dict(app_svc=self))
+            (r"/api/1.0/admin/log_level", LogLevelHandler, dict(app_svc=self)),
+            (r"/api/1.0/admin/metrics", MetricsHandler, dict(app_svc=self)),
+            (r"/api/1.0/admin/profile", ProfileHandler)
         ]
 
 class InvalidPortError(Exception):
@@ -136,3 +390,6 @@ class InvalidPortError(Exception):
 class ProductNameError(Exception):
     pass
 
+class InvalidWorkersError(Exception):
+    pass
+
@@ -0,0 +1,309 @@
+"""
+An asynchronous client for calls between the arteria services, e.g. from runfolder
+to bcl2fastq to siswrap.
+
+Requests share one connection pool, are limited per host so that one slow service
+doesn't take all connections, have timeouts, and are retried with jittered backoff
+when the service is unavailable or asks the client to come back later.
+
+Usage example:
+    client = ArteriaClient()
+    runfolder = RunfolderClient("http://localhost:10800/api/1.0", client)
+    bcl2fastq = Bcl2FastqClient("http://localhost:10900/api/1.0", client)
+
+    @tornado.gen.coroutine
+    def process_next():
+        runfolder_info = yield runfolder.claim_next_runfolder(owner="demux-1")
+        job = yield bcl2fastq.start(os.path.basename(runfolder_info["path"]))
+"""
+import json
+import logging
+import random
+import socket
+
+import tornado.gen
+import tornado.httpclient
+import tornado.locks
+
+try:
+    from urllib.parse import quote, urlparse
+except ImportError:
+    from urllib import quote
+    from urlparse import urlparse
+
+
+def _create_http_client(max_clients):
+    """
+    Creates a client of its own, so that its pool size isn't shared with other users of
+    AsyncHTTPClient. The curl based client keeps connections alive between requests, so
+    it's used if pycurl is installed.
+    """
+    try:
+        from tornado.curl_httpclient import CurlAsyncHTTPClient
+        return CurlAsyncHTTPClient(force_instance=True, max_clients=max_clients)
+    except ImportError:
+        return tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=max_clients)
+
+
+class ArteriaClient:
+    """
+    Sends JSON requests to the arteria services.
+
+    Responses with the status codes in RETRY_CODES, and requests that failed to connect or
+    timed out, are retried. Since a request that timed out may still have been carried out,
+    only idempotent methods are retried then. Requests rejected with 429 or 503 weren't
+    carried out, so they're retried for all methods, no sooner than the Retry-After header asks.
+
+    The client, and the futures it returns, must be used from the IOLoop thread.
+    """
+
+    RETRY_CODES = (429, 502, 503, 504)
+    REJECTED_CODES = (429, 503)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+    def __init__(self, max_clients=20, max_per_host=4, connect_timeout=5, request_timeout=60,
+                 retries=3, backoff=0.5, max_backoff=10, http_client=None, logger=None):
+        """
+        :param max_clients: The maximum number of requests in progress at the same time
+        :param max_per_host: The maximum number of requests in progress to each host
+        :param connect_timeout: Seconds to wait for a connection
+        :param request_timeout: Seconds to wait for the whole request
+        :param retries: The number of times a failed request is retried
+        :param backoff: The base number of seconds to wait before a retry. It's doubled
+                        for each retry, and a random part of it is waited.
+        :param max_backoff: The maximum number of seconds to wait before a retry
+        :param http_client: The AsyncHTTPClient to send requests with, mostly for tests
+        :param logger: The logger instance to use. Will default to one named like the module
+        """
+        self._http_client = http_client or _create_http_client(max_clients)
+        self._max_per_host = max_per_host
+        self._connect_timeout = connect_timeout
+        self._request_timeout = request_timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._logger = logger or logging.getLogger(__name__)
+        self._host_semaphores = {}
+
+    @tornado.gen.coroutine
+    def fetch(self, url, method="GET", obj=None, retries=None):
+        """
+        Sends a request, with obj encoded as JSON in the body if given. Returns the response
+        if the status code is 2xx, otherwise raises ArteriaClientError.
+
+        :param retries: Overrides the number of retries for this request
+        """
+        retries = self._retries if retries is None else retries
+        body = json.dumps(obj) if obj is not None else None
+        if body is None and method in ("POST", "PUT"):
+            body = ""
+
+        attempt = 0
+        while True:
+            response = yield self._fetch_once(url, method, body)
+            if 200 <= response.code < 300:
+                raise tornado.gen.Return(response)
+
+            if attempt >= retries or not self._is_retryable(method, response):
+                raise ArteriaClientError(method, url, response.code, response.body,
+                                         getattr(response, "error", None))
+
+            delay = self._get_retry_delay(attempt, response)
+            self._logger.info("{0} {1} failed with {2}, retrying in {3:.2f} s".format(
+                method, url, response.code, delay))
+            yield tornado.gen.sleep(delay)
+            attempt += 1
+
+    @tornado.gen.coroutine
+    def get_json(self, url, **kwargs):
+        """Sends a GET request and returns the decoded JSON response"""
+        response = yield self.fetch(url, "GET", **kwargs)
+        raise tornado.gen.Return(self._decode(response))
+
+    @tornado.gen.coroutine
+    def post_json(self, url, obj=None, **kwargs):
+        """Sends a POST request with obj as JSON and returns the decoded JSON response, if any"""
+        response = yield self.fetch(url, "POST", obj, **kwargs)
+        raise tornado.gen.Return(self._decode(response))
+
+    @tornado.gen.coroutine
+    def put_json(self, url, obj=None, **kwargs):
+        """Sends a PUT request with obj as JSON and returns the decoded JSON response, if any"""
+        response = yield self.fetch(url, "PUT", obj, **kwargs)
+        raise tornado.gen.Return(self._decode(response))
+
+    def close(self):
+        self._http_client.close()
+
+    @tornado.gen.coroutine
+    def _fetch_once(self, url, method, body):
+        """
+        Sends the request, waiting for a free slot for the host. Failures to connect and
+        timeouts are returned as responses with the status code 599.
+        """
+        request = tornado.httpclient.HTTPRequest(
+            url, method=method, body=body, headers={"Accept": "application/json"},
+            connect_timeout=self._connect_timeout, request_timeout=self._request_timeout)
+        semaphore = self._get_host_semaphore(url)
+        with (yield semaphore.acquire()):
+            try:
+                response = yield self._http_client.fetch(request, raise_error=False)
+            except tornado.httpclient.HTTPError as e:
+                # Newer versions of tornado raise timeouts even if raise_error is False
+                response = tornado.httpclient.HTTPResponse(request, e.code, error=e)
+            except (socket.error, IOError) as e:
+                response = tornado.httpclient.HTTPResponse(request, 599, error=e)
+        raise tornado.gen.Return(response)
+
+    def _get_host_semaphore(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = tornado.locks.Semaphore(self._max_per_host)
+        return self._host_semaphores[host]
+
+    def _is_retryable(self, method, response):
+        if response.code in ArteriaClient.REJECTED_CODES:
+            return True
+        if response.code == 599 or response.code in ArteriaClient.RETRY_CODES:
+            return method in ArteriaClient.IDEMPOTENT_METHODS
+        return False
+
+    def _get_retry_delay(self, attempt, response):
+        """
+        Waits a random part of the exponential backoff, so that clients that failed at
+        the same time don't retry at the same time. Never sooner than Retry-After.
+        """
+        delay = random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response.headers else None
+        if retry_after:
+            try:
+                delay += float(retry_after)
+            except ValueError:
+                pass
+        return delay
+
+    @staticmethod
+    def _decode(response):
+        if not response.body:
+            return None
+        body = response.body
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        return json.loads(body)
+
+
+class _ServiceClient:
+    """Base class for the clients of a particular service"""
+
+    def __init__(self, base_url, client=None):
+        """
+        :param base_url: The URL of the service's API, e.g. http://localhost:10800/api/1.0
+        :param client: The ArteriaClient to send the requests with, so that several services
+                       can share its connections. Defaults to a new one.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.client = client or ArteriaClient()
+
+    def url(self, *parts):
+        return "/".join([self.base_url] + [quote(str(part).strip("/")) for part in parts])
+
+
+class RunfolderClient(_ServiceClient):
+    """Calls the runfolder service"""
+
+    def list_runfolders(self):
+        """
+        Returns a future for the available runfolders, as a dict with the list of
+        runfolders and the health of each monitored directory
+        """
+        return self.client.get_json(self.url("runfolders"))
+
+    def next_runfolder(self):
+        """Returns a future for the next runfolder to process"""
+        return self.client.get_json(self.url("runfolders", "next"))
+
+    def claim_next_runfolder(self, owner="", lease_seconds=None):
+        """
+        Returns a future for the next runfolder to process, claimed for this consumer with
+        a lease, or None if there is none. The lease should be renewed with renew_lease while
+        the runfolder is processed, and the runfolder released with release_runfolder.
+        Claims aren't retried after timeouts, since they may have been carried out.
+        """
+        body = {"owner": owner}
+        if lease_seconds is not None:
+            body["lease_seconds"] = lease_seconds
+        return self.client.post_json(self.url("runfolders", "claim"), body)
+
+    def renew_lease(self, path, lease_id, lease_seconds=None):
+        """Returns a future for the renewed lease. Fails with a 409 if the lease was lost."""
+        body = {"lease_id": lease_id}
+        if lease_seconds is not None:
+            body["lease_seconds"] = lease_seconds
+        return self.client.put_json(self.url("runfolders", "lease", "path", path), body)
+
+    def release_runfolder(self, path, lease_id, state):
+        """Sets the state of a claimed runfolder, e.g. to done, and removes the lease"""
+        return self.client.post_json(self.url("runfolders", "release", "path", path),
+                                     {"lease_id": lease_id, "state": state})
+
+    def get_runfolder(self, path):
+        """Returns a future for information about the runfolder at the absolute path"""
+        return self.client.get_json(self.url("runfolders", "path", path))
+
+    def set_runfolder_state(self, path, state):
+        """Returns a future for the runfolder, after setting its state, e.g. to started"""
+        return self.client.post_json(self.url("runfolders", "path", path), {"state": state})
+
+
+class Bcl2FastqClient(_ServiceClient):
+    """Calls the bcl2fastq service"""
+
+    def versions(self):
+        """Returns a future for the list of available bcl2fastq versions"""
+        return self.client.get_json(self.url("versions"))
+
+    def start(self, runfolder, **params):
+        """
+        Starts bcl2fastq for the runfolder, by name. params can override the defaults, e.g.
+        bcl2fastq_version or barcode_mismatches. Returns a future for the job, with its job_id.
+        """
+        return self.client.post_json(self.url("start", runfolder), params)
+
+    def status(self, job_id=""):
+        """Returns a future for the state of the job, or of all jobs if no job_id is given"""
+        return self.client.get_json(self.url("status", job_id))
+
+    def stop(self, job_id="all"):
+        return self.client.post_json(self.url("stop", job_id))
+
+
+class SiswrapClient(_ServiceClient):
+    """Calls the siswrap service"""
+
+    QC = "qc"
+    REPORT = "report"
+
+    def run(self, wrapper_type, runfolder):
+        """
+        Starts Sisyphus quality control or a quick report for the runfolder. Returns a future
+        for the process info, with its pid.
+
+        :param wrapper_type: QC or REPORT
+        """
+        return self.client.post_json(self.url(wrapper_type, "run", runfolder), {"runfolder": runfolder})
+
+    def status(self, wrapper_type, pid=""):
+        """Returns a future for the status of the process, or of all processes if no pid is given"""
+        return self.client.get_json(self.url(wrapper_type, "status", pid))
+
+
+class ArteriaClientError(Exception):
+    """Raised when a request fails, after any retries"""
+
+    def __init__(self, method, url, code, body=None, error=None):
+        message = "{0} {1} failed with {2}".format(method, url, code)
+        if error is not None and code == 599:
+            message += ": {0}".format(error)
+        super(ArteriaClientError, self).__init__(message)
+        self.code = code
+        self.body = body
@@ -0,0 +1,138 @@
+"""
+Executors for running blocking code, e.g. file system access, off the IOLoop thread.
+
+Usage example:
+    executors = ExecutorService(threads=10)
+
+    @tornado.gen.coroutine
+    def get(self):
+        runfolder = yield executors.run_in_thread(self.svc.get_runfolder_by_path, path)
+"""
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorStats(object):
+    """Counters for the tasks submitted to an executor. Updated from several threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+
+    def submitted(self):
+        with self._lock:
+            self.queued += 1
+
+    def started(self, wait_seconds):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait_seconds += wait_seconds
+
+    def finished(self):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"queued": self.queued, "active": self.active, "completed": self.completed,
+                    "total_wait_seconds": self.total_wait_seconds}
+
+
+class ExecutorService:
+    """
+    Owns a thread pool for blocking I/O and a process pool for CPU bound work,
+    and keeps track of how busy they are.
+
+    The process pool is created the first time it's used, so that it's created in the
+    process that uses it when the service forks worker processes.
+    """
+
+    def __init__(self, threads=10, processes=None, logger=None):
+        """
+        :param threads: The number of threads in the thread pool
+        :param processes: The number of processes in the process pool. Defaults to the
+                          number of CPUs.
+        :param logger: The logger instance to use. Will default to one named like the module
+        """
+        self._logger = logger or logging.getLogger(__name__)
+        self._threads = threads
+        self._processes = processes or multiprocessing.cpu_count()
+        self._thread_pool = ThreadPoolExecutor(threads)
+        self._process_pool = None
+        self._process_pool_lock = threading.Lock()
+        self.thread_stats = ExecutorStats()
+        self.process_stats = ExecutorStats()
+
+    @property
+    def thread_pool(self):
+        """The thread pool, e.g. for use with tornado.concurrent.run_on_executor"""
+        return self._thread_pool
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """
+        Calls fn in the thread pool. Returns a future that can be yielded from a coroutine.
+        """
+        stats = self.thread_stats
+        submitted_at = time.time()
+
+        def run():
+            stats.started(time.time() - submitted_at)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stats.finished()
+
+        stats.submitted()
+        return self._thread_pool.submit(run)
+
+    def run_in_process(self, fn, *args, **kwargs):
+        """
+        Calls fn in the process pool. fn, args and the result must be picklable.
+        Returns a future that can be yielded from a coroutine.
+
+        Tasks are counted as active from submission, since it's not known when
+        another process starts them.
+        """
+        stats = self.process_stats
+        stats.submitted()
+        stats.started(0.0)
+        future = self._get_process_pool().submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: stats.finished())
+        return future
+
+    def shutdown(self, wait=True):
+        self._thread_pool.shutdown(wait)
+        if self._process_pool:
+            self._process_pool.shutdown(wait)
+
+    def _get_process_pool(self):
+        if self._process_pool is None:
+            with self._process_pool_lock:
+                if self._process_pool is None:
+                    # Imported here, since it imports multiprocessing which slows down startup
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._logger.info("Starting a process pool with {0} processes".format(self._processes))
+                    self._process_pool = ProcessPoolExecutor(self._processes)
+        return self._process_pool
+
+
+_default_executors = None
+_default_executors_lock = threading.Lock()
+
+
+def get_default_executors():
+    """Returns an ExecutorService for handlers in applications that don't run on AppService"""
+    global _default_executors
+    if _default_executors is None:
+        with _default_executors_lock:
+            if _default_executors is None:
+                _default_executors = ExecutorService()
+    return _default_executors
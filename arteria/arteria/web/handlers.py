@@ -1,5 +1,12 @@
+import hashlib
+import itertools
+import tornado.gen
 import tornado.web
-import jsonpickle
+from arteria.decorators import undocumented
+from arteria.schema import Schema, Field, SchemaError, string_types
+from arteria.web.executors import get_default_executors
+from arteria.web.metrics import CONTENT_TYPE
+from arteria.web.serializers import encode_json, decode_json
 
 class BaseRestHandler(tornado.web.RequestHandler):
     """
@@ -7,24 +14,172 @@ class BaseRestHandler(tornado.web.RequestHandler):
     writing and reading JSON request/responses
     """
 
+    # The arteria.schema.Schema that body_as_object validates request bodies against, if any.
+    # Declared once per handler class, e.g. request_schema = Schema(Field("state", str, required=True))
+    request_schema = None
+
     def data_received(self, chunk):
         pass
 
+    def prepare(self):
+        self._app_svc = self.settings.get("app_svc")
+        if self._app_svc:
+            self._app_svc.request_started()
+            if self._app_svc.is_draining():
+                # Make sure clients don't reuse the connection to a process that's shutting down
+                self.set_header("Connection", "close")
+            self._admit()
+
+    def _admit(self):
+        """Rejects the request right away if the route is over its admission limits"""
+        route_limit = self._app_svc.route_svc.get_route_limit(self.__class__, self.request.path)
+        if route_limit is None:
+            return
+        rejection = route_limit.try_acquire()
+        if rejection is None:
+            self._route_limit = route_limit
+            return
+
+        status, reason, retry_after = rejection
+        self._app_svc.request_rejected(self, reason)
+        self.set_status(status)
+        self.set_header("Retry-After", str(retry_after))
+        self.write_object({"reason": reason, "retry_after": retry_after})
+        self.finish()
+
+    def on_finish(self):
+        route_limit = getattr(self, "_route_limit", None)
+        if route_limit:
+            route_limit.release()
+        app_svc = self.settings.get("app_svc")
+        if app_svc:
+            # prepare isn't called if the request fails before it, e.g. on unsupported methods
+            app_svc.request_finished(self, started=hasattr(self, "_app_svc"))
+
+    @property
+    def executors(self):
+        """The ExecutorService of the application"""
+        app_svc = self.settings.get("app_svc")
+        return app_svc.executors if app_svc else get_default_executors()
+
+    @property
+    def executor(self):
+        """The thread pool, which makes tornado.concurrent.run_on_executor work on handler methods"""
+        return self.executors.thread_pool
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """
+        Calls blocking code, e.g. file system access, in the thread pool so that it doesn't
+        block other requests. Returns a future, to be yielded from a coroutine:
+
+            @tornado.gen.coroutine
+            def get(self, path):
+                runfolder_info = yield self.run_in_thread(self.runfolder_svc.get_runfolder_by_path, path)
+        """
+        return self.executors.run_in_thread(fn, *args, **kwargs)
+
+    def run_in_process(self, fn, *args, **kwargs):
+        """
+        Calls CPU bound code in the process pool. fn, args and the result must be picklable.
+        Returns a future, to be yielded from a coroutine.
+        """
+        return self.executors.run_in_process(fn, *args, **kwargs)
+
     def write_object(self, obj):
-        resp = jsonpickle.encode(obj, unpicklable=False)
+        resp = encode_json(obj)
         self.write_json(resp)
 
     def write_json(self, json):
         self.set_header("Content-Type", "application/json")
         self.write(json)
 
-    def body_as_object(self, required_members=[]):
-        """Returns the JSON encoded body as a Python object"""
-        obj = jsonpickle.decode(self.request.body)
-        for member in required_members:
-            if member not in obj:
-                raise tornado.web.HTTPError("400", "Expecting '{0}' in the JSON body".format(member))
-        return obj
+    def check_etag_version(self, version):
+        """
+        Sets an ETag based on a version of the resource supplied by a service, e.g. a counter
+        that changes whenever the resource does. Returns True if the client already has this
+        version, in which case a 304 has been sent and the handler should return without
+        writing anything:
+
+            def get(self):
+                if self.check_etag_version(self.svc.version()):
+                    return
+                self.write_object(self.svc.expensive_listing())
+
+        This saves the serialization as well as the bandwidth. Without a version, GET
+        responses still get an ETag based on a hash of the body, unless they are streamed.
+        """
+        # Links in the response depend on the protocol and host the request came through
+        key = "{0}|{1}|{2}|{3}".format(version, self.request.protocol, self.request.host, self.request.uri)
+        self.set_header("Etag", '"{0}"'.format(hashlib.sha1(key.encode("utf-8")).hexdigest()))
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return True
+        return False
+
+    @tornado.gen.coroutine
+    def write_stream(self, iterable, flush_every=100, in_thread=False):
+        """
+        Writes the items of iterable as a JSON array, flushing every flush_every items.
+
+        Items are encoded and sent as they are produced, so a generator is never
+        materialized in memory. Once the first batch has been flushed, the rest of the
+        response is sent with chunked transfer encoding. If in_thread is True, the items
+        are produced in the thread pool, a batch at a time, which is useful for generators
+        doing blocking work. Must be yielded from a coroutine:
+
+            @tornado.gen.coroutine
+            def get(self):
+                yield self.write_stream(self.svc.generate_items())
+
+        If iterable raises before the first flush, the usual error response is sent. If it
+        raises after, the status 200 and part of the array have already been sent, so the
+        connection is closed without ending the response, and clients see a failed request
+        rather than a short list. The exception is re-raised in both cases.
+        """
+        self.set_header("Content-Type", "application/json")
+        self.write("[")
+        iterator = iter(iterable)
+        separator = ""
+        flushed = False
+        try:
+            while True:
+                if in_thread:
+                    batch = yield self.run_in_thread(lambda: list(itertools.islice(iterator, flush_every)))
+                else:
+                    batch = list(itertools.islice(iterator, flush_every))
+                if not batch:
+                    break
+                # Encode the batch in one go, and strip the brackets from the encoded list
+                self.write(separator)
+                self.write(encode_json(batch)[1:-1])
+                separator = ","
+                if len(batch) < flush_every:
+                    break
+                flushed = True
+                yield self.flush()
+        except Exception:
+            if flushed:
+                self.request.connection.close()
+            raise
+        self.write("]")
+
+    def body_as_object(self, required_members=[], schema=None):
+        """
+        Returns the JSON encoded body as a Python object. If a schema is given, or the handler
+        has a request_schema, the body is validated against it and a dict with the validated
+        values is returned. An empty body is read as an empty object.
+
+        :raises RequestValidationError, a 400, if the body isn't valid
+        """
+        return decode_body(self.request.body, schema or self.request_schema, required_members)
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None, None))[1]
+        if isinstance(error, RequestValidationError):
+            self.write_object(error.to_dict())
+        else:
+            super(BaseRestHandler, self).write_error(status_code, **kwargs)
 
     def api_link(self, version="1.0"):
         return "%s://%s/api/%s" % (self.request.protocol, self.request.host, version)
@@ -33,6 +188,9 @@ class LogLevelHandler(BaseRestHandler):
     """
     Handles getting/setting the log_level of the running application
     """
+    request_schema = Schema(Field("log_level", string_types, required=True, max_length=20),
+                            name="LogLevelRequest")
+
     def initialize(self, app_svc):
         self.app_svc = app_svc
 
@@ -47,11 +205,79 @@ class LogLevelHandler(BaseRestHandler):
         """
         Set the current log_level of the running server. Call with e.g. {'log_level': 'DEBUG'}
         """
-        json_body = self.body_as_object(["log_level"])
+        json_body = self.body_as_object()
         log_level = json_body["log_level"]
-        self.app_svc.set_log_level(log_level)
+        try:
+            self.app_svc.set_log_level(log_level)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Invalid log_level '{0}'".format(log_level))
         self.write_object({"log_level": log_level})
 
+class MetricsHandler(BaseRestHandler):
+    """
+    Serves request counts, latencies and other metrics of the running application
+    in the Prometheus text format
+    """
+    def initialize(self, app_svc):
+        self.app_svc = app_svc
+
+    def get(self):
+        """
+        Get the metrics of the running server, in the Prometheus text format
+        """
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.write(self.app_svc.metrics.render())
+
+class ProfileHandler(BaseRestHandler):
+    """
+    Profiles the running application, while it keeps serving requests
+    """
+    MAX_SECONDS = 300
+
+    # Only one profile can run at a time in a process
+    _running = False
+
+    @undocumented
+    @tornado.gen.coroutine
+    def get(self):
+        """
+        Profile the running server for ?seconds=N (default 10). With mode=sample (default), returns
+        the sampled stacks of all threads in the collapsed format used for flame graphs. With
+        mode=cprofile, returns cProfile stats for the IOLoop thread, as text or in the binary
+        pstats format with format=raw.
+        """
+        try:
+            seconds = float(self.get_argument("seconds", "10"))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "seconds must be a number")
+        if not 0 < seconds <= ProfileHandler.MAX_SECONDS:
+            raise tornado.web.HTTPError(400, "seconds must be between 0 and {0}".format(
+                ProfileHandler.MAX_SECONDS))
+        mode = self.get_argument("mode", "sample")
+        if mode not in ("sample", "cprofile"):
+            raise tornado.web.HTTPError(400, "mode must be sample or cprofile")
+        raw = self.get_argument("format", "text") == "raw"
+
+        if ProfileHandler._running:
+            raise tornado.web.HTTPError(409, "A profile is already running")
+        ProfileHandler._running = True
+        try:
+            # Imported here, since the profilers are rarely used and slow down startup
+            from arteria.web import profiling
+            if mode == "sample":
+                result = yield profiling.sample(seconds)
+            else:
+                result = yield profiling.profile(seconds, raw=raw)
+        finally:
+            ProfileHandler._running = False
+
+        if raw and mode == "cprofile":
+            self.set_header("Content-Type", "application/octet-stream")
+            self.set_header("Content-Disposition", "attachment; filename=profile.pstats")
+        else:
+            self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.write(result)
+
 class ApiHelpHandler(BaseRestHandler):
     """
     Handles requests for the api help, available at the root of the application
@@ -61,6 +287,49 @@ class ApiHelpHandler(BaseRestHandler):
 
     def get(self):
         """Returns the help for the API"""
+        if self.check_etag_version(self.route_svc.get_help_version()):
+            return
         base_url = "{0}://{1}".format(self.request.protocol, self.request.host)
-        help_doc = self.route_svc.get_help(base_url)
-        self.write_object(help_doc)
+        self.write_json(self.route_svc.get_help_json(base_url))
+
+
+def decode_body(body, schema=None, required_members=()):
+    """
+    Decodes a JSON request body, and validates it against the schema if one is given.
+    Handlers that don't inherit from BaseRestHandler can use this directly.
+
+    :raises RequestValidationError if the body isn't valid JSON or doesn't match the schema
+    """
+    try:
+        obj = decode_json(body) if body else {}
+    except ValueError as e:
+        raise RequestValidationError([{"field": None, "message": "Invalid JSON: {0}".format(e)}])
+
+    if schema is not None:
+        try:
+            obj = schema.validate(obj)
+        except SchemaError as e:
+            raise RequestValidationError(e.errors)
+    if required_members:
+        if not isinstance(obj, dict):
+            raise RequestValidationError([{"field": None, "message": "Expected a JSON object"}])
+        missing = [member for member in required_members if member not in obj]
+        if missing:
+            raise RequestValidationError([{"field": member, "message": "Required field is missing"}
+                                          for member in missing])
+    return obj
+
+
+class RequestValidationError(tornado.web.HTTPError):
+    """
+    A 400 for a request body that isn't valid. errors is a list of dicts with field and message,
+    which is written as the JSON response.
+    """
+
+    def __init__(self, errors):
+        super(RequestValidationError, self).__init__(400, "; ".join(
+            "{0}: {1}".format(error["field"], error["message"]) for error in errors))
+        self.errors = errors
+
+    def to_dict(self):
+        return {"status": 400, "reason": "Invalid request body", "errors": self.errors}
@@ -0,0 +1,111 @@
+"""
+Handing over listening sockets to a new process, so that a service can be restarted
+without refusing connections.
+
+Sockets are passed the way systemd passes them: as file descriptors starting at 3,
+with their number in LISTEN_FDS and the pid they are intended for in LISTEN_PID.
+This means a service can also be started with sockets from systemd socket activation.
+"""
+import fcntl
+import logging
+import os
+import signal
+import socket
+import sys
+
+LISTEN_FDS_START = 3
+
+# The environment variable that tells a new process which process it is replacing
+PREDECESSOR_PID_VAR = "ARTERIA_PREDECESSOR_PID"
+
+logger = logging.getLogger(__name__)
+
+
+def inherited_sockets():
+    """
+    Returns the listening sockets passed to this process, or None if no sockets were passed.
+
+    The environment variables are removed, so that they are not passed on to child processes.
+    """
+    listen_pid = os.environ.pop("LISTEN_PID", None)
+    listen_fds = os.environ.pop("LISTEN_FDS", None)
+    if listen_pid != str(os.getpid()) or not listen_fds:
+        return None
+
+    sockets = []
+    for fd in range(LISTEN_FDS_START, LISTEN_FDS_START + int(listen_fds)):
+        sock = _socket_from_fd(fd)
+        sock.setblocking(False)
+        _set_close_exec(sock.fileno(), True)
+        sockets.append(sock)
+    logger.info("Inherited {0} listening socket(s)".format(len(sockets)))
+    return sockets
+
+
+def spawn_successor(sockets):
+    """
+    Starts a new instance of this process, with the same command line, passing it
+    the listening sockets. Returns the pid of the new process.
+
+    The new process is expected to call notify_predecessor when it's ready to take over.
+    """
+    predecessor_pid = os.getpid()
+    pid = os.fork()
+    if pid != 0:
+        logger.info("Started successor process {0}".format(pid))
+        return pid
+
+    try:
+        # Move the sockets out of the way first, so that no socket is overwritten
+        # before it has been moved to its place
+        fds = [os.dup(sock.fileno()) for sock in sockets]
+        for index, fd in enumerate(fds):
+            target = LISTEN_FDS_START + index
+            os.dup2(fd, target)
+            _set_close_exec(target, False)
+
+        # Detach from the session, so that the successor survives its predecessor's terminal
+        os.setsid()
+
+        env = dict(os.environ)
+        env["LISTEN_FDS"] = str(len(sockets))
+        env["LISTEN_PID"] = str(os.getpid())
+        env[PREDECESSOR_PID_VAR] = str(predecessor_pid)
+        os.execve(sys.executable, [sys.executable] + sys.argv, env)
+    except Exception:
+        logger.exception("Not able to start the successor process")
+    finally:
+        os._exit(1)
+
+
+def notify_predecessor():
+    """
+    Asks the process this process is replacing, if any, to shut down gracefully
+    by sending it SIGTERM
+    """
+    predecessor_pid = os.environ.pop(PREDECESSOR_PID_VAR, None)
+    if predecessor_pid:
+        logger.info("Taking over from process {0}, asking it to shut down".format(predecessor_pid))
+        try:
+            os.kill(int(predecessor_pid), signal.SIGTERM)
+        except OSError as e:
+            logger.warning("Not able to notify process {0}: {1}".format(predecessor_pid, e))
+
+
+def _socket_from_fd(fd):
+    try:
+        # Python 3.7+ detects the family and type of the socket
+        return socket.socket(fileno=fd)
+    except TypeError:
+        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        os.close(fd)
+        return sock
+
+
+def _set_close_exec(fd, close_exec):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    if close_exec:
+        flags |= fcntl.FD_CLOEXEC
+    else:
+        flags &= ~fcntl.FD_CLOEXEC
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags)
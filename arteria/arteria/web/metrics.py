@@ -0,0 +1,123 @@
+"""
+Request instrumentation for arteria services, exposed in the Prometheus text format.
+
+Requests are counted by route pattern, method and status, and their latencies are
+recorded in histograms with fixed buckets. Other values, e.g. the number of in-flight
+requests, are added as gauges read when the metrics are rendered.
+
+Metrics are kept per process. If a service runs with several workers, each worker
+reports its own metrics.
+
+Usage example:
+    metrics = RequestMetrics()
+    metrics.register_gauge("arteria_http_requests_in_flight",
+                           "The number of requests being handled", lambda: in_flight)
+
+    # When a request has finished:
+    metrics.request_finished(r"/api/1.0/runfolders", "GET", 200, 0.004)
+
+    # The text served at /api/1.0/admin/metrics:
+    metrics.render()
+"""
+import bisect
+
+# Request latencies in seconds, from a cached lookup to a slow scan of a file system
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Histogram(object):
+    """Counts of observations per bucket, not cumulative, with one extra bucket for +Inf"""
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, num_buckets):
+        self.counts = [0] * (num_buckets + 1)
+        self.sum = 0.0
+
+
+class RequestMetrics:
+    """
+    Request counters and latency histograms, keyed by route pattern and method.
+
+    Updates aren't synchronized. They are expected to be made from the IOLoop thread,
+    like everything else in the request handlers.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="arteria"):
+        """
+        :param buckets: The upper bounds, in seconds, of the latency histogram buckets
+        :param prefix: The prefix of the metric names
+        """
+        self._buckets = tuple(sorted(buckets))
+        self._prefix = prefix
+        self._requests = {}
+        self._histograms = {}
+        self._rejections = {}
+        self._gauges = []
+
+    def request_finished(self, route, method, status, seconds):
+        """Records a finished request. Takes a couple of microseconds."""
+        key = (route, method, status)
+        self._requests[key] = self._requests.get(key, 0) + 1
+
+        histogram = self._histograms.get((route, method))
+        if histogram is None:
+            histogram = self._histograms[(route, method)] = _Histogram(len(self._buckets))
+        histogram.counts[bisect.bisect_left(self._buckets, seconds)] += 1
+        histogram.sum += seconds
+
+    def request_rejected(self, route, reason):
+        """Records a request rejected by admission control, e.g. because of a rate limit"""
+        key = (route, reason)
+        self._rejections[key] = self._rejections.get(key, 0) + 1
+
+    def register_gauge(self, name, description, get_value, metric_type="gauge"):
+        """
+        Adds a value that is read each time the metrics are rendered
+
+        :param name: The metric name, e.g. arteria_http_requests_in_flight
+        :param description: The help text of the metric
+        :param get_value: A function returning the current value
+        :param metric_type: The Prometheus metric type, "gauge" or "counter"
+        """
+        self._gauges.append((name, description, get_value, metric_type))
+
+    def render(self):
+        """Returns the metrics in the Prometheus text format"""
+        lines = []
+        name = "{0}_http_requests_total".format(self._prefix)
+        lines.append("# HELP {0} The number of finished requests".format(name))
+        lines.append("# TYPE {0} counter".format(name))
+        for (route, method, status), count in sorted(self._requests.items()):
+            lines.append('{0}{{route="{1}",method="{2}",status="{3}"}} {4}'.format(
+                name, _escape(route), method, status, count))
+
+        name = "{0}_http_request_duration_seconds".format(self._prefix)
+        lines.append("# HELP {0} The time taken to handle requests".format(name))
+        lines.append("# TYPE {0} histogram".format(name))
+        bounds = [repr(float(bound)) for bound in self._buckets] + ["+Inf"]
+        for (route, method), histogram in sorted(self._histograms.items()):
+            labels = 'route="{0}",method="{1}"'.format(_escape(route), method)
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, cumulative))
+            lines.append("{0}_sum{{{1}}} {2!r}".format(name, labels, histogram.sum))
+            lines.append("{0}_count{{{1}}} {2}".format(name, labels, cumulative))
+
+        name = "{0}_http_requests_rejected_total".format(self._prefix)
+        lines.append("# HELP {0} The number of requests rejected by admission control".format(name))
+        lines.append("# TYPE {0} counter".format(name))
+        for (route, reason), count in sorted(self._rejections.items()):
+            lines.append('{0}{{route="{1}",reason="{2}"}} {3}'.format(name, _escape(route), reason, count))
+
+        for name, description, get_value, metric_type in self._gauges:
+            lines.append("# HELP {0} {1}".format(name, description))
+            lines.append("# TYPE {0} {1}".format(name, metric_type))
+            lines.append("{0} {1}".format(name, get_value()))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(label_value):
+    return label_value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
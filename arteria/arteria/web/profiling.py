@@ -0,0 +1,114 @@
+"""
+Profiling of a running service, without stopping it.
+
+Two kinds of profiles are supported:
+    - Sampling: a background thread samples the stacks of all threads at a fixed interval.
+      The result is in the collapsed stack format, one line per unique stack with the number
+      of samples, which can be turned into a flame graph, e.g. with flamegraph.pl.
+    - cProfile: the deterministic profiler is enabled on the IOLoop thread. This is more
+      exact, but slows down the service while it's running.
+"""
+import cProfile
+import marshal
+import pstats
+import sys
+import threading
+import tornado.gen
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class StackSampler:
+    """
+    Samples the stacks of all threads in the process from a background thread
+
+    Usage example:
+        sampler = StackSampler()
+        sampler.start()
+        yield tornado.gen.sleep(30)
+        collapsed = sampler.stop()
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        :param interval: The number of seconds between samples
+        """
+        self._interval = interval
+        self._stacks = {}
+        self._samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="arteria-stack-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and returns the collapsed stacks, one "frame;frame;... count" per line"""
+        self._stop_event.set()
+        self._thread.join()
+        return "".join("{0} {1}\n".format(stack, count)
+                       for stack, count in sorted(self._stacks.items()))
+
+    def get_sample_count(self):
+        return self._samples
+
+    def _run(self):
+        own_ident = threading.current_thread().ident
+        while not self._stop_event.wait(self._interval):
+            thread_names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = StackSampler._collapse(thread_names.get(ident, str(ident)), frame)
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            self._samples += 1
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        """Returns the stack as a single string, with the outermost frame first"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append("{0} ({1}:{2})".format(code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+
+@tornado.gen.coroutine
+def sample(seconds, interval=0.005):
+    """Samples all threads for the number of seconds, returns the collapsed stacks"""
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        yield tornado.gen.sleep(seconds)
+    finally:
+        collapsed = sampler.stop()
+    raise tornado.gen.Return(collapsed)
+
+
+@tornado.gen.coroutine
+def profile(seconds, raw=False, sort="cumulative"):
+    """
+    Runs cProfile on the IOLoop thread for the number of seconds. Returns the stats as text,
+    sorted by sort, or in the binary format written by cProfile.Profile.dump_stats if raw.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield tornado.gen.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    if raw:
+        profiler.create_stats()
+        raise tornado.gen.Return(marshal.dumps(profiler.stats))
+    output = StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(sort).print_stats()
+    raise tornado.gen.Return(output.getvalue())
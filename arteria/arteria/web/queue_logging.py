@@ -0,0 +1,127 @@
+import atexit
+import logging
+import logging.config
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    from logutils.queue import QueueHandler, QueueListener
+
+_formatter = logging.Formatter()
+
+
+class _QueueHandler(QueueHandler):
+    """A QueueHandler that prepares records for the queue in place, rather than copying them"""
+
+    def prepare(self, record):
+        # Merge the arguments and format any exception now, since the arguments
+        # may be changed, and the exception gone, when the record is written
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _LevelRespectingQueueListener(QueueListener):
+    """A QueueListener that only passes records on to handlers whose level they reach"""
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class QueueLogging:
+    """
+    Configures logging from a dictConfig style config, with the configured handlers
+    writing the log records from a background thread.
+
+    The handlers of each configured logger are replaced by a QueueHandler, which only
+    puts the records on a queue. A QueueListener thread passes them on to the original
+    handlers. This keeps file I/O off the threads that log, e.g. the IOLoop thread.
+
+    Usage example:
+        queue_logging = QueueLogging(config_svc.get_logger_config())
+        queue_logging.configure()
+
+        # Change the level of a configured handler without rebuilding the handlers:
+        queue_logging.set_handler_level("file_handler", "DEBUG")
+    """
+
+    def __init__(self, logger_config):
+        """
+        :param logger_config: A logging config, see logging.config.dictConfig
+        """
+        self._logger_config = logger_config
+        self._handlers = {}
+        self._queue_handlers = []
+        self._listeners = []
+
+    def configure(self, queued=True):
+        """
+        Configures logging and starts the listener threads.
+
+        :param queued: If False, the configured handlers write the records directly, and no
+                       threads are started, e.g. in a process that is about to fork, since
+                       the threads wouldn't be forked along with their queues
+        """
+        logging.config.dictConfig(self._logger_config)
+
+        logger_names = [None] + list(self._logger_config.get("loggers", {}).keys())
+        for logger_name in logger_names:
+            logger = logging.getLogger(logger_name)
+            handlers = list(logger.handlers)
+            for handler in handlers:
+                self._handlers[handler.name] = handler
+            if not handlers or not queued:
+                continue
+            for handler in handlers:
+                logger.removeHandler(handler)
+
+            record_queue = queue.Queue(-1)
+            queue_handler = _QueueHandler(record_queue)
+            logger.addHandler(queue_handler)
+            listener = _LevelRespectingQueueListener(record_queue, *handlers)
+            listener.start()
+            self._queue_handlers.append((queue_handler, handlers))
+            self._listeners.append(listener)
+
+        self._update_queue_handler_levels()
+        if queued:
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Writes the queued log records and stops the listener threads"""
+        listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            listener.stop()
+
+    def get_handler_level(self, handler_name):
+        """Returns the name of the level of the configured handler"""
+        return logging.getLevelName(self._handlers[handler_name].level)
+
+    def set_handler_level(self, handler_name, level):
+        """
+        Sets the level of the configured handler, e.g. to "DEBUG"
+
+        :raises ValueError if the level isn't valid
+        """
+        self._handlers[handler_name].setLevel(level)
+        self._update_queue_handler_levels()
+
+    def _update_queue_handler_levels(self):
+        """
+        Lets the queue handlers drop records that none of their handlers would write,
+        so that they aren't queued at all
+        """
+        for queue_handler, handlers in self._queue_handlers:
+            queue_handler.setLevel(min(handler.level for handler in handlers))
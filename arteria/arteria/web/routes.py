@@ -1,6 +1,10 @@
+import hashlib
+import json
 import threading
 import re
 import itertools
+from collections import OrderedDict
+from arteria.web.serializers import encode_json, register_serializer
 
 
 class RouteInfo:
@@ -13,10 +17,18 @@ class RouteInfo:
     def __repr__(self):
         return "[{0} method={1}: {2}]".format(self.route, self.method, self.description)
 
+    def to_dict(self):
+        return {"route": self.route, "method": self.method, "description": self.description}
+
+register_serializer(RouteInfo)
+
 
 class RouteService:
     """Encapsulates Tornado routes and generates help from their class definitions"""
 
+    # The number of base URLs (protocol and host combinations) the encoded help is cached for
+    HELP_CACHE_SIZE = 16
+
     def __init__(self, app_svc, debug):
         """
         Initialize the route service. Routes need to be set via set_routes.
@@ -26,22 +38,109 @@ class RouteService:
         """
         self._app_svc = app_svc
         self._debug = debug
-        self._help_generated_lock = threading.Lock()
-        self._help_generated = False
+        self._help_cache_lock = threading.Lock()
+        self._help_cache = OrderedDict()
 
         # NOTE: The routes are not set in the constructor because a reference
         # to the route service is needed in the api help route handler
         self._routes = None
+        self._route_patterns = {}
+        self._route_limits = {}
+        self._route_docs = None
+        self._route_docs_version = None
 
     def set_routes(self, routes):
         self._routes = routes
+        self._route_patterns = {}
+        for route in routes:
+            pattern, cls = route[0], route[1]
+            if cls in self._route_patterns:
+                # The same handler serves several routes, which can't be told apart
+                pattern = "{0}|{1}".format(self._route_patterns[cls], pattern)
+            self._route_patterns[cls] = pattern
+
+        # The docs only depend on the routes, so they're generated once, without a base URL
+        self._route_docs = self._get_route_infos_grouped(routes, "")
+        self._route_docs_version = hashlib.sha1(
+            json.dumps(self._route_docs, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._help_cache_lock:
+            self._help_cache.clear()
 
     def get_routes(self):
         return self._routes
 
+    def set_route_limits(self, route_limits):
+        """
+        Sets the admission limits of routes. A limit only applies to its own pattern, also
+        when the handler class serves other patterns too.
+
+        :param route_limits: A dict from route patterns, as passed to set_routes,
+                             to arteria.web.admission.RouteLimit instances
+        :raises UnknownRouteError if a pattern isn't routed
+        """
+        routed = set(route[0] for route in self._routes or [])
+        for pattern in route_limits:
+            if pattern not in routed:
+                raise UnknownRouteError("Can't limit '{0}', it's not routed".format(pattern))
+        limited_classes = set(route[1] for route in self._routes or [] if route[0] in route_limits)
+
+        # Handler class -> the (compiled pattern, RouteLimit or None) of each of its routes,
+        # in the order tornado matches them
+        limits = {}
+        for route in self._routes or []:
+            pattern, cls = route[0], route[1]
+            if cls in limited_classes:
+                regex = re.compile(pattern if pattern.endswith("$") else pattern + "$")
+                limits.setdefault(cls, []).append((regex, route_limits.get(pattern)))
+        self._route_limits = limits
+
+    def get_route_limit(self, handler_class, path):
+        """Returns the RouteLimit of the route that the request path was routed to, or None"""
+        routes = self._route_limits.get(handler_class)
+        if not routes:
+            return None
+        if len(routes) == 1:
+            return routes[0][1]
+        # The first of the class's patterns that matches is the one tornado routed to,
+        # since a match of another class's pattern wouldn't have reached this class
+        for regex, route_limit in routes:
+            if regex.match(path):
+                return route_limit
+        return None
+
+    def get_route_pattern(self, handler_class):
+        """Returns the route pattern the handler class is routed to, or None if it isn't routed"""
+        return self._route_patterns.get(handler_class)
+
     def get_help(self, base_url):
         """Returns the API help based on the routes"""
-        return self._generate_help(False, base_url)
+        if self._route_docs is None:
+            raise RoutesNotSetError("Routes must be set before help can be generated")
+        return [{"route": base_url + entry["route"], "methods": dict(entry["methods"])}
+                for entry in self._route_docs]
+
+    def get_help_version(self):
+        """
+        Returns a hash of the API help, which is the same in every worker, and only changes
+        when the documented routes do
+        """
+        if self._route_docs_version is None:
+            raise RoutesNotSetError("Routes must be set before help can be generated")
+        return self._route_docs_version
+
+    def get_help_json(self, base_url):
+        """
+        Returns the API help based on the routes, encoded as JSON. The encoded help is
+        cached for the most recently used base URLs.
+        """
+        with self._help_cache_lock:
+            encoded = self._help_cache.pop(base_url, None)
+            if encoded is None:
+                encoded = encode_json(self.get_help(base_url))
+                if len(self._help_cache) >= RouteService.HELP_CACHE_SIZE:
+                    self._help_cache.popitem(last=False)
+            self._help_cache[base_url] = encoded
+            return encoded
 
     def _get_route_infos(self, tornado_routes, base_url):
         """
@@ -68,8 +167,8 @@ class RouteService:
         Ignores the documentation if it has the undocumented attribute
         and is not running in debug mode
         """
-        attr = getattr(cls, attr_name)
-        doc = attr.__doc__
+        attr = getattr(cls, attr_name, None)
+        doc = getattr(attr, "__doc__", None)
         is_undocumented = hasattr(attr, "undocumented")
 
         # Return the documentation if available. Skip it if it should be
@@ -106,14 +205,8 @@ class RouteService:
         routes = sorted(routes, key=lambda item: item["route"])
         return routes
 
-    def _generate_help(self, regenerate, base_url):
-        """Generates help from self._routes"""
-        if not self._help_generated or regenerate:
-            with self._help_generated_lock:
-                if not self._help_generated:
-                    self._route_infos = self._get_route_infos_grouped(self._routes, base_url)
-                    self._help_generated = True
-        return self._route_infos
-
 class RoutesNotSetError(Exception):
     pass
+
+class UnknownRouteError(Exception):
+    pass
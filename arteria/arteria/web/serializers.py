@@ -0,0 +1,75 @@
+"""
+JSON encoding of the objects written by REST handlers.
+
+Domain types register a function returning a cheap, JSON serializable representation
+of their instances. These are encoded with the fastest JSON backend available (orjson
+if installed, otherwise the standard library's json). Objects of other types fall back
+to jsonpickle, which inspects them reflectively. jsonpickle is only imported if needed.
+
+Usage example:
+    class RunfolderInfo:
+        ...
+        def to_dict(self):
+            return {"host": self.host, "path": self.path, "state": self.state}
+
+    register_serializer(RunfolderInfo)
+
+    encode_json([RunfolderInfo(...), RunfolderInfo(...)])
+
+Request bodies are decoded with decode_json, which never creates instances of other
+types than those of plain JSON, unlike jsonpickle.decode.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_serializers = {}
+
+
+def register_serializer(cls, to_dict=None):
+    """
+    Registers a function that returns a JSON serializable representation of instances of cls.
+    Defaults to cls.to_dict. Returns cls, so it can also be used as a class decorator.
+    """
+    _serializers[cls] = to_dict or cls.to_dict
+    return cls
+
+
+def to_serializable(obj):
+    """Returns a JSON serializable representation of an object the JSON backend can't encode"""
+    # Use __class__ rather than type(), which is the same for all old style class instances
+    serializer = _serializers.get(obj.__class__)
+    if serializer is not None:
+        return serializer(obj)
+    import jsonpickle
+    return jsonpickle.Pickler(unpicklable=False).flatten(obj)
+
+
+if orjson is not None:
+    def encode_json(obj):
+        """Encodes obj as JSON, returned as bytes"""
+        return orjson.dumps(obj, default=to_serializable, option=orjson.OPT_NON_STR_KEYS)
+    def decode_json(data):
+        """
+        Decodes a JSON document into plain dicts, lists, strings and numbers
+
+        :raises ValueError if data isn't valid JSON
+        """
+        return orjson.loads(data)
+else:
+    def encode_json(obj):
+        """Encodes obj as JSON"""
+        return json.dumps(obj, default=to_serializable)
+
+    def decode_json(data):
+        """
+        Decodes a JSON document into plain dicts, lists, strings and numbers
+
+        :raises ValueError if data isn't valid JSON
+        """
+        if isinstance(data, bytes) and not isinstance(data, str):
+            data = data.decode("utf-8")
+        return json.loads(data)
@@ -0,0 +1,101 @@
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+import tornado.ioloop
+
+
+class IOLoopWatchdog:
+    """
+    Detects when the IOLoop is blocked, e.g. by a handler doing file system access,
+    and logs the stack of the code blocking it.
+
+    A callback is scheduled on the IOLoop every interval seconds. The delay with which it
+    runs is the loop lag, which is kept for the latest callbacks. A separate thread checks
+    that the callback keeps running, and if it hasn't for threshold seconds, logs the
+    stack of the IOLoop thread once per stall.
+
+    Usage example:
+        watchdog = IOLoopWatchdog(threshold=0.5)
+        watchdog.start()
+        tornado.ioloop.IOLoop.current().start()
+    """
+
+    def __init__(self, threshold=1.0, interval=0.1, logger=None, num_lags=1000):
+        """
+        :param threshold: The number of seconds the IOLoop can be blocked before it's logged
+        :param interval: The number of seconds between checks
+        :param logger: The logger instance to use. Will default to one named like the module
+        :param num_lags: The number of lag measurements the percentiles are computed from
+        """
+        self._threshold = threshold
+        self._interval = interval
+        self._logger = logger or logging.getLogger(__name__)
+        self._lags = collections.deque(maxlen=num_lags)
+        self._stalls = 0
+        self._last_stall_stack = None
+        self._io_loop = None
+        self._io_loop_thread_ident = None
+        self._last_tick = None
+        self._next_tick_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, io_loop=None):
+        """Starts watching the IOLoop. Must be called from the IOLoop's thread."""
+        self._io_loop = io_loop or tornado.ioloop.IOLoop.current()
+        self._io_loop_thread_ident = threading.current_thread().ident
+        self._last_tick = time.time()
+        self._next_tick_at = self._last_tick + self._interval
+        self._io_loop.call_later(self._interval, self._tick)
+
+        self._thread = threading.Thread(target=self._watch, name="arteria-ioloop-watchdog")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def get_stall_count(self):
+        """Returns the number of times the IOLoop has been blocked for longer than the threshold"""
+        return self._stalls
+
+    def get_last_stall_stack(self):
+        """Returns the stack of the IOLoop thread at the latest stall, or None"""
+        return self._last_stall_stack
+
+    def get_lag_percentile(self, percentile):
+        """Returns the percentile (0-100) of the latest loop lags, in seconds"""
+        lags = sorted(self._lags)
+        if not lags:
+            return 0.0
+        index = min(len(lags) - 1, int(len(lags) * percentile / 100.0))
+        return lags[index]
+
+    def _tick(self):
+        now = time.time()
+        self._lags.append(max(0.0, now - self._next_tick_at))
+        self._last_tick = now
+        self._next_tick_at = now + self._interval
+        if not self._stop_event.is_set():
+            self._io_loop.call_later(self._interval, self._tick)
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stop_event.wait(self._interval):
+            last_tick = self._last_tick
+            blocked_for = time.time() - last_tick - self._interval
+            if blocked_for < self._threshold or last_tick == reported_tick:
+                continue
+
+            # Only report each stall once
+            reported_tick = last_tick
+            frame = sys._current_frames().get(self._io_loop_thread_ident)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(the thread has exited)\n"
+            self._stalls += 1
+            self._last_stall_stack = stack
+            self._logger.warning("The IOLoop has been blocked for {0:.3f} seconds, at:\n{1}"
+                                 .format(blocked_for, stack))
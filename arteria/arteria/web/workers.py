@@ -0,0 +1,125 @@
+import errno
+import logging
+import os
+import random
+import signal
+import sys
+
+
+class WorkerSupervisor:
+    """
+    Pre-forks worker processes and supervises them, restarting workers that die.
+
+    Works like tornado.process.fork_processes, but keeps track of the workers so that
+    signals sent to the supervisor can be forwarded to them. This means that stopping
+    the service (e.g. kill -15 <pid>) stops all workers, and that SIGHUP reaches the
+    workers' config services.
+
+    Usage example:
+        sockets = tornado.netutil.bind_sockets(port)
+        worker_id = WorkerSupervisor(4).fork()
+
+        # From here on, the code runs in one of the workers:
+        server = tornado.httpserver.HTTPServer(app)
+        server.add_sockets(sockets)
+    """
+
+    FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+    def __init__(self, num_workers, max_restarts=100, logger=None):
+        """
+        :param num_workers: The number of worker processes to fork
+        :param max_restarts: The number of times workers may be restarted before giving up
+        :param logger: The logger instance to use. Will default to one named like the module
+        """
+        if num_workers < 1:
+            raise ValueError("The number of workers must be at least 1, got {0}".format(num_workers))
+        self._num_workers = num_workers
+        self._max_restarts = max_restarts
+        self._logger = logger or logging.getLogger(__name__)
+        self._children = {}
+        self._restarts = 0
+        self._stopping = False
+        self._previous_handlers = {}
+
+    def fork(self):
+        """
+        Forks the workers. Returns the id (0 to num_workers - 1) of the worker in the worker
+        processes. In the supervisor process it doesn't return, but exits when all workers
+        have exited.
+        """
+        for signum in WorkerSupervisor.FORWARDED_SIGNALS:
+            self._previous_handlers[signum] = signal.getsignal(signum)
+
+        for worker_id in range(self._num_workers):
+            if self._start_worker(worker_id):
+                return worker_id
+
+        for signum in WorkerSupervisor.FORWARDED_SIGNALS:
+            signal.signal(signum, self._forward_signal)
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if pid not in self._children:
+                continue
+
+            worker_id = self._children.pop(pid)
+            if os.WIFSIGNALED(status):
+                reason = "was killed by signal {0}".format(os.WTERMSIG(status))
+            elif os.WEXITSTATUS(status) != 0:
+                reason = "exited with status {0}".format(os.WEXITSTATUS(status))
+            else:
+                self._logger.info("Worker {0} (pid {1}) exited normally".format(worker_id, pid))
+                continue
+
+            if self._stopping:
+                self._logger.info("Worker {0} (pid {1}) {2}".format(worker_id, pid, reason))
+                continue
+
+            self._logger.warning("Worker {0} (pid {1}) {2}, restarting it".format(worker_id, pid, reason))
+            self._restarts += 1
+            if self._restarts > self._max_restarts:
+                self._signal_workers(signal.SIGTERM)
+                raise TooManyRestartsError("Workers were restarted more than {0} times"
+                                           .format(self._max_restarts))
+            if self._start_worker(worker_id):
+                return worker_id
+
+        sys.exit(0)
+
+    def _start_worker(self, worker_id):
+        """Forks a worker. Returns True in the worker process and False in the supervisor"""
+        pid = os.fork()
+        if pid == 0:
+            # Restore the handlers the worker would have had without a supervisor
+            for signum, handler in self._previous_handlers.items():
+                signal.signal(signum, handler if handler is not None else signal.SIG_DFL)
+            # Make sure the workers don't share a random sequence
+            random.seed()
+            return True
+
+        self._logger.info("Started worker {0} with pid {1}".format(worker_id, pid))
+        self._children[pid] = worker_id
+        return False
+
+    def _forward_signal(self, signum, frame):
+        if signum != signal.SIGHUP:
+            self._stopping = True
+        self._signal_workers(signum)
+
+    def _signal_workers(self, signum):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+
+class TooManyRestartsError(Exception):
+    pass
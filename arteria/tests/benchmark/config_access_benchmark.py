@@ -0,0 +1,64 @@
+"""
+Compares per-request config access before and after compiled config snapshots.
+
+Usage: python config_access_benchmark.py [iterations]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import timeit
+from arteria.configuration import ConfigurationService
+from arteria.schema import Schema, Field
+
+SCHEMA = Schema(
+    Field("monitored_directories", list, required=True,
+          convert=lambda directories: [os.path.normpath(d) for d in directories]),
+    name="BenchmarkConfig")
+
+
+class LegacyConfigurationService:
+    """The lookup done by ConfigurationService.__getitem__ before snapshots were introduced"""
+    def __init__(self, path, config):
+        self._cache_lock = threading.Lock()
+        self._cache = {path: config}
+        self._app_config_path = path
+
+    def _load_config_file(self, path, from_cache=True):
+        must_fetch = lambda: (not from_cache) or (path not in self._cache)
+        if must_fetch():
+            with self._cache_lock:
+                pass
+        return self._cache[path]
+
+    def __getitem__(self, key):
+        return self._load_config_file(self._app_config_path)[key]
+
+
+def main(iterations):
+    config_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(config_dir, "app.config")
+        with open(path, "w") as f:
+            f.write("monitored_directories:\n  - /data/mon1\n  - /data/mon2\n")
+
+        config_svc = ConfigurationService(app_config_path=path, app_config_schema=SCHEMA)
+        reloading_config_svc = ConfigurationService(app_config_path=path, app_config_schema=SCHEMA,
+                                                    revalidate_interval=5)
+        legacy = LegacyConfigurationService(path, config_svc.get_app_config())
+
+        cases = [
+            ("legacy config_svc[key]", lambda: legacy["monitored_directories"]),
+            ("config_svc[key]", lambda: config_svc["monitored_directories"]),
+            ("config_svc[key], revalidating", lambda: reloading_config_svc["monitored_directories"]),
+            ("get_app_snapshot().attribute", lambda: config_svc.get_app_snapshot().monitored_directories),
+        ]
+        for name, func in cases:
+            seconds = min(timeit.repeat(func, number=iterations, repeat=5))
+            print("{0:<35} {1:8.3f} us/access".format(name, 1e6 * seconds / iterations))
+    finally:
+        shutil.rmtree(config_dir)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,101 @@
+"""
+Measures the time it takes to import the arteria services' main modules, which is most
+of the time it takes before they open their ports, using python -X importtime.
+
+Each module is imported in a fresh interpreter a number of times and the fastest import
+is reported, together with the slowest imports it does. Exits with a non-zero status if
+any module takes longer than the budget, so it can be used to catch startup regressions.
+
+Usage: python import_time_benchmark.py [--budget-ms 500] [--repeat 5] [module ...]
+
+The modules default to the main modules of runfolder, bcl2fastq and siswrap, imported
+from this checkout.
+"""
+import os
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+# The main module of each service, and the directory it's found in
+SERVICES = [
+    ("runfolder.app", "runfolder"),
+    ("bcl2fastq.app", "bcl2fastq"),
+    ("siswrap.siswrap_ws", "siswrap"),
+]
+
+
+def _env():
+    env = dict(os.environ)
+    paths = [os.path.join(REPO_ROOT, "arteria")] + [os.path.join(REPO_ROOT, d) for _, d in SERVICES]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
+
+
+def import_times(module):
+    """
+    Imports the module in a new interpreter. Returns the total import time in seconds
+    and a list of (seconds, module) for the modules it imported, excluding their imports.
+    """
+    if sys.version_info < (3, 7):
+        # -X importtime isn't available, time the interpreter with and without the import
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", "pass"], env=_env())
+        baseline = time.time() - start
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", "import " + module], env=_env())
+        return time.time() - start - baseline, []
+
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", "import " + module],
+                               env=_env(), stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        errors = [line for line in stderr.splitlines() if not line.startswith("import time:")]
+        raise ImportError("Not able to import {0}:\n{1}".format(module, "\n".join(errors)))
+
+    total = None
+    self_times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        self_times.append((int(self_us) / 1e6, name.strip()))
+        if name.strip() == module:
+            total = int(cumulative_us) / 1e6
+    return total, sorted(self_times, reverse=True)
+
+
+def main():
+    parser = OptionParser(usage="%prog [--budget-ms MS] [--repeat N] [module ...]")
+    parser.add_option("--budget-ms", dest="budget_ms", type="float", default=500)
+    parser.add_option("--repeat", dest="repeat", type="int", default=5)
+    parser.add_option("--top", dest="top", type="int", default=10)
+    (options, modules) = parser.parse_args()
+    modules = modules or [module for module, _ in SERVICES]
+
+    over_budget = []
+    for module in modules:
+        try:
+            results = [import_times(module) for _ in range(options.repeat)]
+        except (ImportError, subprocess.CalledProcessError) as e:
+            print("{0}: FAILED\n{1}".format(module, e))
+            over_budget.append(module)
+            continue
+        total, slowest = min(results)
+        status = "OK" if total * 1000 <= options.budget_ms else "OVER BUDGET"
+        print("{0}: {1:.1f} ms (budget {2:.0f} ms) {3}".format(module, total * 1000, options.budget_ms, status))
+        for seconds, name in slowest[:options.top]:
+            print("    {0:8.1f} ms  {1}".format(seconds * 1000, name))
+        if status != "OK":
+            over_budget.append(module)
+
+    if over_budget:
+        print("Over budget: {0}".format(", ".join(over_budget)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
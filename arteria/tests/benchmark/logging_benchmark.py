@@ -0,0 +1,77 @@
+"""
+Compares the latency of log calls on the request path when the file handler writes
+directly, and when records are queued and written by a background thread.
+
+Calls are timed one at a time, with a pause in between like between requests, and
+reported as percentiles. The slow storage case stalls every 100th write for 5 ms,
+like a file system that occasionally blocks.
+
+Usage: python logging_benchmark.py [calls]
+"""
+import logging
+import logging.config
+import os
+import shutil
+import sys
+import tempfile
+import time
+from arteria.web.queue_logging import QueueLogging
+
+
+class SlowFileHandler(logging.FileHandler):
+    """A file handler on storage that stalls now and then"""
+    writes = 0
+
+    def emit(self, record):
+        SlowFileHandler.writes += 1
+        if SlowFileHandler.writes % 100 == 0:
+            time.sleep(0.005)
+        logging.FileHandler.emit(self, record)
+
+
+def logger_config(log_path, handler_class):
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {"simple": {"format": "%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s"}},
+        "handlers": {
+            "file_handler": {"()": handler_class, "level": "INFO", "formatter": "simple",
+                             "filename": log_path}
+        },
+        "root": {"level": "DEBUG", "handlers": ["file_handler"]}
+    }
+
+
+def measure(calls):
+    logger = logging.getLogger("benchmark")
+    latencies = []
+    for index in range(calls):
+        start = time.time()
+        logger.info("Handled request %s for %s", "GET /api/1.0/runfolders", "127.0.0.1")
+        latencies.append(time.time() - start)
+        time.sleep(0.0002)
+    latencies.sort()
+    return [1e6 * latencies[int(len(latencies) * percentile)] for percentile in (0.5, 0.99, 0.999)]
+
+
+def main(calls):
+    log_dir = tempfile.mkdtemp()
+    try:
+        for storage, handler_class in ("local file", logging.FileHandler), ("slow storage", SlowFileHandler):
+            config = logger_config(os.path.join(log_dir, "direct.log"), handler_class)
+            logging.config.dictConfig(config)
+            p50, p99, p999 = measure(calls)
+            print("{0:<30} p50 {1:8.1f} us  p99 {2:8.1f} us  p99.9 {3:8.1f} us".format(
+                "direct, " + storage, p50, p99, p999))
+
+            queue_logging = QueueLogging(logger_config(os.path.join(log_dir, "queued.log"), handler_class))
+            queue_logging.configure()
+            p50, p99, p999 = measure(calls)
+            queue_logging.stop()
+            print("{0:<30} p50 {1:8.1f} us  p99 {2:8.1f} us  p99.9 {3:8.1f} us".format(
+                "queued, " + storage, p50, p99, p999))
+    finally:
+        shutil.rmtree(log_dir)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,49 @@
+"""
+Measures the per-request overhead of the request metrics, i.e. the work done by
+AppService.request_finished for each request.
+
+Usage: python metrics_benchmark.py [iterations]
+"""
+import sys
+import timeit
+from arteria.web.metrics import RequestMetrics
+from arteria.web.routes import RouteService
+
+
+class FakeRequest:
+    method = "GET"
+
+    def request_time(self):
+        return 0.0042
+
+
+class FakeHandler:
+    request = FakeRequest()
+
+    def get_status(self):
+        return 200
+
+
+def main(iterations):
+    route_svc = RouteService(None, debug=False)
+    route_svc.set_routes([(r"/api/1.0/route{0}".format(index), type("Handler{0}".format(index), (), {}))
+                          for index in range(20)] + [(r"/api/1.0/runfolders", FakeHandler)])
+    metrics = RequestMetrics()
+    handler = FakeHandler()
+
+    def request_finished():
+        route = route_svc.get_route_pattern(handler.__class__) or "other"
+        request = handler.request
+        metrics.request_finished(route, request.method, handler.get_status(), request.request_time())
+
+    cases = [
+        ("RequestMetrics.request_finished",
+         lambda: metrics.request_finished(r"/api/1.0/runfolders", "GET", 200, 0.0042)),
+        ("route lookup + request_finished", request_finished),
+    ]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=iterations, repeat=5))
+        print("{0:<35} {1:8.3f} us/request".format(name, 1e6 * seconds / iterations))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
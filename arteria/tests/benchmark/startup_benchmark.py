@@ -0,0 +1,76 @@
+"""
+Measures AppService.create end to end: argument parsing, reading and parsing the
+config files and setting up logging. Compares the pure Python YAML loader, the
+libyaml loader and the libyaml loader with a warm parse cache.
+
+Usage: python startup_benchmark.py [iterations]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+import arteria.configuration
+from arteria.web.app import AppService
+
+LOGGER_CONFIG = """
+version: 1
+disable_existing_loggers: False
+formatters:
+    simple:
+        format: "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+handlers:
+    file_handler:
+        class: logging.handlers.RotatingFileHandler
+        level: WARNING
+        formatter: simple
+        filename: {log_path}
+        maxBytes: 10485760
+        backupCount: 20
+        encoding: utf8
+root:
+    level: DEBUG
+    handlers: [file_handler]
+"""
+
+
+def write_configs(config_root):
+    with open(os.path.join(config_root, "logger.config"), "w") as f:
+        f.write(LOGGER_CONFIG.format(log_path=os.path.join(config_root, "messages.log")))
+    with open(os.path.join(config_root, "app.config"), "w") as f:
+        f.write("port: 10000\nmonitored_directories:\n")
+        # A config of realistic size, e.g. bcl2fastq's version and machine type mappings
+        for i in range(500):
+            f.write("  - /data/biotank{0}/runfolders\n".format(i))
+
+
+def time_create(config_root, iterations, extra_args):
+    sys.argv = ["benchmark", "--port", "10000", "--configroot", config_root] + extra_args
+    timings = []
+    for _ in range(iterations):
+        start = time.time()
+        AppService.create("benchmark")
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(iterations):
+    config_root = tempfile.mkdtemp()
+    try:
+        write_configs(config_root)
+        cache_dir = os.path.join(config_root, "cache")
+
+        cases = [("pure Python loader", yaml.SafeLoader, []),
+                 ("libyaml loader", arteria.configuration.YamlLoader, []),
+                 ("libyaml loader, parse cache", arteria.configuration.YamlLoader,
+                  ["--configcache", cache_dir])]
+        for name, loader, extra_args in cases:
+            arteria.configuration.YamlLoader = loader
+            seconds = time_create(config_root, iterations, extra_args)
+            print("{0:<30} {1:8.2f} ms/create".format(name, 1000 * seconds))
+    finally:
+        shutil.rmtree(config_root)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
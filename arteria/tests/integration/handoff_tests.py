@@ -0,0 +1,114 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import shutil
+import requests
+from unittest import TestCase
+
+LOGGER_CONFIG = """
+version: 1
+disable_existing_loggers: False
+handlers:
+    file_handler:
+        class: logging.FileHandler
+        level: DEBUG
+        filename: {log_path}
+root:
+    level: DEBUG
+    handlers: [file_handler]
+"""
+
+SERVICE = """
+import os
+import tornado.gen
+from arteria.web.app import AppService
+from arteria.web.handlers import BaseRestHandler
+
+class PidHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        # Keep the request in flight for a while, to make sure some are when the restart happens
+        yield tornado.gen.sleep(0.05)
+        self.write_object({"pid": os.getpid()})
+
+app_svc = AppService.create("handoff-test")
+app_svc.start([(r"/api/1.0/pid", PidHandler)])
+"""
+
+
+class HandoffTest(TestCase):
+    """Restarts a service with SIGUSR2 while it's under load"""
+
+    def setUp(self):
+        self.config_root = tempfile.mkdtemp()
+        with open(os.path.join(self.config_root, "logger.config"), "w") as f:
+            f.write(LOGGER_CONFIG.format(log_path=os.path.join(self.config_root, "messages.log")))
+        with open(os.path.join(self.config_root, "app.config"), "w") as f:
+            f.write("port: 0\n")
+        with open(os.path.join(self.config_root, "service.py"), "w") as f:
+            f.write(SERVICE)
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.url = "http://127.0.0.1:{0}/api/1.0/pid".format(self.port)
+
+        env = dict(os.environ)
+        arteria_root = os.path.join(os.path.dirname(__file__), "..", "..")
+        env["PYTHONPATH"] = os.path.abspath(arteria_root)
+        self.process = subprocess.Popen(
+            [sys.executable, "service.py", "--port", str(self.port), "--configroot", self.config_root],
+            cwd=self.config_root, env=env)
+        self.pids = set()
+
+    def tearDown(self):
+        for pid in self.pids | set([self.process.pid]):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        self.process.wait()
+        shutil.rmtree(self.config_root)
+
+    def _wait_until_up(self):
+        for _ in range(100):
+            try:
+                return requests.get(self.url).json()["pid"]
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        self.fail("The service didn't start")
+
+    def test_restart_under_load_has_no_connection_errors(self):
+        first_pid = self._wait_until_up()
+        errors = []
+        stop_at = time.time() + 4
+
+        def hammer():
+            while time.time() < stop_at:
+                try:
+                    resp = requests.get(self.url)
+                    if resp.status_code != 200:
+                        errors.append(resp.status_code)
+                    else:
+                        self.pids.add(resp.json()["pid"])
+                except requests.RequestException as e:
+                    errors.append(e)
+
+        clients = [threading.Thread(target=hammer) for _ in range(8)]
+        for client in clients:
+            client.start()
+        time.sleep(1)
+        os.kill(first_pid, signal.SIGUSR2)
+        for client in clients:
+            client.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(len(self.pids) >= 2, "Expected a new process to take over")
+        # The old process exits after draining
+        self.assertEqual(self.process.wait(), 0)
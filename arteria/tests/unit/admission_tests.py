@@ -0,0 +1,92 @@
+import json
+import mock
+import tornado.gen
+from unittest import TestCase
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from arteria.web.admission import RouteLimit
+from arteria.web.app import AppService
+from arteria.web.handlers import BaseRestHandler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RouteLimitTest(TestCase):
+    def test_concurrency_limit(self):
+        route_limit = RouteLimit(max_concurrent=2, retry_after=3)
+        self.assertEqual(route_limit.try_acquire(), None)
+        self.assertEqual(route_limit.try_acquire(), None)
+        self.assertEqual(route_limit.try_acquire(), (503, "concurrency", 3))
+        route_limit.release()
+        self.assertEqual(route_limit.try_acquire(), None)
+
+    def test_token_bucket_allows_bursts_and_refills_at_the_rate(self):
+        clock = FakeClock()
+        route_limit = RouteLimit(rate=0.5, burst=2, clock=clock)
+        self.assertEqual(route_limit.try_acquire(), None)
+        self.assertEqual(route_limit.try_acquire(), None)
+        self.assertEqual(route_limit.try_acquire(), (429, "rate", 2))
+        clock.now += 1
+        self.assertEqual(route_limit.try_acquire(), (429, "rate", 1))
+        clock.now += 1
+        self.assertEqual(route_limit.try_acquire(), None)
+
+
+class SlowHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        yield tornado.gen.sleep(0.2)
+        self.write_object({"done": True})
+
+
+class AdmissionControlTest(AsyncHTTPTestCase):
+    def get_app(self):
+        config_svc = mock.MagicMock()
+        config_svc.get_logger_config.return_value = {"version": 1, "disable_existing_loggers": False}
+        self.app_svc = AppService(config_svc, False, 1234)
+        return self.app_svc._create_application(
+            [(r"/slow", SlowHandler), (r"/slow/unlimited", SlowHandler)],
+            route_limits={r"/slow": RouteLimit(max_concurrent=1, retry_after=2)})
+
+    @gen_test
+    def test_requests_over_the_limit_are_rejected_with_retry_after(self):
+        first = self.http_client.fetch(self.get_url("/slow"))
+        yield tornado.gen.sleep(0.05)
+        rejected = yield self.http_client.fetch(self.get_url("/slow"), raise_error=False)
+        self.assertEqual(rejected.code, 503)
+        self.assertEqual(rejected.headers["Retry-After"], "2")
+        self.assertEqual(json.loads(rejected.body)["reason"], "concurrency")
+
+        response = yield first
+        self.assertEqual(response.code, 200)
+        response = yield self.http_client.fetch(self.get_url("/slow"))
+        self.assertEqual(response.code, 200)
+        # Metrics are labelled with all the patterns of the handler class
+        self.assertTrue('arteria_http_requests_rejected_total{route="/slow|/slow/unlimited",'
+                        'reason="concurrency"} 1' in self.app_svc.metrics.render())
+
+    @gen_test
+    def test_limits_only_apply_to_their_own_pattern(self):
+        first = self.http_client.fetch(self.get_url("/slow"))
+        yield tornado.gen.sleep(0.05)
+        # Served by the same handler class, but not limited
+        response = yield self.http_client.fetch(self.get_url("/slow/unlimited"))
+        self.assertEqual(response.code, 200)
+        yield first
+
+    def test_patterns_of_one_class_keep_their_own_limits(self):
+        route_svc = self.app_svc.route_svc
+        slow, other = RouteLimit(rate=1), RouteLimit(rate=2)
+        route_svc.set_route_limits({r"/slow": slow, r"/slow/unlimited": other})
+        self.assertTrue(route_svc.get_route_limit(SlowHandler, "/slow") is slow)
+        self.assertTrue(route_svc.get_route_limit(SlowHandler, "/slow/unlimited") is other)
+
+    def test_limits_for_unknown_routes_are_refused(self):
+        from arteria.web.routes import UnknownRouteError
+        self.assertRaises(UnknownRouteError, self.app_svc.route_svc.set_route_limits,
+                          {r"/other": RouteLimit(rate=1)})
@@ -0,0 +1,147 @@
+import json
+import tornado.gen
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from arteria.web.client import ArteriaClient, ArteriaClientError, RunfolderClient, \
+    Bcl2FastqClient, SiswrapClient
+
+
+class RunfoldersStandIn(tornado.web.RequestHandler):
+    def get(self):
+        self.write({"runfolders": [{"path": "/data/rf1", "state": "ready"}],
+                    "health": {"/data": {"status": "ok"}}})
+
+
+class RunfolderStandIn(tornado.web.RequestHandler):
+    def get(self, path):
+        self.write({"path": path, "state": "ready"})
+
+    def post(self, path):
+        self.write({"path": path, "state": json.loads(self.request.body)["state"]})
+
+
+class ClaimStandIn(tornado.web.RequestHandler):
+    def post(self):
+        owner = json.loads(self.request.body)["owner"]
+        self.write({"path": "/data/rf1", "state": "started", "lease": {"lease_id": "abc", "owner": owner}})
+
+
+class Bcl2FastqStartStandIn(tornado.web.RequestHandler):
+    def post(self, runfolder):
+        params = json.loads(self.request.body)
+        self.set_status(202)
+        self.write({"job_id": 1, "runfolder": runfolder, "params": params})
+
+
+class SiswrapRunStandIn(tornado.web.RequestHandler):
+    def post(self, wrapper_type, runfolder):
+        self.set_status(202)
+        self.write({"pid": 2, "runfolder": json.loads(self.request.body)["runfolder"]})
+
+
+class FlakyStandIn(tornado.web.RequestHandler):
+    """Rejects the first requests, like a service over its admission limits"""
+    rejections = 0
+
+    def get(self, status):
+        if FlakyStandIn.rejections > 0:
+            FlakyStandIn.rejections -= 1
+            self.set_status(int(status))
+            self.set_header("Retry-After", "0")
+            return
+        self.write({"ok": True})
+
+    post = get
+
+
+class SlowStandIn(tornado.web.RequestHandler):
+    active = 0
+    max_active = 0
+
+    @tornado.gen.coroutine
+    def get(self):
+        SlowStandIn.active += 1
+        SlowStandIn.max_active = max(SlowStandIn.max_active, SlowStandIn.active)
+        yield tornado.gen.sleep(0.05)
+        SlowStandIn.active -= 1
+        self.write({"ok": True})
+
+
+class ArteriaClientTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([
+            (r"/api/1.0/runfolders", RunfoldersStandIn),
+            (r"/api/1.0/runfolders/claim", ClaimStandIn),
+            (r"/api/1.0/runfolders/path(/.*)", RunfolderStandIn),
+            (r"/api/1.0/start/([\w_-]+)", Bcl2FastqStartStandIn),
+            (r"/api/1.0/(qc|report)/run/([\w_-]+)", SiswrapRunStandIn),
+            (r"/flaky/(\d+)", FlakyStandIn),
+            (r"/slow", SlowStandIn),
+        ])
+
+    def setUp(self):
+        super(ArteriaClientTest, self).setUp()
+        FlakyStandIn.rejections = 0
+        SlowStandIn.max_active = 0
+        self.client = ArteriaClient(max_per_host=2, backoff=0.01, request_timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        super(ArteriaClientTest, self).tearDown()
+
+    @gen_test
+    def test_service_clients(self):
+        base_url = self.get_url("/api/1.0")
+        runfolders = yield RunfolderClient(base_url, self.client).list_runfolders()
+        self.assertEqual(runfolders["runfolders"], [{"path": "/data/rf1", "state": "ready"}])
+
+        runfolder = yield RunfolderClient(base_url, self.client).set_runfolder_state("/data/rf1", "started")
+        self.assertEqual(runfolder, {"path": "/data/rf1", "state": "started"})
+
+        runfolder = yield RunfolderClient(base_url, self.client).claim_next_runfolder(owner="demux-1")
+        self.assertEqual(runfolder["lease"], {"lease_id": "abc", "owner": "demux-1"})
+
+        job = yield Bcl2FastqClient(base_url, self.client).start("rf1", barcode_mismatches=1)
+        self.assertEqual(job, {"job_id": 1, "runfolder": "rf1", "params": {"barcode_mismatches": 1}})
+
+        process = yield SiswrapClient(base_url, self.client).run(SiswrapClient.QC, "rf1")
+        self.assertEqual(process, {"pid": 2, "runfolder": "rf1"})
+
+    @gen_test
+    def test_rejected_requests_are_retried(self):
+        FlakyStandIn.rejections = 2
+        response = yield self.client.post_json(self.get_url("/flaky/503"), {})
+        self.assertEqual(response, {"ok": True})
+
+    @gen_test
+    def test_gives_up_after_the_retries(self):
+        FlakyStandIn.rejections = 3
+        with self.assertRaises(ArteriaClientError) as context:
+            yield self.client.get_json(self.get_url("/flaky/429"), retries=2)
+        self.assertEqual(context.exception.code, 429)
+
+    @gen_test
+    def test_non_idempotent_requests_are_not_retried_on_gateway_errors(self):
+        FlakyStandIn.rejections = 1
+        with self.assertRaises(ArteriaClientError) as context:
+            yield self.client.post_json(self.get_url("/flaky/502"), {})
+        self.assertEqual(context.exception.code, 502)
+
+    @gen_test
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(ArteriaClientError) as context:
+            yield self.client.get_json(self.get_url("/missing"))
+        self.assertEqual(context.exception.code, 404)
+
+    @gen_test
+    def test_limits_the_concurrent_requests_per_host(self):
+        yield [self.client.get_json(self.get_url("/slow")) for _ in range(6)]
+        self.assertEqual(SlowStandIn.max_active, 2)
+
+    @gen_test
+    def test_connection_failures_are_retried_and_reported(self):
+        client = ArteriaClient(retries=1, backoff=0.01, connect_timeout=1)
+        with self.assertRaises(ArteriaClientError) as context:
+            yield client.get_json("http://127.0.0.1:1/api/1.0")
+        self.assertEqual(context.exception.code, 599)
+        client.close()
@@ -0,0 +1,134 @@
+from unittest import TestCase
+from arteria.configuration import ConfigurationService, ConfigurationError
+from arteria.schema import Schema, Field
+import mock
+import os
+import shutil
+import tempfile
+
+
+class ConfigurationServiceTest(TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.app_config_path = os.path.join(self.config_dir, "app.config")
+        self._write_config(1)
+
+        self.reads = 0
+
+        def read_yaml(path, cache_dir=None):
+            self.reads += 1
+            with open(path) as f:
+                return {"value": int(f.read())}
+
+        patcher = mock.patch.object(ConfigurationService, "read_yaml", side_effect=read_yaml)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write_config(self, value):
+        with open(self.app_config_path, "w") as f:
+            f.write(str(value))
+
+    def _create(self, revalidate_interval):
+        return ConfigurationService(app_config_path=self.app_config_path,
+                                    revalidate_interval=revalidate_interval)
+
+    def test_caches_forever_by_default(self):
+        config_svc = self._create(None)
+        self.assertEqual(config_svc["value"], 1)
+        self._write_config(22)
+        self.assertEqual(config_svc["value"], 1)
+        self.assertEqual(self.reads, 1)
+
+    def test_reloads_changed_file(self):
+        config_svc = self._create(0)
+        self.assertEqual(config_svc["value"], 1)
+        self.assertEqual(config_svc["value"], 1)
+        self.assertEqual(self.reads, 1)
+
+        self._write_config(22)
+        self.assertEqual(config_svc["value"], 22)
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(config_svc.get_cache_stats()["reloads"], 1)
+
+    def test_revalidation_is_rate_limited(self):
+        config_svc = self._create(3600)
+        self.assertEqual(config_svc["value"], 1)
+        self._write_config(22)
+        self.assertEqual(config_svc["value"], 1)
+        self.assertEqual(config_svc.get_cache_stats()["revalidations"], 0)
+
+    def test_revalidation_does_not_replace_a_newer_entry(self):
+        config_svc = self._create(0)
+        config_svc.get_app_config()
+        entry = config_svc._cache[self.app_config_path]
+        self._write_config(22)
+        config_svc.reload()
+        self.assertEqual(config_svc["value"], 22)
+
+        # A revalidation of the old entry, which stat'ed the file before it changed
+        with mock.patch.object(ConfigurationService, "_stat_key", return_value=entry.stat_key):
+            revalidated = config_svc._revalidate(self.app_config_path, entry, entry.checked_at + 1)
+        self.assertEqual(revalidated.config, {"value": 22})
+        self.assertEqual(config_svc._cache[self.app_config_path].config, {"value": 22})
+
+    def test_reload_forces_read(self):
+        config_svc = self._create(3600)
+        config_svc.get_app_config()
+        config_svc.reload()
+        config_svc.get_app_config()
+        self.assertEqual(self.reads, 2)
+
+    def test_keeps_last_good_config_if_reload_fails(self):
+        config_svc = self._create(0)
+        self.assertEqual(config_svc["value"], 1)
+        with open(self.app_config_path, "w") as f:
+            f.write("not an int")
+        self.assertEqual(config_svc["value"], 1)
+        self.assertEqual(config_svc.get_cache_stats()["reload_errors"], 1)
+
+    def test_app_config_is_compiled_with_schema(self):
+        schema = Schema(Field("value", int, required=True, convert=lambda value: value * 2))
+        config_svc = ConfigurationService(app_config_path=self.app_config_path,
+                                          app_config_schema=schema)
+        self.assertEqual(config_svc.get_app_snapshot().value, 2)
+        self.assertEqual(config_svc["value"], 2)
+
+    def test_invalid_app_config_fails_on_load(self):
+        schema = Schema(Field("missing", list, required=True))
+        config_svc = ConfigurationService(app_config_path=self.app_config_path,
+                                          app_config_schema=schema)
+        self.assertRaises(ConfigurationError, config_svc.get_app_snapshot)
+
+
+class ReadYamlTest(TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.config_dir, "cache")
+        self.path = os.path.join(self.config_dir, "app.config")
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write_config(self, content):
+        with open(self.path, "w") as f:
+            f.write(content)
+
+    def test_parsed_config_is_cached_by_content(self):
+        self._write_config("port: 10000\n")
+        self.assertEqual(ConfigurationService.read_yaml(self.path, self.cache_dir), {"port": 10000})
+
+        with mock.patch("yaml.load") as load:
+            self.assertEqual(ConfigurationService.read_yaml(self.path, self.cache_dir), {"port": 10000})
+            self.assertFalse(load.called)
+
+        self._write_config("port: 10001\n")
+        self.assertEqual(ConfigurationService.read_yaml(self.path, self.cache_dir), {"port": 10001})
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_reads_without_cache(self):
+        self._write_config("monitored_directories:\n  - /data/mon1\n")
+        self.assertEqual(ConfigurationService.read_yaml(self.path),
+                         {"monitored_directories": ["/data/mon1"]})
@@ -0,0 +1,127 @@
+import threading
+import time
+import tornado.gen
+from unittest import TestCase
+from tornado.testing import AsyncTestCase, gen_test
+from arteria.decorators import single_flight
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def slow(self, value, seconds=0.1):
+        # Counted when the call starts, so that overlapping calls are all counted
+        self.calls += 1
+        time.sleep(seconds)
+        return value
+
+
+class SingleFlightTest(TestCase):
+    def call_concurrently(self, fn, count=10):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fn())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_call(self):
+        counter = Counter()
+        slow = single_flight()(counter.slow)
+        results = self.call_concurrently(lambda: slow(1))
+        self.assertEqual(counter.calls, 1)
+        self.assertEqual(results, [1] * 10)
+
+        # Without a ttl, the next call does the work again
+        slow(1)
+        self.assertEqual(counter.calls, 2)
+
+    def test_calls_with_other_arguments_are_not_shared(self):
+        counter = Counter()
+        slow = single_flight()(counter.slow)
+        self.call_concurrently(lambda: slow(threading.current_thread().name), count=3)
+        self.assertEqual(counter.calls, 3)
+
+    def test_results_are_kept_for_the_ttl(self):
+        counter = Counter()
+        slow = single_flight(ttl=0.2)(counter.slow)
+        slow(1, seconds=0)
+        slow(1, seconds=0)
+        self.assertEqual(counter.calls, 1)
+        time.sleep(0.25)
+        slow(1, seconds=0)
+        self.assertEqual(counter.calls, 2)
+
+    def test_exceptions_are_shared_but_not_kept(self):
+        calls = []
+
+        @single_flight(ttl=10)
+        def fail():
+            calls.append(1)
+            time.sleep(0.1)
+            raise ValueError("failed")
+
+        errors = []
+
+        def call():
+            try:
+                fail()
+            except ValueError as e:
+                errors.append(e)
+
+        self.call_concurrently(call, count=5)
+        self.assertEqual((len(calls), len(errors)), (1, 5))
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(len(calls), 2)
+
+    def test_flights_interrupted_by_base_exceptions_are_ended(self):
+        calls = []
+
+        @single_flight()
+        def interrupted():
+            calls.append(1)
+            time.sleep(0.1)
+            if len(calls) == 1:
+                raise KeyboardInterrupt()
+            return "done"
+
+        errors = []
+
+        def follow():
+            try:
+                interrupted()
+            except KeyboardInterrupt as e:
+                errors.append(e)
+        follower = threading.Thread(target=follow)
+        follower.daemon = True
+        leader = threading.Thread(target=follow)
+        leader.start()
+        time.sleep(0.05)
+        follower.start()
+        leader.join()
+        follower.join(5)
+        self.assertFalse(follower.is_alive())
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(interrupted(), "done")
+
+
+class SingleFlightCoroutineTest(AsyncTestCase):
+    @gen_test
+    def test_pending_futures_are_shared(self):
+        calls = []
+
+        @single_flight()
+        @tornado.gen.coroutine
+        def fetch(value):
+            calls.append(value)
+            yield tornado.gen.sleep(0.05)
+            raise tornado.gen.Return(value)
+
+        results = yield [fetch(1) for _ in range(5)] + [fetch(2)]
+        self.assertEqual(results, [1] * 5 + [2])
+        self.assertEqual(calls, [1, 2])
+
+        yield fetch(1)
+        self.assertEqual(calls, [1, 2, 1])
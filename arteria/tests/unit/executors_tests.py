@@ -0,0 +1,36 @@
+import threading
+from unittest import TestCase
+from arteria.web.executors import ExecutorService
+
+
+class ExecutorServiceTest(TestCase):
+    def setUp(self):
+        self.executors = ExecutorService(threads=2, processes=1)
+
+    def tearDown(self):
+        self.executors.shutdown()
+
+    def test_run_in_thread_runs_off_the_calling_thread(self):
+        future = self.executors.run_in_thread(lambda x: (x, threading.current_thread().ident), 1)
+        value, ident = future.result()
+        self.assertEqual(value, 1)
+        self.assertNotEqual(ident, threading.current_thread().ident)
+
+    def test_stats_count_queued_and_active_tasks(self):
+        release = threading.Event()
+        futures = [self.executors.run_in_thread(release.wait) for _ in range(3)]
+        stats = self.executors.thread_stats
+        self.assertEqual(stats.as_dict()["queued"] + stats.as_dict()["active"], 3)
+        release.set()
+        for future in futures:
+            future.result()
+        self.assertEqual(stats.as_dict()["completed"], 3)
+        self.assertEqual(stats.as_dict()["queued"], 0)
+        self.assertEqual(stats.as_dict()["active"], 0)
+
+    def test_exceptions_are_raised_from_the_future(self):
+        future = self.executors.run_in_thread(int, "x")
+        self.assertRaises(ValueError, future.result)
+
+    def test_run_in_process(self):
+        self.assertEqual(self.executors.run_in_process(pow, 2, 10).result(), 1024)
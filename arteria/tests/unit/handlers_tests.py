@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+import tornado.gen
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase, ExpectLog, gen_test
+from arteria.schema import Schema, Field, string_types
+from arteria.web.handlers import BaseRestHandler, ProfileHandler
+
+
+class StreamingHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self, count):
+        items = ({"index": index} for index in range(int(count)))
+        yield self.write_stream(items, flush_every=100)
+
+
+class FailingStreamingHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self, count):
+        def items():
+            for index in range(int(count)):
+                yield {"index": index}
+            raise IOError("The disk went away")
+        yield self.write_stream(items(), flush_every=100)
+
+
+class BaseRestHandlerTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/stream/(\d+)", StreamingHandler),
+                                        (r"/failing_stream/(\d+)", FailingStreamingHandler)])
+
+    def test_write_stream_writes_json_array_in_chunks(self):
+        response = self.fetch("/stream/250")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers.get("Transfer-Encoding"), "chunked")
+        self.assertEqual(json.loads(response.body), [{"index": index} for index in range(250)])
+
+    def test_write_stream_with_few_items_is_not_chunked(self):
+        for count in 0, 1, 99:
+            response = self.fetch("/stream/{0}".format(count))
+            self.assertEqual(json.loads(response.body), [{"index": index} for index in range(count)])
+            self.assertTrue("Content-Length" in response.headers)
+
+    def test_write_stream_failures_are_not_sent_as_short_lists(self):
+        with ExpectLog("tornado.application", "Uncaught exception"):
+            # Before the first flush, it's an ordinary error response
+            self.assertEqual(self.fetch("/failing_stream/50").code, 500)
+            # After it, the connection is closed before the end of the response, which newer
+            # versions of tornado raise rather than report as a 599
+            try:
+                failed = self.fetch("/failing_stream/250").code == 599
+            except Exception:
+                failed = True
+            self.assertTrue(failed)
+
+
+class VersionedHandler(BaseRestHandler):
+    serialized = 0
+
+    def get(self):
+        if self.check_etag_version(3):
+            return
+        VersionedHandler.serialized += 1
+        self.write_object([{"index": index} for index in range(1000)])
+
+
+class ConditionalGetTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/versioned", VersionedHandler)], compress_response=True)
+
+    def test_matching_version_returns_304_without_serializing(self):
+        response = self.fetch("/versioned")
+        self.assertEqual(response.code, 200)
+        etag = response.headers["Etag"]
+
+        VersionedHandler.serialized = 0
+        response = self.fetch("/versioned", headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b"")
+        self.assertEqual(VersionedHandler.serialized, 0)
+
+    def test_response_is_gzipped_if_accepted(self):
+        response = self.fetch("/versioned", headers={"Accept-Encoding": "gzip"},
+                              decompress_response=False)
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+
+
+class ProfileHandlerTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/profile", ProfileHandler)])
+
+    def test_sample_returns_collapsed_stacks(self):
+        response = self.fetch("/profile?seconds=0.1")
+        self.assertEqual(response.code, 200)
+        lines = response.body.decode("utf-8").splitlines()
+        self.assertTrue(len(lines) > 0)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(int(count) > 0)
+
+    def test_cprofile_returns_stats(self):
+        response = self.fetch("/profile?seconds=0.1&mode=cprofile")
+        self.assertEqual(response.code, 200)
+        self.assertTrue(b"function calls" in response.body)
+
+    def test_invalid_arguments_are_rejected(self):
+        for query in "seconds=0", "seconds=x", "seconds=1000", "mode=other":
+            self.assertEqual(self.fetch("/profile?" + query).code, 400)
+
+
+class BlockingHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self, seconds):
+        yield self.run_in_thread(time.sleep, float(seconds))
+        self.write_object({"slept": float(seconds)})
+
+
+class ThreadStreamingHandler(BaseRestHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        items = ({"thread": threading.current_thread().name} for _ in range(250))
+        yield self.write_stream(items, in_thread=True)
+
+
+class ExecutorHelpersTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/block/(.*)", BlockingHandler),
+                                        (r"/stream", ThreadStreamingHandler)])
+
+    @gen_test
+    def test_blocking_call_does_not_block_other_requests(self):
+        client = self.http_client
+        slow = client.fetch(self.get_url("/block/0.5"))
+        start = time.time()
+        yield client.fetch(self.get_url("/block/0"))
+        self.assertTrue(time.time() - start < 0.4)
+        yield slow
+
+    def test_write_stream_in_thread(self):
+        items = json.loads(self.fetch("/stream").body)
+        self.assertEqual(len(items), 250)
+        self.assertTrue(all(item["thread"] != "MainThread" for item in items))
+
+
+class ValidatedHandler(BaseRestHandler):
+    request_schema = Schema(
+        Field("runfolder", string_types, required=True, max_length=100),
+        Field("barcode_mismatches", int, default=1, min_value=0, max_value=2),
+        name="ValidatedRequest")
+
+    def post(self):
+        self.write_object(self.body_as_object())
+
+
+class RequestValidationTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/validated", ValidatedHandler)])
+
+    def post(self, body):
+        response = self.fetch("/validated", method="POST", body=body)
+        return response.code, json.loads(response.body)
+
+    def test_valid_body_is_returned_with_defaults(self):
+        code, obj = self.post(json.dumps({"runfolder": "rf1", "other": [1, 2]}))
+        self.assertEqual(code, 200)
+        self.assertEqual(obj, {"runfolder": "rf1", "barcode_mismatches": 1})
+
+    def test_invalid_fields_are_reported(self):
+        code, obj = self.post(json.dumps({"barcode_mismatches": 3}))
+        self.assertEqual(code, 400)
+        self.assertEqual(sorted(error["field"] for error in obj["errors"]),
+                         ["barcode_mismatches", "runfolder"])
+
+    def test_invalid_json_is_reported(self):
+        for body in "{", "[1, 2]", '{"py/object": "os.system"}':
+            code, obj = self.post(body)
+            self.assertEqual(code, 400)
+            self.assertEqual(obj["reason"], "Invalid request body")
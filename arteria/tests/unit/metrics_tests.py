@@ -0,0 +1,34 @@
+from unittest import TestCase
+from arteria.web.metrics import RequestMetrics
+
+
+class RequestMetricsTest(TestCase):
+    def test_render_counts_requests_and_cumulates_buckets(self):
+        metrics = RequestMetrics(buckets=(0.01, 0.1))
+        metrics.request_finished("/api/1.0/runfolders", "GET", 200, 0.005)
+        metrics.request_finished("/api/1.0/runfolders", "GET", 200, 0.05)
+        metrics.request_finished("/api/1.0/runfolders", "GET", 500, 0.5)
+        lines = metrics.render().splitlines()
+
+        expected = [
+            'arteria_http_requests_total{route="/api/1.0/runfolders",method="GET",status="200"} 2',
+            'arteria_http_requests_total{route="/api/1.0/runfolders",method="GET",status="500"} 1',
+            'arteria_http_request_duration_seconds_bucket{route="/api/1.0/runfolders",method="GET",le="0.01"} 1',
+            'arteria_http_request_duration_seconds_bucket{route="/api/1.0/runfolders",method="GET",le="0.1"} 2',
+            'arteria_http_request_duration_seconds_bucket{route="/api/1.0/runfolders",method="GET",le="+Inf"} 3',
+            'arteria_http_request_duration_seconds_count{route="/api/1.0/runfolders",method="GET"} 3',
+        ]
+        for line in expected:
+            self.assertTrue(line in lines, line)
+
+    def test_route_labels_are_escaped(self):
+        metrics = RequestMetrics()
+        metrics.request_finished(r'/path(/.*)"\x', "GET", 200, 0.1)
+        self.assertTrue(r'route="/path(/.*)\"\\x"' in metrics.render())
+
+    def test_gauges_are_read_when_rendered(self):
+        metrics = RequestMetrics()
+        values = [1]
+        metrics.register_gauge("arteria_test", "A test gauge", lambda: values[0])
+        values[0] = 2
+        self.assertTrue("\narteria_test 2\n" in metrics.render())
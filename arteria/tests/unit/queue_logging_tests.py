@@ -0,0 +1,76 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from arteria.web.queue_logging import QueueLogging
+
+
+class QueueLoggingTest(TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.log_dir, "messages.log")
+        self.logger_config = {
+            "version": 1,
+            "disable_existing_loggers": False,
+            "formatters": {"simple": {"format": "%(levelname)s %(message)s"}},
+            "handlers": {
+                "file_handler": {
+                    "class": "logging.FileHandler",
+                    "level": "INFO",
+                    "formatter": "simple",
+                    "filename": self.log_path
+                }
+            },
+            "root": {"level": "DEBUG", "handlers": ["file_handler"]}
+        }
+        self.queue_logging = QueueLogging(self.logger_config)
+        self.queue_logging.configure()
+        self.logger = logging.getLogger("queue_logging_tests")
+
+    def tearDown(self):
+        self.queue_logging.stop()
+        logging.getLogger().handlers = []
+        shutil.rmtree(self.log_dir)
+
+    def _read_log(self):
+        self.queue_logging.stop()
+        with open(self.log_path) as f:
+            return f.read().splitlines()
+
+    def test_records_are_written_by_the_listener(self):
+        self.logger.info("written %s", "later")
+        self.logger.debug("filtered")
+        self.assertEqual(self._read_log(), ["INFO written later"])
+
+    def test_handler_level_is_changed_in_place(self):
+        file_handler = self.queue_logging._handlers["file_handler"]
+        self.queue_logging.set_handler_level("file_handler", "DEBUG")
+        self.logger.debug("not filtered")
+        self.assertTrue(self.queue_logging._handlers["file_handler"] is file_handler)
+        self.assertEqual(self.queue_logging.get_handler_level("file_handler"), "DEBUG")
+        self.assertEqual(self._read_log(), ["DEBUG not filtered"])
+
+    def test_invalid_level_raises_value_error(self):
+        self.assertRaises(ValueError, self.queue_logging.set_handler_level, "file_handler", "NOISY")
+
+    def test_exceptions_are_logged_with_traceback(self):
+        try:
+            raise KeyError("key")
+        except KeyError:
+            self.logger.exception("failed")
+        log = self._read_log()
+        self.assertEqual(log[0], "ERROR failed")
+        self.assertTrue(any("KeyError" in line for line in log[1:]))
+
+    def test_unqueued_records_are_written_directly(self):
+        self.queue_logging.stop()
+        threads = threading.active_count()
+        self.queue_logging = QueueLogging(self.logger_config)
+        self.queue_logging.configure(queued=False)
+        self.assertEqual(threading.active_count(), threads)
+        self.queue_logging.set_handler_level("file_handler", "DEBUG")
+        self.logger.debug("written now")
+        with open(self.log_path) as f:
+            self.assertEqual(f.read().splitlines(), ["DEBUG written now"])
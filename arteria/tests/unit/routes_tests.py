@@ -1,6 +1,7 @@
 from unittest import TestCase
 import arteria
-from arteria.web.routes import RouteService
+from arteria.web.routes import RouteService, RoutesNotSetError
+import json
 import mock
 
 class RoutesServiceTest(TestCase):
@@ -26,6 +27,50 @@ class RoutesServiceTest(TestCase):
             expected = set([("get", True), ("delete", True)])
             self.assertEqual(actual, expected)
 
+    def test_route_pattern_by_handler_class(self):
+        route_svc = RouteService(mock.MagicMock(), debug=False)
+        route_svc.set_routes([("/route0", TestHandler), ("/route1/(.*)", OtherHandler)])
+        self.assertEqual(route_svc.get_route_pattern(OtherHandler), "/route1/(.*)")
+        self.assertEqual(route_svc.get_route_pattern(TestHandler), "/route0")
+        self.assertEqual(route_svc.get_route_pattern(RoutesServiceTest), None)
+
+    def test_help_links_use_the_requested_base_url(self):
+        route_svc = RouteService(mock.MagicMock(), debug=False)
+        route_svc.set_routes([("/route0", TestHandler)])
+        self.assertEqual(route_svc.get_help("http://a")[0]["route"], "http://a/route0")
+        self.assertEqual(route_svc.get_help("https://b")[0]["route"], "https://b/route0")
+
+    def test_help_json_is_cached_per_base_url(self):
+        route_svc = RouteService(mock.MagicMock(), debug=False)
+        route_svc.set_routes([("/route0", TestHandler)])
+        encoded = route_svc.get_help_json("http://a")
+        self.assertEqual(json.loads(encoded)[0]["route"], "http://a/route0")
+        self.assertTrue(route_svc.get_help_json("http://a") is encoded)
+
+        for index in range(RouteService.HELP_CACHE_SIZE):
+            route_svc.get_help_json("http://host{0}".format(index))
+        self.assertFalse(route_svc.get_help_json("http://a") is encoded)
+
+    def test_help_requires_routes(self):
+        route_svc = RouteService(mock.MagicMock(), debug=False)
+        self.assertRaises(RoutesNotSetError, route_svc.get_help, "http://a")
+        self.assertRaises(RoutesNotSetError, route_svc.get_help_version)
+
+    def test_help_version_only_changes_with_the_docs(self):
+        versions = []
+        for routes in ([("/route0", TestHandler)], [("/route0", TestHandler)],
+                       [("/route0", TestHandler), ("/route1", OtherHandler)], [("/route1", TestHandler)]):
+            route_svc = RouteService(mock.MagicMock(), debug=False)
+            route_svc.set_routes(routes)
+            versions.append(route_svc.get_help_version())
+        # Undocumented routes aren't part of the help
+        self.assertEqual(versions[0], versions[1])
+        self.assertEqual(versions[0], versions[2])
+        self.assertNotEqual(versions[0], versions[3])
+
+class OtherHandler:
+    pass
+
 class TestHandler:
     """Used in RoutesServiceTest.test_help_doc_generated"""
     def get(self):
@@ -0,0 +1,48 @@
+from unittest import TestCase
+from arteria.schema import Schema, Field, Computed, SchemaError, string_types
+
+
+class SchemaTest(TestCase):
+    def setUp(self):
+        self.schema = Schema(
+            Field("directories", list, required=True,
+                  convert=lambda directories: [d.rstrip("/") for d in directories]),
+            Field("port", int, default=10000),
+            Computed("count", lambda values: len(values["directories"])),
+            name="TestConfig")
+
+    def test_compile_converts_and_computes_values(self):
+        snapshot = self.schema.compile({"directories": ["/a/", "/b"], "other": "value"})
+        self.assertEqual(snapshot.directories, ["/a", "/b"])
+        self.assertEqual(snapshot.port, 10000)
+        self.assertEqual(snapshot.count, 2)
+        self.assertEqual(snapshot["count"], 2)
+        self.assertEqual(snapshot["other"], "value")
+        self.assertTrue("other" in snapshot)
+        self.assertRaises(KeyError, lambda: snapshot["unknown"])
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.schema.compile({"directories": []})
+
+        def set_port():
+            snapshot.port = 1
+        self.assertRaises(AttributeError, set_port)
+
+    def test_errors_are_reported_per_field(self):
+        try:
+            self.schema.compile({"port": "10000"})
+            self.fail("Expected a SchemaError")
+        except SchemaError as e:
+            fields = sorted(error["field"] for error in e.errors)
+            self.assertEqual(fields, ["directories", "port"])
+
+    def test_limits(self):
+        schema = Schema(
+            Field("mismatches", int, min_value=0, max_value=2),
+            Field("mask", string_types, max_length=5),
+            Field("mode", string_types, choices=["qc", "report"]))
+        self.assertEqual(schema.validate({"mismatches": 2, "mask": "y*,6i", "mode": "qc"}),
+                         {"mismatches": 2, "mask": "y*,6i", "mode": "qc"})
+        for obj in {"mismatches": -1}, {"mismatches": 3}, {"mismatches": True}, \
+                {"mask": "y*,6i,6i"}, {"mode": "other"}:
+            self.assertRaises(SchemaError, schema.validate, obj)
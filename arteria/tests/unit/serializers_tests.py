@@ -0,0 +1,32 @@
+from unittest import TestCase
+from arteria.web.serializers import encode_json, register_serializer
+import json
+
+
+class Registered:
+    def __init__(self, value):
+        self.value = value
+        self.hidden = object()
+
+    def to_dict(self):
+        return {"value": self.value}
+
+register_serializer(Registered)
+
+
+class Unregistered(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class SerializersTest(TestCase):
+    def test_registered_type_is_encoded_with_its_serializer(self):
+        encoded = encode_json([Registered(1), {"nested": Registered(2)}])
+        self.assertEqual(json.loads(encoded), [{"value": 1}, {"nested": {"value": 2}}])
+
+    def test_unregistered_type_falls_back_to_jsonpickle(self):
+        encoded = encode_json({"obj": Unregistered("x")})
+        self.assertEqual(json.loads(encoded), {"obj": {"value": "x"}})
+
+    def test_non_string_keys_are_encoded(self):
+        self.assertEqual(json.loads(encode_json({1: "started"})), {"1": "started"})
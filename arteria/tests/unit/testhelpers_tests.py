@@ -0,0 +1,48 @@
+import time
+from unittest import TestCase
+from arteria.testhelpers import LoadTest, LoadTestResult
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class LoadTestTest(TestCase):
+    def test_requests_are_made_concurrently_and_measured(self):
+        def send_request(session):
+            time.sleep(0.01)
+            return FakeResponse(200)
+
+        result = LoadTest(send_request, clients=4, seconds=0.5, warmup_seconds=0.1).run()
+        # Serially, there would be at most 50 requests in 0.5 seconds
+        self.assertTrue(result.requests > 100, str(result))
+        self.assertTrue(0.01 <= result.percentile(50) < 0.1, str(result))
+        self.assertEqual(result.errors, [])
+        result.assert_slo(self, min_throughput=100, p99=1.0)
+
+    def test_errors_are_counted(self):
+        responses = iter([FakeResponse(200), FakeResponse(500)] * 1000000)
+
+        def send_request(session):
+            time.sleep(0.001)
+            response = next(responses)
+            if response.status_code == 500:
+                raise IOError("connection reset")
+            return response
+
+        result = LoadTest(send_request, clients=1, seconds=0.2, warmup_seconds=0).run()
+        self.assertTrue(0.4 < result.error_rate < 0.6, str(result))
+        self.assertRaises(AssertionError, result.assert_slo, self)
+
+    def test_slo_violations_fail(self):
+        result = LoadTestResult([0.1] * 90 + [2.0] * 10, [], seconds=1, clients=1)
+        self.assertEqual(result.throughput, 100)
+        self.assertEqual(result.percentile(50), 0.1)
+        self.assertEqual(result.percentile(95), 2.0)
+        result.assert_slo(self, min_throughput=100, p50=0.1)
+        self.assertRaises(AssertionError, result.assert_slo, self, p95=1.0)
+        self.assertRaises(AssertionError, result.assert_slo, self, min_throughput=101)
+        # Without a TestCase, e.g. in pytest style tests
+        result.assert_slo(p50=0.1)
+        self.assertRaises(AssertionError, result.assert_slo, p95=1.0)
@@ -0,0 +1,34 @@
+import time
+from tornado.testing import AsyncTestCase, gen_test
+import tornado.gen
+from arteria.web.watchdog import IOLoopWatchdog
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+class IOLoopWatchdogTest(AsyncTestCase):
+    def setUp(self):
+        super(IOLoopWatchdogTest, self).setUp()
+        self.watchdog = IOLoopWatchdog(threshold=0.1, interval=0.01)
+        self.watchdog.start(self.io_loop)
+
+    def tearDown(self):
+        self.watchdog.stop()
+        super(IOLoopWatchdogTest, self).tearDown()
+
+    @gen_test
+    def test_stall_is_reported_once_with_the_blocking_stack(self):
+        yield tornado.gen.sleep(0.05)
+        self.io_loop.add_callback(block_the_loop)
+        yield tornado.gen.sleep(0.1)
+        self.assertEqual(self.watchdog.get_stall_count(), 1)
+        self.assertTrue("block_the_loop" in self.watchdog.get_last_stall_stack())
+        self.assertTrue(self.watchdog.get_lag_percentile(100) >= 0.2)
+
+    @gen_test
+    def test_no_stall_when_the_loop_is_idle(self):
+        yield tornado.gen.sleep(0.2)
+        self.assertEqual(self.watchdog.get_stall_count(), 0)
+        self.assertTrue(self.watchdog.get_lag_percentile(50) < 0.1)
@@ -0,0 +1,77 @@
+import mock
+import signal
+from unittest import TestCase
+from arteria.web.app import AppService
+from arteria.web.workers import WorkerSupervisor, TooManyRestartsError
+
+# Wait statuses, as returned by os.wait
+KILLED = signal.SIGKILL
+TERMINATED = signal.SIGTERM
+FAILED = 1 << 8
+
+
+class WorkerSupervisorTest(TestCase):
+    def setUp(self):
+        # The supervisor installs signal handlers, which mustn't leak into the test process
+        patcher = mock.patch("signal.signal")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.kill = self.patch_os("kill")
+
+    def patch_os(self, name, **kwargs):
+        patcher = mock.patch("arteria.web.workers.os." + name, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_returns_the_worker_id_in_the_workers(self):
+        self.patch_os("fork", side_effect=[101, 0])
+        self.assertEqual(WorkerSupervisor(3).fork(), 1)
+
+    def test_restarts_workers_that_die(self):
+        fork = self.patch_os("fork", side_effect=[101, 102, 0])
+        self.patch_os("wait", side_effect=[(101, KILLED)])
+        # The restarted worker gets the id of the one that died
+        self.assertEqual(WorkerSupervisor(2).fork(), 0)
+        self.assertEqual(fork.call_count, 3)
+
+    def test_gives_up_after_too_many_restarts(self):
+        self.patch_os("fork", side_effect=[101, 102, 103])
+        self.patch_os("wait", side_effect=[(101, FAILED), (103, FAILED)])
+        self.assertRaises(TooManyRestartsError, WorkerSupervisor(2, max_restarts=1).fork)
+        self.kill.assert_called_once_with(102, signal.SIGTERM)
+
+    def test_forwards_signals_and_exits_when_the_workers_have(self):
+        supervisor = WorkerSupervisor(2)
+        fork = self.patch_os("fork", side_effect=[101, 102])
+
+        def wait_after_signals():
+            # SIGHUP reloads the config of the workers, and SIGTERM stops them
+            if self.kill.call_count == 0:
+                supervisor._forward_signal(signal.SIGHUP, None)
+                supervisor._forward_signal(signal.SIGTERM, None)
+                return 101, TERMINATED
+            return 102, TERMINATED
+        self.patch_os("wait", side_effect=wait_after_signals)
+
+        self.assertRaises(SystemExit, supervisor.fork)
+        self.assertEqual(sorted(self.kill.call_args_list),
+                         sorted(mock.call(pid, signum) for pid in (101, 102)
+                                for signum in (signal.SIGHUP, signal.SIGTERM)))
+        # Workers stopped by a forwarded signal aren't restarted
+        self.assertEqual(fork.call_count, 2)
+
+
+class WorkerLoggingTest(TestCase):
+    def test_each_worker_logs_to_files_of_its_own(self):
+        logger_config = {"version": 1, "disable_existing_loggers": False,
+                         "handlers": {"file_handler": {"class": "logging.FileHandler", "filename": "/log/app.log"},
+                                      "console": {"class": "logging.StreamHandler"}}}
+        config_svc = mock.MagicMock()
+        config_svc.get_logger_config.return_value = logger_config
+        with mock.patch("arteria.web.app.QueueLogging") as queue_logging:
+            app_svc = AppService(config_svc, False, 1234, workers=2)
+            app_svc._start_queue_logging(1)
+        worker_config = queue_logging.call_args[0][0]
+        self.assertEqual(worker_config["handlers"]["file_handler"]["filename"], "/log/app.log.worker1")
+        self.assertEqual(logger_config["handlers"]["file_handler"]["filename"], "/log/app.log")
+        queue_logging.return_value.configure.assert_called_with()
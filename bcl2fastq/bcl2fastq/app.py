@@ -4,8 +4,8 @@ import tornado.web
 from tornado.web import URLSpec as url
 import click
 
-from bcl2fastq.handlers.api_help_handlers import *
-from bcl2fastq.handlers.bcl2fastq_handlers import *
+from bcl2fastq.handlers.api_help_handlers import ApiHelpHandler
+from bcl2fastq.handlers.bcl2fastq_handlers import VersionsHandler, StartHandler, StatusHandler, StopHandler
 
 from bcl2fastq.lib.config import Config
 
@@ -19,17 +19,19 @@ def create_app(debug=False, auto_reload=False):
         url(r"/api/1.0/status/(\d*)", StatusHandler, name="status"),
         url(r"/api/1.0/stop/([\d|all]*)", StopHandler, name="stop")
     ],
-        debug=debug, auto_reload=auto_reload)
+        debug=debug, auto_reload=auto_reload, compress_response=True)
     return app
 
 @click.command()
 @click.option('--config', default="./bcl2fastq.config.yaml")
+@click.option('--config-cache', default=None,
+              help="Directory to cache the parsed config in, speeds up restarts")
 @click.option('--debug/--no-debug', default=False)
-def start(config, debug):
+def start(config, config_cache, debug):
 
     # This will ensure config is loaded through-out
     # the app.
-    Config.load_config(config)
+    Config.load_config(config, config_cache)
 
     # Start Tornado app.
     app = create_app(debug)
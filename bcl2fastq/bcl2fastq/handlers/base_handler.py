@@ -1,19 +1,39 @@
 
-import jsonpickle
 from tornado.web import RequestHandler
+from arteria.web.handlers import decode_body, RequestValidationError
+from arteria.web.serializers import encode_json
 
 class BaseHandler(RequestHandler):
     """
     Handler base class providing utility methods
     """
 
+    # The arteria.schema.Schema that body_as_object validates request bodies against, if any
+    request_schema = None
+
+    def body_as_object(self):
+        """
+        Decode the JSON body and validate it against the request_schema of the handler.
+        An empty body is read as an empty object.
+        :return: the decoded body, or a dict of the validated values if there is a schema
+        :raises RequestValidationError: which is written as a 400 with the errors per field
+        """
+        return decode_body(self.request.body, self.request_schema)
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None, None))[1]
+        if isinstance(error, RequestValidationError):
+            self.write_object(error.to_dict())
+        else:
+            super(BaseHandler, self).write_error(status_code, **kwargs)
+
     def write_object(self, obj):
         """
         Encode obj as json and write it.
         :param obj: to output as json
         :return: nothing
         """
-        resp = jsonpickle.encode(obj, unpicklable=False)
+        resp = encode_json(obj)
         self.write_json(resp)
 
     def write_json(self, json):
@@ -1,16 +1,11 @@
 
-from bcl2fastq.handlers.base_handler import BaseHandler
-from bcl2fastq.lib.jobrunner import LocalQAdapter
-from bcl2fastq.lib.bcl2fastq_utils import BCL2FastqRunnerFactory, Bcl2FastqConfig
-from bcl2fastq.lib.config import Config
-
-import json
 import logging
 
 from bcl2fastq.handlers.base_handler import BaseHandler
 from bcl2fastq.lib.jobrunner import LocalQAdapter
 from bcl2fastq.lib.bcl2fastq_utils import BCL2FastqRunnerFactory, Bcl2FastqConfig
 from bcl2fastq.lib.config import Config
+from arteria.schema import Schema, Field, string_types
 from arteria.web.state import State
 
 log = logging.getLogger(__name__)
@@ -68,6 +63,18 @@ class StartHandler(BaseHandler, Bcl2FastqServiceMixin):
     Start bcl2fastq
     """
 
+    # The parameters are passed on the bcl2fastq command line, so their sizes are limited.
+    # barcode_mismatches is accepted as a number or a string, and passed on as a string.
+    request_schema = Schema(
+        Field("bcl2fastq_version", string_types, default="", max_length=20),
+        Field("output", string_types, default="", max_length=4096),
+        Field("barcode_mismatches", (int, string_types), default="",
+              choices=[0, 1, 2, "0", "1", "2"], convert=str),
+        Field("tiles", string_types, default="", max_length=1000),
+        Field("use_base_mask", string_types, default="", max_length=1000),
+        Field("additional_args", string_types, default="", max_length=1000),
+        name="StartRequest")
+
     def create_config_from_request(self, runfolder, request_data):
         """
         For the specified runfolder, will look it up from the place setup in the
@@ -75,19 +82,11 @@ class StartHandler(BaseHandler, Bcl2FastqServiceMixin):
         This can be used to override any default setting in the resulting Bcl2FastqConfig
         instance.
         :param runfolder: name of the runfolder we want to create a config for
-        :param request_data: dict containing additional configurations
+        :param request_data: dict with the values validated by request_schema
         :return: an instances of Bcl2FastqConfig
         """
 
         # TODO Make sure to escape them for sec. reasons.
-        bcl2fastq_version = ""
-        runfolder_input = ""
-        output = ""
-        barcode_mismatches = ""
-        tiles = ""
-        use_base_mask = ""
-        additional_args = ""
-
         runfolder_base_path = Config.load_config()["runfolder_path"]
         runfolder_input = "{0}/{1}".format(runfolder_base_path, runfolder)
 
@@ -95,32 +94,14 @@ class StartHandler(BaseHandler, Bcl2FastqServiceMixin):
         if not p.isdir(runfolder_input):
             raise RuntimeError("No such file: {0}".format(runfolder_input))
 
-        if "bcl2fastq_version" in request_data:
-            bcl2fastq_version = request_data["bcl2fastq_version"]
-
-        if "output" in request_data:
-            output = request_data["output"]
-
-        if "barcode_mismatches" in request_data:
-            barcode_mismatches = request_data["barcode_mismatches"]
-
-        if "tiles" in request_data:
-            tiles = request_data["tiles"]
-
-        if "use_base_mask" in request_data:
-            use_base_mask = request_data["use_base_mask"]
-
-        if "additional_args" in request_data:
-            additional_args = request_data["additional_args"]
-
         config = Bcl2FastqConfig(
-            bcl2fastq_version,
+            request_data["bcl2fastq_version"],
             runfolder_input,
-            output,
-            barcode_mismatches,
-            tiles,
-            use_base_mask,
-            additional_args)
+            request_data["output"],
+            request_data["barcode_mismatches"],
+            request_data["tiles"],
+            request_data["use_base_mask"],
+            request_data["additional_args"])
 
         return config
 
@@ -136,14 +117,14 @@ class StartHandler(BaseHandler, Bcl2FastqServiceMixin):
          - use_base_mask
          - additional_args
         If these are not set defaults setup in Bcl2FastqConfig will be
-        used (and those should be good enough for most cases).
+        used (and those should be good enough for most cases). An invalid
+        body is rejected with 400, listing the errors per parameter.
 
         :param runfolder: name of the runfolder we want to start bcl2fastq for
         """
 
         try:
-            #TODO Make sure this works even if body is not set! /JD 20150820
-            runfolder_config = self.create_config_from_request(runfolder, json.loads(self.request.body))
+            runfolder_config = self.create_config_from_request(runfolder, self.body_as_object())
 
             cmd = self.bcl2fastq_cmd_generation_service().\
                 create_bcl2fastq_runner(runfolder_config).\
@@ -2,11 +2,19 @@ import subprocess
 import os.path
 from itertools import groupby
 
-from illuminate.metadata import InteropMetadata
-
 from bcl2fastq.lib.config import Config
 from bcl2fastq.lib.illumina import Samplesheet
 
+def read_interop_metadata(runfolder):
+    """
+    Reads the meta data of the runfolder. illuminate is imported here, rather than
+    at startup, since it imports pandas which takes seconds.
+    :param runfolder: to read the meta data of
+    :return: an illuminate InteropMetadata instance
+    """
+    from illuminate.metadata import InteropMetadata
+    return InteropMetadata(runfolder)
+
 class Bcl2FastqConfig:
     """
     Container for configurations for bcl2fastq.
@@ -67,7 +75,7 @@ class Bcl2FastqConfig:
         :return the version of bcl2fastq to use.
         """
 
-        meta_data = InteropMetadata(runfolder)
+        meta_data = read_interop_metadata(runfolder)
         model = meta_data.model
 
         current_config = config or Config.load_config()
@@ -83,7 +91,7 @@ class Bcl2FastqConfig:
         :return: a dict with the read number as key and the length of each index as value e.g.:
                  {2: 7, 3: 8}
         """
-        meta_data = InteropMetadata(runfolder)
+        meta_data = read_interop_metadata(runfolder)
         index_read_info = filter(lambda x: x["is_index"], meta_data.read_config)
         indexes_and_lengths = map(lambda x: (x["read_num"], x["cycles"]), index_read_info)
         return dict(indexes_and_lengths)
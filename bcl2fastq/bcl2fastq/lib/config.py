@@ -4,6 +4,7 @@ This has been adopted from https://github.com/SciLifeLab/TACA.
 
 import os
 import yaml
+from arteria.configuration import ConfigurationService, YamlLoader
 
 
 class Config:
@@ -15,11 +16,13 @@ class Config:
     CONFIG = {}
 
     @staticmethod
-    def load_config(config_file=None):
+    def load_config(config_file=None, cache_dir=None):
         """Loads a configuration file.
         By default it assumes ./config/bcl2fastq.conf.yaml
         If the config has already been loaded, just return it (without
         going back to disk to check it).
+        If cache_dir is set, the parsed config is cached there and reused
+        as long as the config file is unchanged.
         """
         if Config.CONFIG:
             return Config.CONFIG
@@ -27,7 +30,7 @@ class Config:
             try:
                 if not config_file:
                     config_file = os.path.join('./config/', 'bcl2fastq.config.yaml')
-                Config.CONFIG = Config._load_yaml_config(config_file)
+                Config.CONFIG = Config._load_yaml_config(config_file, cache_dir)
                 return Config.CONFIG
             except IOError:
                 raise IOError(("There was a problem loading the configuration file. "
@@ -35,20 +38,20 @@ class Config:
                         "read permissions".format(config_file)))
 
     @staticmethod
-    def _load_yaml_config(config_file):
+    def _load_yaml_config(config_file, cache_dir=None):
         """Load YAML config file
         :param str config_file: The path to the configuration file.
+        :param str cache_dir: Optional directory to cache the parsed config in.
         :returns: A dict of the parsed config file.
         :rtype: dict
         :raises IOError: If the config file cannot be opened.
         """
         if type(config_file) is file:
-            Config.CONFIG.update(yaml.load(config_file) or {})
+            Config.CONFIG.update(yaml.load(config_file, Loader=YamlLoader) or {})
             return Config.CONFIG
         else:
             try:
-                with open(config_file, 'r') as f:
-                    return yaml.load(f)
+                return ConfigurationService.read_yaml(config_file, cache_dir)
             except IOError as e:
                 e.message = "Could not open configuration file \"{}\".".format(config_file)
                 raise e
\ No newline at end of file
@@ -1,6 +1,4 @@
 
-from pandas import read_csv
-
 class SampleRow:
     """
     Provides a representation of the information presented in a Illumina Samplesheet.
@@ -86,6 +84,9 @@ class Samplesheet:
                              index1=row.get("index"), index2=row.get("index2"),
                              sample_project=row.get("Sample_Project"), description=row.get("Description"))
 
+        # pandas takes seconds to import, so it's only imported when a samplesheet is read
+        from pandas import read_csv
+
         lines_to_skip = find_data_line() + 1
         # Ensure that pointer is at beginning of file again.
         samplesheet_file_handle.seek(0)
@@ -0,0 +1,39 @@
+"""
+Compares decoding bcl2fastq start request bodies with jsonpickle, as
+BaseRestHandler.body_as_object used to, and with a plain JSON decode validated
+against StartHandler.request_schema.
+
+The payloads are like those sent by the processing workflows, with and without
+overridden parameters.
+
+Usage: python request_decoding_benchmark.py [requests]
+"""
+import json
+import sys
+import timeit
+import jsonpickle
+from arteria.web import serializers
+from arteria.web.handlers import decode_body
+from bcl2fastq.handlers.bcl2fastq_handlers import StartHandler
+
+PAYLOADS = [
+    {},
+    {"bcl2fastq_version": "2.15.2"},
+    {"bcl2fastq_version": "1.8.4", "barcode_mismatches": "1", "tiles": "s_1,s_2",
+     "use_base_mask": "--use-bases-mask 1:y*,6i,6i,y* --use-bases-mask y*,6i,6i,y*",
+     "output": "/data/biotank1/runfolders/150415_D00457_0091_AC6281ANXX/Unaligned"},
+    {"barcode_mismatches": 0, "additional_args": "--ignore-missing-bcl --ignore-missing-stats"},
+]
+
+
+def main(count):
+    bodies = [json.dumps(PAYLOADS[i % len(PAYLOADS)]).encode("utf-8") for i in range(count)]
+    cases = [("jsonpickle", lambda: [jsonpickle.decode(body) for body in bodies]),
+             ("decode_body ({0})".format("orjson" if serializers.orjson else "json"),
+              lambda: [decode_body(body, StartHandler.request_schema) for body in bodies])]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print("{0:<25} {1:8.2f} us per request".format(name, 1e6 * seconds / count))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
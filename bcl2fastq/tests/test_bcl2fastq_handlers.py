@@ -1,3 +1,4 @@
+import json
 from tornado.testing import *
 
 from tornado.escape import json_encode
@@ -35,6 +36,14 @@ class TestBcl2FastqHandlers(AsyncHTTPTestCase):
         response = self.fetch(self.API_BASE + "/start/150415_D00457_0091_AC6281ANXX", method="POST", body = "")
         self.assertEqual(response.code, 500)
 
+    def test_start_invalid_body(self):
+        body = {"barcode_mismatches": 5, "tiles": ["s_1"]}
+        response = self.fetch(self.API_BASE + "/start/150415_D00457_0091_AC6281ANXX", method="POST",
+                              body=json_encode(body))
+        self.assertEqual(response.code, 400)
+        errors = json.loads(response.body)["errors"]
+        self.assertEqual(sorted(error["field"] for error in errors), ["barcode_mismatches", "tiles"])
+
     def test_start(self):
         from bcl2fastq.lib.bcl2fastq_utils import BCL2FastqRunner
 
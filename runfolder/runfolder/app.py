@@ -1,18 +1,41 @@
+from arteria.web.admission import RouteLimit
 from arteria.web.app import AppService
-from runfolder.handlers import *
+from runfolder.handlers import ListAvailableRunfoldersHandler, NextAvailableRunfolderHandler, \
+    ClaimNextRunfolderHandler, RenewLeaseHandler, ReleaseRunfolderHandler, RunfolderHandler, \
+    RunfolderTransitionsHandler, TestFakeSequencerReadyHandler
+from runfolder.services import RunfolderService, CONFIG_SCHEMA
 
 def start():
-    app_svc = AppService.create(__package__)
-    runfolder_svc = RunfolderService(app_svc.config_svc)
+    app_svc = AppService.create(__package__, app_config_schema=CONFIG_SCHEMA)
+    config_svc = app_svc.config_svc
+    runfolder_svc = RunfolderService(config_svc,
+                                     rescan_interval=config_svc["index_rescan_interval"],
+                                     use_inotify=config_svc["use_inotify"],
+                                     scan_threads=config_svc["scan_threads"],
+                                     scan_runfolders_in_parallel=config_svc["scan_runfolders_in_parallel"],
+                                     scan_timeout=config_svc["scan_timeout"],
+                                     degraded_retry_interval=config_svc["degraded_retry_interval"],
+                                     state_database=config_svc["state_database"],
+                                     lease_seconds=config_svc["lease_seconds"])
 
     # Setup the routing. Help will be automatically available at /api, and will be based on
     # the doc strings of the get/post/put/delete methods
-    args = dict(runfolder_svc=runfolder_svc, config_svc=app_svc.config_svc)
+    args = dict(runfolder_svc=runfolder_svc, config_svc=config_svc)
     routes = [
         (r"/api/1.0/runfolders", ListAvailableRunfoldersHandler, args),
         (r"/api/1.0/runfolders/next", NextAvailableRunfolderHandler, args),
+        (r"/api/1.0/runfolders/claim", ClaimNextRunfolderHandler, args),
+        (r"/api/1.0/runfolders/lease/path(/.*)", RenewLeaseHandler, args),
+        (r"/api/1.0/runfolders/release/path(/.*)", ReleaseRunfolderHandler, args),
         (r"/api/1.0/runfolders/path(/.*)", RunfolderHandler, args),
+        (r"/api/1.0/runfolders/transitions/path(/.*)", RunfolderTransitionsHandler, args),
         (r"/api/1.0/runfolders/test/markasready/path(/.*)", TestFakeSequencerReadyHandler, args)
     ]
-    app_svc.start(routes)
+    # Listings are answered from the index, but encoding a large one still takes time on
+    # the IOLoop, so a burst of polling clients is turned away rather than allowed to slow
+    # down every request
+    route_limits = {
+        r"/api/1.0/runfolders": RouteLimit(max_concurrent=10)
+    }
+    app_svc.start(routes, route_limits)
 
@@ -0,0 +1,211 @@
+"""
+Claims of runfolders by the consumers processing them, which are safe across processes
+and hosts sharing the runfolders over NFS.
+
+A claim moves a runfolder from ready to started, and gives the consumer a lease, kept in
+.arteria/lease next to the state file. The consumer renews the lease while it works, and
+releases it with the final state when it's done. If the lease expires, e.g. because the
+consumer died, the next claim takes the runfolder over.
+
+Claims, renewals and releases of a runfolder are serialized by an fcntl lock on
+.arteria/claim.lock, which NFS supports through its lock manager, and by a thread lock,
+since fcntl locks are held per process. Lease expiry compares times from different hosts,
+so their clocks should be synchronized, e.g. by NTP.
+"""
+import contextlib
+import errno
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+_STATE_DIR = ".arteria"
+_LOCK_FILE = "claim.lock"
+_LEASE_FILE = "lease"
+
+# The states of RunfolderInfo that claims move between
+_STATE_READY = "ready"
+_STATE_STARTED = "started"
+
+
+class Lease:
+    """A consumer's claim of a runfolder, valid until expires_at, in seconds since the epoch"""
+
+    def __init__(self, lease_id, owner, host, expires_at):
+        self.lease_id = lease_id
+        self.owner = owner
+        self.host = host
+        self.expires_at = expires_at
+
+    def is_expired(self, now=None):
+        return (now or time.time()) >= self.expires_at
+
+    def to_dict(self):
+        return {"lease_id": self.lease_id, "owner": self.owner, "host": self.host,
+                "expires_at": self.expires_at}
+
+    @staticmethod
+    def from_dict(obj):
+        return Lease(obj["lease_id"], obj["owner"], obj["host"], obj["expires_at"])
+
+
+class RunfolderClaims:
+    """Claims runfolders with compare-and-set of their state, and manages the leases"""
+
+    def __init__(self, get_state, set_state, host, lease_seconds=600, logger=None):
+        """
+        :param get_state: Reads the state of the runfolder at a path from the file system
+        :param set_state: Sets the state of the runfolder at a path
+        :param host: The name of this host, recorded in the leases
+        :param lease_seconds: The default number of seconds a lease is valid
+        :param logger: The logger instance to use. Will default to one named like the module
+        """
+        self._get_state = get_state
+        self._set_state = set_state
+        self._host = host
+        self._lease_seconds = lease_seconds
+        self._logger = logger or logging.getLogger(__name__)
+        # Path -> [thread lock, number of threads using it]
+        self._thread_locks = {}
+        self._thread_locks_lock = threading.Lock()
+
+    def try_claim(self, path, owner, lease_seconds=None):
+        """
+        Claims the runfolder if it's ready, or if it's started but its lease has expired.
+        Returns the Lease, or None if the runfolder is not claimable or someone else is
+        claiming it right now.
+        """
+        with self._locked(path, blocking=False) as locked:
+            if not locked:
+                return None
+            state = self._get_state(path)
+            lease = self.get_lease(path)
+            now = time.time()
+            if state == _STATE_READY:
+                if lease is not None and not lease.is_expired(now):
+                    return None
+            elif state == _STATE_STARTED and lease is not None and lease.is_expired(now):
+                self._logger.warning("Reclaiming {0}, the lease of {1}@{2} expired at {3}".format(
+                    path, lease.owner, lease.host, lease.expires_at))
+            else:
+                return None
+
+            claimed = Lease(uuid.uuid4().hex, owner, self._host, now + (lease_seconds or self._lease_seconds))
+            # The lease is written before the state, so that a crash in between leaves a
+            # ready runfolder that's claimable once the lease expires, rather than a started
+            # one that's never reclaimed
+            self._write_lease(path, claimed)
+            if state != _STATE_STARTED:
+                self._set_state(path, _STATE_STARTED)
+        self._logger.info("{0}@{1} claimed {2}".format(owner, self._host, path))
+        return claimed
+
+    def renew(self, path, lease_id, lease_seconds=None):
+        """
+        Extends the lease. A lease that has expired can still be renewed, unless the
+        runfolder has been claimed by someone else.
+
+        :raises LeaseLost
+        """
+        with self._locked(path):
+            lease = self._get_lease_or_raise(path, lease_id)
+            lease.expires_at = time.time() + (lease_seconds or self._lease_seconds)
+            self._write_lease(path, lease)
+        return lease
+
+    def release(self, path, lease_id, state):
+        """
+        Sets the state of the runfolder, e.g. to done or error when it has been processed,
+        and removes the lease
+
+        :raises LeaseLost
+        """
+        with self._locked(path):
+            self._get_lease_or_raise(path, lease_id)
+            self._set_state(path, state)
+            os.remove(os.path.join(path, _STATE_DIR, _LEASE_FILE))
+        self._logger.info("Released {0}, setting its state to {1}".format(path, state))
+
+    def get_lease(self, path):
+        """Returns the lease of the runfolder, which may have expired, or None"""
+        try:
+            with open(os.path.join(path, _STATE_DIR, _LEASE_FILE)) as f:
+                return Lease.from_dict(json.load(f))
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        except (ValueError, KeyError, TypeError):
+            self._logger.warning("Ignoring the invalid lease of {0}".format(path))
+            return None
+
+    def _get_lease_or_raise(self, path, lease_id):
+        lease = self.get_lease(path)
+        if lease is None or lease.lease_id != lease_id:
+            raise LeaseLost("The lease {0} of {1} is no longer held".format(lease_id, path))
+        return lease
+
+    def _write_lease(self, path, lease):
+        """Writes the lease to a temporary file that replaces the lease file, so it's never read half written"""
+        lease_file = os.path.join(path, _STATE_DIR, _LEASE_FILE)
+        tmp_file = "{0}.{1}.tmp".format(lease_file, lease.lease_id)
+        with open(tmp_file, "w") as f:
+            json.dump(lease.to_dict(), f)
+        os.rename(tmp_file, lease_file)
+
+    @contextlib.contextmanager
+    def _locked(self, path, blocking=True):
+        """Locks the runfolder against claims by other threads, processes and hosts. Yields whether it's locked."""
+        # The thread locks are counted by their users, and removed when the last one is done,
+        # so that they don't pile up for every runfolder ever claimed
+        with self._thread_locks_lock:
+            entry = self._thread_locks.get(path)
+            if entry is None:
+                entry = self._thread_locks[path] = [threading.Lock(), 0]
+            entry[1] += 1
+        thread_lock = entry[0]
+        try:
+            if not thread_lock.acquire(blocking):
+                yield False
+                return
+            try:
+                with self._locked_file(path, blocking) as locked:
+                    yield locked
+            finally:
+                thread_lock.release()
+        finally:
+            with self._thread_locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._thread_locks[path]
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _locked_file(path, blocking):
+        """Locks the runfolder's lock file against other processes and hosts. Yields whether it's locked."""
+        state_dir = os.path.join(path, _STATE_DIR)
+        try:
+            os.makedirs(state_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd = os.open(os.path.join(state_dir, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o664)
+        try:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                yield False
+                return
+            yield True
+        finally:
+            # Closing the file releases the lock
+            os.close(fd)
+
+
+class LeaseLost(Exception):
+    pass
@@ -1,6 +1,11 @@
 import arteria
+from arteria.schema import Schema, Field, string_types
 from arteria.web.handlers import BaseRestHandler
-from runfolder.services import *
+from arteria.web.serializers import encode_json
+from runfolder.claims import LeaseLost
+from runfolder.services import PathNotMonitored, DirectoryDoesNotExist, MonitoredDirectoryDegraded, \
+    StateDatabaseNotConfigured, RunfolderInfo
+import tornado.gen
 import tornado.web
 
 class BaseRunfolderHandler(BaseRestHandler):
@@ -11,29 +16,136 @@ class BaseRunfolderHandler(BaseRestHandler):
     def create_runfolder_link(self, path):
         return "{0:s}/runfolders/path{1:s}".format(self.api_link(), path)
 
+    def with_runfolder_links(self, runfolder_infos):
+        """Appends the link to each runfolder while it's being iterated"""
+        for runfolder_info in runfolder_infos:
+            self.append_runfolder_link(runfolder_info)
+            yield runfolder_info
+
     def initialize(self, runfolder_svc, config_svc):
         self.runfolder_svc = runfolder_svc
         self.config_svc = config_svc
 
 class ListAvailableRunfoldersHandler(BaseRunfolderHandler):
     """Handles listing all available runfolders"""
+    @tornado.gen.coroutine
     def get(self):
-        """List all available runfolders"""
-        runfolder_infos = list(self.runfolder_svc.list_available_runfolders())
-        for runfolder_info in runfolder_infos:
-            self.append_runfolder_link(runfolder_info)
+        """
+        List all available runfolders, and the health of each monitored directory.
+        The runfolders in degraded monitored directories, which don't respond, are left out.
 
-        self.write_object(runfolder_infos)
+        With the state argument, e.g. ?state=started, the runfolders in that state are
+        listed instead.
+        """
+        state = self.get_argument("state", RunfolderInfo.STATE_READY)
+        if state not in RunfolderInfo.STATES:
+            raise tornado.web.HTTPError(400, "Unknown state '{0}'".format(state))
+        # Clients polling with If-None-Match get a 304 until a runfolder or the health changes
+        if self.check_etag_version(self.runfolder_svc.get_version()):
+            return
+        runfolder_infos, health = yield self.run_in_thread(
+            lambda: (self.runfolder_svc.get_runfolders_in_state(state), self.runfolder_svc.get_health()))
+        self.write('{"runfolders":')
+        yield self.write_stream(self.with_runfolder_links(runfolder_infos))
+        self.write(',"health":')
+        self.write(encode_json(health))
+        self.write("}")
 
 class NextAvailableRunfolderHandler(BaseRunfolderHandler):
+    @tornado.gen.coroutine
     def get(self):
         """Returns the next runfolder to process"""
-        runfolder_info = self.runfolder_svc.next_runfolder()
-        self.append_runfolder_link(runfolder_info)
+        runfolder_info = yield self.run_in_thread(self.runfolder_svc.next_runfolder)
+        if runfolder_info:
+            self.append_runfolder_link(runfolder_info)
         self.write_object(runfolder_info)
 
+class ClaimNextRunfolderHandler(BaseRunfolderHandler):
+    request_schema = Schema(
+        Field("owner", string_types, default="", max_length=200),
+        Field("lease_seconds", (int, float), min_value=1, max_value=7 * 24 * 3600),
+        name="ClaimRequest")
+
+    @tornado.gen.coroutine
+    def post(self):
+        """
+        Claims the next runfolder to process, moving it from ready to started, and returns
+        it with a lease. Each runfolder is only claimed by one consumer, even when several
+        poll at once. The lease should be renewed while the runfolder is processed, and
+        the runfolder released when it's done. If the lease expires, the runfolder is given
+        to the next consumer. Returns null if there's no runfolder to claim.
+
+        Body: {"owner": "<consumer name>", "lease_seconds": <optional duration>}
+        """
+        request_data = self.body_as_object()
+        claim = yield self.run_in_thread(self.runfolder_svc.claim_next_runfolder,
+                                         request_data["owner"], request_data["lease_seconds"])
+        if claim is None:
+            self.write_object(None)
+            return
+        runfolder_info, lease = claim
+        self.append_runfolder_link(runfolder_info)
+        self.write_object(dict(runfolder_info.to_dict(), lease=lease.to_dict()))
+
+class BaseLeaseHandler(BaseRunfolderHandler):
+    """Maps the errors of the lease operations on a runfolder to status codes"""
+    @tornado.gen.coroutine
+    def run_lease_operation(self, fn, path, *args):
+        try:
+            result = yield self.run_in_thread(fn, path, *args)
+        except PathNotMonitored:
+            raise tornado.web.HTTPError(400, "Path {0} is not monitored".format(path))
+        except MonitoredDirectoryDegraded:
+            raise tornado.web.HTTPError(503, "The monitored directory of '{0}' is not responding".format(path))
+        except LeaseLost:
+            raise tornado.web.HTTPError(409, "The lease of '{0}' is no longer held".format(path))
+        raise tornado.gen.Return(result)
+
+class RenewLeaseHandler(BaseLeaseHandler):
+    request_schema = Schema(
+        Field("lease_id", string_types, required=True, max_length=64),
+        Field("lease_seconds", (int, float), min_value=1, max_value=7 * 24 * 3600),
+        name="RenewLeaseRequest")
+
+    @tornado.gen.coroutine
+    def put(self, path):
+        """
+        Renews the lease of a claimed runfolder. Returns 409 if the runfolder has been
+        released, or claimed by someone else after the lease expired.
+
+        Body: {"lease_id": "<id>", "lease_seconds": <optional duration>}
+        """
+        request_data = self.body_as_object()
+        lease = yield self.run_lease_operation(self.runfolder_svc.renew_lease, path,
+                                               request_data["lease_id"], request_data["lease_seconds"])
+        self.write_object(lease.to_dict())
+
+class ReleaseRunfolderHandler(BaseLeaseHandler):
+    request_schema = Schema(
+        Field("lease_id", string_types, required=True, max_length=64),
+        Field("state", string_types, required=True, choices=(
+            RunfolderInfo.STATE_DONE, RunfolderInfo.STATE_ERROR, RunfolderInfo.STATE_READY)),
+        name="ReleaseRequest")
+
+    @tornado.gen.coroutine
+    def post(self, path):
+        """
+        Releases a claimed runfolder, setting its state to done, error or ready. Returns 409
+        if the runfolder has been released, or claimed by someone else after the lease expired.
+
+        Body: {"lease_id": "<id>", "state": "done"}
+        """
+        request_data = self.body_as_object()
+        yield self.run_lease_operation(self.runfolder_svc.release_runfolder, path,
+                                       request_data["lease_id"], request_data["state"])
+
 class RunfolderHandler(BaseRunfolderHandler):
     """Handles a particular runfolder, identified by path"""
+    request_schema = Schema(
+        Field("state", string_types, required=True, choices=RunfolderInfo.STATES),
+        name="RunfolderStateRequest")
+
+    @tornado.gen.coroutine
     def get(self, path):
         """
         Returns information about the runfolder at the path.
@@ -41,21 +153,44 @@ class RunfolderHandler(BaseRunfolderHandler):
         The runfolder must a subdirectory of a monitored path.
         """
         try:
-            runfolder_info = self.runfolder_svc.get_runfolder_by_path(path)
+            runfolder_info = yield self.run_in_thread(self.runfolder_svc.get_runfolder_by_path, path)
             self.append_runfolder_link(runfolder_info)
             self.write_object(runfolder_info)
         except PathNotMonitored:
             raise tornado.web.HTTPError(400, "Searching an unmonitored path '{0}'".format(path))
         except DirectoryDoesNotExist:
             raise tornado.web.HTTPError(404, "Runfolder '{0}' does not exist".format(path))
+        except MonitoredDirectoryDegraded:
+            raise tornado.web.HTTPError(503, "The monitored directory of '{0}' is not responding".format(path))
 
+    @tornado.gen.coroutine
     def post(self, path):
         """
-        Sets the state of the runfolder
+        Sets the state of the runfolder at the path, and returns the runfolder
+
+        Body: {"state": "<ready, started, done, error or none>"}
         """
-        self.runfolder_svc.set_runfolder_state(path, "TODO")
+        request_data = self.body_as_object()
+
+        def set_state():
+            # Makes sure it's a runfolder in a monitored directory before writing its state file
+            self.runfolder_svc.get_runfolder_by_path(path)
+            self.runfolder_svc.set_runfolder_state(path, request_data["state"])
+            return self.runfolder_svc.get_runfolder_by_path(path)
+
+        try:
+            runfolder_info = yield self.run_in_thread(set_state)
+        except PathNotMonitored:
+            raise tornado.web.HTTPError(400, "Path {0} is not monitored".format(path))
+        except DirectoryDoesNotExist:
+            raise tornado.web.HTTPError(404, "Runfolder '{0}' does not exist".format(path))
+        except MonitoredDirectoryDegraded:
+            raise tornado.web.HTTPError(503, "The monitored directory of '{0}' is not responding".format(path))
+        self.append_runfolder_link(runfolder_info)
+        self.write_object(runfolder_info)
 
     @arteria.undocumented
+    @tornado.gen.coroutine
     def put(self, path):
         """
         NOTE: put is provided for test purposes only.
@@ -63,10 +198,24 @@ class RunfolderHandler(BaseRunfolderHandler):
         TODO: Discuss if it should be disabled in production
         """
         try:
-            self.runfolder_svc.create_runfolder(path)
+            yield self.run_in_thread(self.runfolder_svc.create_runfolder, path)
         except PathNotMonitored:
             raise tornado.web.HTTPError("400", "Path {0} is not monitored".format(path))
 
+class RunfolderTransitionsHandler(BaseRunfolderHandler):
+    """Handles the state history of a runfolder, identified by path"""
+    @tornado.gen.coroutine
+    def get(self, path):
+        """
+        Returns the state transitions of the runfolder at the path, oldest first.
+        Requires a state_database in the config.
+        """
+        try:
+            transitions = yield self.run_in_thread(self.runfolder_svc.get_state_transitions, path)
+        except StateDatabaseNotConfigured:
+            raise tornado.web.HTTPError(501, "No state database is configured")
+        self.write_object({"path": path, "transitions": transitions})
+
 class TestFakeSequencerReadyHandler(BaseRunfolderHandler):
     """
     Handles setting the sequencing finished marker
@@ -75,10 +224,11 @@ class TestFakeSequencerReadyHandler(BaseRunfolderHandler):
     """
 
     @arteria.undocumented
+    @tornado.gen.coroutine
     def put(self, path):
         """
         Marks the runfolder at the path as ready
         """
-        self.runfolder_svc.add_sequencing_finished_marker(path)
+        yield self.run_in_thread(self.runfolder_svc.add_sequencing_finished_marker, path)
 
 
@@ -0,0 +1,697 @@
+"""
+An in-memory index of the runfolders in the monitored directories and their states,
+kept up to date by a background thread, so that requests don't scan the file system.
+
+The thread is notified of changes by inotify where it's available. Since inotify doesn't
+see changes made on other hosts to network file systems like NFS, the thread also
+rescans the monitored directories every rescan_interval seconds. A rescan only lists a
+monitored directory if its mtime changed, and only reads the state of a runfolder if
+the mtime of its directory or state file changed.
+
+Each monitored directory is scanned by threads of its own, with a deadline, so that
+a hung mount only holds up its own threads. A monitored directory that times out or
+fails is marked degraded: its runfolders are left out, and it's retried with
+exponential backoff.
+
+With a RunfolderStateStore, the states and mtimes read are saved to it, and the index
+starts from the saved ones, so that a restart only reads the runfolders that changed.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from runfolder import inotify
+
+# The runfolder files that determine its state
+_STATE_DIR = ".arteria"
+_STATE_FILE = "state"
+_COMPLETED_MARKER = "RTAComplete.txt"
+
+# mtimes this close to the time they were read may be followed by changes within the
+# same mtime tick on file systems with coarse timestamps, so they aren't trusted
+_RACY_SECONDS = 2
+
+_ROOT_EVENTS = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | \
+    inotify.IN_ONLYDIR
+_RUNFOLDER_EVENTS = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_CLOSE_WRITE | \
+    inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | inotify.IN_ONLYDIR
+_STATE_DIR_EVENTS = _RUNFOLDER_EVENTS | inotify.IN_MODIFY
+
+# The number of runfolders checked by a scan thread at a time
+_CHUNK_SIZE = 100
+
+
+class _Runfolder(object):
+    __slots__ = ("state", "dir_mtime", "state_mtime")
+
+    def __init__(self, state, dir_mtime, state_mtime):
+        self.state = state
+        self.dir_mtime = dir_mtime
+        self.state_mtime = state_mtime
+
+
+class _Workers(object):
+    """
+    Daemon threads running the work submitted to them, in order. Unlike the threads of a
+    ThreadPoolExecutor, which are joined when the interpreter exits, a thread stuck on a
+    hung mount doesn't keep the process from exiting.
+    """
+
+    def __init__(self, threads, name):
+        self._queue = queue.Queue()
+        self._threads = []
+        for index in range(threads):
+            thread = threading.Thread(target=self._work, name="{0}-{1}".format(name, index))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn):
+        """Returns a concurrent.futures.Future of the result of calling fn"""
+        future = Future()
+        self._queue.put((future, fn))
+        return future
+
+    def shutdown(self):
+        """Lets the threads exit once they have finished the work submitted, without waiting for them"""
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def _work(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            future, fn = work
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn()
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _Root(object):
+    """A monitored directory, the runfolders in it, and its health"""
+
+    OK = "ok"
+    DEGRADED = "degraded"
+    UNKNOWN = "unknown"
+
+    def __init__(self, path, threads):
+        self.mtime = None
+        self.runfolders = {}
+        # Only these threads touch the monitored directory, so if it hangs, nothing else does
+        self.workers = _Workers(threads, "RunfolderIndex-{0}".format(os.path.basename(path)))
+        self.futures = []
+        self.status = _Root.UNKNOWN
+        self.error = None
+        self.failures = 0
+        self.checked_at = None
+        self.scan_seconds = None
+        self.retry_at = None
+
+    def is_busy(self):
+        """Returns True if work submitted earlier hasn't finished, e.g. because the mount hangs"""
+        self.futures = [future for future in self.futures if not future.done()]
+        return bool(self.futures)
+
+    def get_health(self):
+        return {"status": self.status, "error": self.error, "failures": self.failures,
+                "checked_at": self.checked_at, "scan_seconds": self.scan_seconds,
+                "retry_at": self.retry_at if self.status == _Root.DEGRADED else None}
+
+
+class RunfolderIndex:
+    """
+    Keeps the state of every runfolder in the monitored directories in memory.
+
+    The thread is started by the first call to any of the methods, so that it runs in
+    the worker process that uses it when the service forks worker processes. The first
+    calls wait until the monitored directories have been scanned once.
+
+    Usage example:
+        index = RunfolderIndex(lambda: config["monitored_directories"], os.listdir, get_state)
+        index.get_runfolders_in_state("ready")
+    """
+
+    def __init__(self, get_monitored_directories, list_directory, get_state,
+                 rescan_interval=10, use_inotify=True, scan_threads=4, scan_subdirectories=True,
+                 scan_timeout=30, retry_interval=10, max_retry_interval=600, store=None, logger=None):
+        """
+        :param get_monitored_directories: Returns the monitored directories, called on each rescan
+        :param list_directory: Returns the names of the entries in a directory
+        :param get_state: Reads the state of the runfolder at a path from the file system
+        :param rescan_interval: Seconds between rescans of the monitored directories
+        :param use_inotify: If False, changes are only found by the rescans
+        :param scan_threads: The number of threads scanning each monitored directory
+        :param scan_subdirectories: If True, the runfolders in a monitored directory are
+                                    scanned concurrently, otherwise one at a time
+        :param scan_timeout: Seconds a monitored directory may take to scan before it's
+                             marked degraded
+        :param retry_interval: Seconds before a degraded monitored directory is scanned again.
+                               Doubled for each failure in a row, up to max_retry_interval.
+        :param max_retry_interval: The maximum number of seconds between retries
+        :param store: An optional runfolder.state_store.RunfolderStateStore that the states are
+                      saved to, and loaded from on start
+        :param logger: The logger instance to use. Will default to one named like the module
+        """
+        self._get_monitored_directories = get_monitored_directories
+        self._list_directory = list_directory
+        self._get_state = get_state
+        self._rescan_interval = rescan_interval
+        self._use_inotify = use_inotify
+        self._scan_threads = scan_threads if scan_subdirectories else 1
+        self._scan_subdirectories = scan_subdirectories
+        self._scan_timeout = scan_timeout
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._store = store
+        self._logger = logger or logging.getLogger(__name__)
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def get_runfolders_in_state(self, state):
+        """
+        Returns the paths of the runfolders in the state, in order of monitored directory
+        and name. Runfolders in degraded monitored directories are left out.
+        """
+        self._ensure_started()
+        self._scanned.wait()
+        with self._lock:
+            if state not in self._sorted_by_state:
+                self._sorted_by_state[state] = sorted(
+                    (path for path in self._by_state.get(state, ()) if not self._in_degraded_root(path)),
+                    key=self._sort_key)
+            return list(self._sorted_by_state[state])
+
+    def get_health(self):
+        """
+        Returns the health of each monitored directory, as a dict of dicts with the status
+        (ok, degraded or unknown before the first scan), the error of the last failure, the
+        number of failures in a row, when it was last checked, how long the scan took, and
+        when a degraded monitored directory is retried
+        """
+        self._ensure_started()
+        self._scanned.wait()
+        with self._lock:
+            return dict((root_path, root.get_health()) for root_path, root in self._roots.items())
+
+    def is_degraded(self, path):
+        """Returns True if the path is in a degraded monitored directory"""
+        self._ensure_started()
+        with self._lock:
+            return self._in_degraded_root(path)
+
+    def get_version(self):
+        """
+        Returns a hash of the runfolders, their states and the health statuses of the
+        monitored directories. Since it's derived from the content, worker processes with
+        indexes of their own, and restarted ones, agree on it.
+        """
+        self._ensure_started()
+        with self._lock:
+            if self._version is None or self._version[0] != self._counter:
+                self._version = (self._counter, self._hash_content())
+            return self._version[1]
+
+    def update(self, path):
+        """
+        Reads the state of the runfolder at the path right away, e.g. after the service
+        changed it. Paths outside of the monitored directories are ignored.
+        """
+        self._ensure_started()
+        self._scanned.wait()
+        path = os.path.normpath(path)
+        root = self._roots.get(os.path.dirname(path))
+        if root is not None and root.status != _Root.DEGRADED:
+            self._update_runfolder(os.path.dirname(path), path)
+
+    def stop(self):
+        if self._pid == os.getpid():
+            self._stopping.set()
+            self._thread.join()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._lock = threading.Lock()
+            self._roots = {}
+            self._root_order = {}
+            self._by_state = {}
+            self._sorted_by_state = {}
+            # Counts the changes, so that the version is only hashed again after one
+            self._counter = 0
+            self._version = None
+            self._scanned = threading.Event()
+            self._stopping = threading.Event()
+            self._inotify = self._create_inotify()
+            # Watched path -> (watch descriptor, kind of path, monitored directory)
+            self._watches = {}
+            self._watch_lock = threading.Lock()
+            self._thread = threading.Thread(target=self._run, name="RunfolderIndex")
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _create_inotify(self):
+        if not self._use_inotify or not inotify.is_available():
+            return None
+        try:
+            return inotify.Inotify()
+        except OSError as e:
+            self._logger.warning("Not able to use inotify, only rescanning: {0}".format(e))
+            return None
+
+    def _run(self):
+        try:
+            self._load_store()
+        except Exception:
+            self._logger.exception("Failed to load the saved runfolder states, reading them all")
+        try:
+            self._rescan()
+        except Exception:
+            self._logger.exception("Failed to scan the monitored directories")
+        finally:
+            self._scanned.set()
+
+        next_rescan = time.time() + self._rescan_interval
+        while not self._stopping.is_set():
+            timeout = max(0, next_rescan - time.time())
+            try:
+                if self._inotify is not None:
+                    self._handle_events(self._inotify.read_events(min(timeout, 1)))
+                else:
+                    self._stopping.wait(timeout)
+                if time.time() >= next_rescan:
+                    self._rescan()
+                    next_rescan = time.time() + self._rescan_interval
+            except Exception:
+                self._logger.exception("Failed to update the runfolder index")
+                self._stopping.wait(1)
+
+        if self._inotify is not None:
+            self._inotify.close()
+        for root in self._roots.values():
+            root.workers.shutdown()
+
+    def _rescan(self, force=False):
+        """
+        Lists the monitored directories whose mtime changed, and reads the states of the
+        runfolders whose directory or state file changed. If force is True, everything is read.
+
+        The monitored directories are scanned concurrently, each by its own threads, so that
+        slow mounts are waited for at the same time rather than one after another. Monitored
+        directories that don't finish within scan_timeout, or fail, are marked degraded.
+        Degraded ones are skipped until they are due for a retry.
+        """
+        monitored_directories = [os.path.normpath(d) for d in self._get_monitored_directories()]
+        for removed in set(self._roots) - set(monitored_directories):
+            self._remove_root(removed)
+        with self._lock:
+            self._root_order = dict((root, index) for index, root in enumerate(monitored_directories))
+            for root_path in monitored_directories:
+                if root_path not in self._roots:
+                    self._roots[root_path] = _Root(root_path, self._scan_threads)
+
+        started_at = time.time()
+        deadline = started_at + self._scan_timeout
+        futures = {}
+        listings = {}
+        listed_mtimes = {}
+        finished_at = {}
+        for root_path in monitored_directories:
+            if self._is_due(root_path, started_at):
+                future = self._submit(root_path, lambda root_path=root_path: self._list_root(root_path, force))
+                futures[root_path] = [future]
+                listings[future] = root_path
+
+        # The runfolders of a monitored directory are checked as soon as it has been listed,
+        # so that a hung one doesn't hold up the others
+        pending = set(listings)
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                root_path = future.root_path
+                finished_at[root_path] = time.time()
+                if future in listings and future.exception() is None:
+                    listing = future.result()
+                    if listing is not None:
+                        listed_mtimes[root_path] = listing[0]
+                    for task in self._check_tasks(root_path, listing, force):
+                        check = self._submit(root_path, task)
+                        futures[root_path].append(check)
+                        pending.add(check)
+
+        for root_path, root_futures in futures.items():
+            if not all(future.done() for future in root_futures):
+                for future in root_futures:
+                    future.cancel()
+                self._set_degraded(root_path, "Timed out after {0} seconds".format(self._scan_timeout))
+                continue
+            errors = [future.exception() for future in root_futures if future.exception() is not None]
+            if errors:
+                self._set_degraded(root_path, "{0}: {1}".format(type(errors[0]).__name__, errors[0]))
+            else:
+                # Only now that every runfolder in the listing has been read is the mtime
+                # recorded. Otherwise the runfolders that failed, or weren't read by the
+                # deadline, wouldn't be listed again until the directory changed.
+                if root_path in listed_mtimes:
+                    self._roots[root_path].mtime = listed_mtimes[root_path]
+                self._set_healthy(root_path, finished_at[root_path] - started_at)
+
+    def _submit(self, root_path, fn):
+        """Calls fn in the threads of the monitored directory, and returns the future"""
+        root = self._roots[root_path]
+        future = root.workers.submit(fn)
+        future.root_path = root_path
+        root.futures.append(future)
+        return future
+
+    def _check_tasks(self, root_path, listing, force):
+        """
+        Updates the runfolders of the monitored directory from its listing, if it was
+        listed, and returns the tasks checking the runfolders that may have changed.
+        The mtime of the listing is recorded by the caller, once the tasks have succeeded.
+        """
+        root = self._roots[root_path]
+        with self._lock:
+            runfolders = list(root.runfolders)
+        added = []
+        if listing is not None:
+            _, paths = listing
+            for removed in set(runfolders) - paths:
+                self._remove_runfolder(root_path, removed)
+            added = sorted(paths - set(runfolders))
+            runfolders = [path for path in runfolders if path in paths]
+        items = [(path, True) for path in added] + [(path, False) for path in runfolders]
+        return [lambda chunk=chunk: self._check_runfolders(root_path, chunk, force)
+                for chunk in self._chunks(items)]
+
+    def _chunks(self, items):
+        """
+        Splits the runfolders of a monitored directory into tasks. With concurrent scanning,
+        they are checked in chunks, to keep the overhead per runfolder low.
+        """
+        if not self._scan_subdirectories:
+            return [items] if items else []
+        if len(items) <= _CHUNK_SIZE:
+            return [[item] for item in items]
+        return [items[i:i + _CHUNK_SIZE] for i in range(0, len(items), _CHUNK_SIZE)]
+
+    def _is_due(self, root_path, now):
+        """Returns True if the monitored directory should be scanned now"""
+        root = self._roots[root_path]
+        if root.is_busy():
+            # The threads are still stuck in an earlier scan
+            if root.status != _Root.DEGRADED:
+                self._set_degraded(root_path, "Still busy with an earlier scan")
+            return False
+        return root.status != _Root.DEGRADED or now >= root.retry_at
+
+    def _set_healthy(self, root_path, scan_seconds):
+        with self._lock:
+            root = self._roots.get(root_path)
+            if root is None:
+                return
+            recovered = root.status == _Root.DEGRADED
+            root.status = _Root.OK
+            root.error = None
+            root.failures = 0
+            root.checked_at = time.time()
+            root.scan_seconds = scan_seconds
+            if recovered:
+                self._health_changed()
+        if recovered:
+            self._logger.info("Monitored directory {0} has recovered".format(root_path))
+
+    def _set_degraded(self, root_path, error):
+        with self._lock:
+            root = self._roots.get(root_path)
+            if root is None:
+                return
+            degraded = root.status != _Root.DEGRADED
+            root.status = _Root.DEGRADED
+            root.error = error
+            root.failures += 1
+            root.checked_at = time.time()
+            root.retry_at = root.checked_at + min(self._max_retry_interval,
+                                                  self._retry_interval * 2 ** (root.failures - 1))
+            if degraded:
+                self._health_changed()
+        self._logger.warning("Monitored directory {0} is degraded, retrying in {1:.0f} seconds: {2}".format(
+            root_path, root.retry_at - root.checked_at, error))
+
+    def _health_changed(self):
+        """Called with the lock held when a monitored directory becomes degraded or recovers"""
+        self._sorted_by_state = {}
+        self._counter += 1
+
+    def _hash_content(self):
+        """Called with the lock held. Hashes the runfolders by state and the degraded monitored directories."""
+        content = hashlib.sha1()
+        for state in sorted(self._by_state):
+            for path in sorted(self._by_state[state]):
+                content.update("{0}\t{1}\n".format(path, state).encode("utf-8"))
+        for root_path in sorted(self._roots):
+            if self._roots[root_path].status == _Root.DEGRADED:
+                content.update("degraded\t{0}\n".format(root_path).encode("utf-8"))
+        return content.hexdigest()
+
+    def _in_degraded_root(self, path):
+        root = self._roots.get(os.path.dirname(os.path.normpath(path)))
+        if root is None:
+            # Not directly in a monitored directory, e.g. a path below a runfolder
+            for root_path, candidate in self._roots.items():
+                if path.startswith(root_path + os.sep):
+                    root = candidate
+                    break
+        return root is not None and root.status == _Root.DEGRADED
+
+    def _list_root(self, root_path, force):
+        """
+        Returns the mtime of the monitored directory and the paths in it, or None if
+        its mtime hasn't changed since it was last listed
+        """
+        self._add_watch(root_path, _ROOT_EVENTS, "root", root_path)
+        mtime = _get_mtime(root_path)
+        if not force and mtime is not None and mtime == self._roots[root_path].mtime:
+            return None
+        return mtime, set(os.path.join(root_path, name) for name in self._list_directory(root_path))
+
+    def _check_runfolders(self, root_path, items, force):
+        """
+        Reads the states of the runfolders that are new, or whose directory or state file
+        changed. items are tuples of the path and whether it's new.
+        """
+        changes = []
+        for path, is_new in items:
+            if is_new:
+                self._update_runfolder(root_path, path, changes)
+                continue
+            with self._lock:
+                runfolder = self._roots[root_path].runfolders.get(path)
+            if runfolder is None:
+                continue
+            if force or runfolder.dir_mtime is None or runfolder.dir_mtime != _get_mtime(path) or \
+                    runfolder.state_mtime != _get_mtime(os.path.join(path, _STATE_DIR, _STATE_FILE)):
+                self._update_runfolder(root_path, path, changes)
+            else:
+                # Runfolders loaded from the store aren't watched yet
+                self._watch_runfolder(root_path, path)
+        self._save(changes)
+
+    def _handle_events(self, events):
+        for path, mask, name in events:
+            if mask & inotify.IN_Q_OVERFLOW:
+                self._logger.warning("inotify events were lost, rescanning the monitored directories")
+                self._rescan(force=True)
+                return
+            watch = self._watches.get(path)
+            if watch is None:
+                continue
+            _, kind, root_path = watch
+            if kind == "root":
+                child = os.path.join(path, name)
+                if mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                    self._remove_runfolder(root_path, child)
+                elif mask & inotify.IN_ISDIR:
+                    self._submit_update(root_path, child)
+            elif kind == "runfolder" and name in (_STATE_DIR, _COMPLETED_MARKER):
+                self._submit_update(root_path, path)
+            elif kind == "state_dir" and name == _STATE_FILE:
+                self._submit_update(root_path, os.path.dirname(path))
+
+    def _submit_update(self, root_path, path):
+        """Reads the state of the runfolder in the threads of its monitored directory"""
+        root = self._roots.get(root_path)
+        if root is None or root.status == _Root.DEGRADED:
+            return
+
+        def update():
+            try:
+                self._update_runfolder(root_path, path)
+            except Exception:
+                self._logger.exception("Failed to update the runfolder {0}".format(path))
+        self._submit(root_path, update)
+
+    def _update_runfolder(self, root_path, path, changes=None):
+        """
+        Reads the state of the runfolder. It's saved to the store right away, or appended
+        to changes, for the caller to save a batch at a time.
+        """
+        # The mtimes are read before the state, so that later changes are found by the next rescan
+        dir_mtime = _get_mtime(path)
+        state_mtime = _get_mtime(os.path.join(path, _STATE_DIR, _STATE_FILE))
+        state = self._get_state(path)
+
+        with self._lock:
+            root = self._roots.get(root_path)
+            if root is None:
+                return
+            runfolder = root.runfolders.get(path)
+            if runfolder is None:
+                root.runfolders[path] = _Runfolder(state, dir_mtime, state_mtime)
+                self._add_to_state(path, state)
+            else:
+                runfolder.dir_mtime = dir_mtime
+                runfolder.state_mtime = state_mtime
+                if runfolder.state != state:
+                    self._remove_from_state(path, runfolder.state)
+                    runfolder.state = state
+                    self._add_to_state(path, state)
+
+        if changes is None:
+            self._save([(path, state, dir_mtime, state_mtime)])
+        else:
+            changes.append((path, state, dir_mtime, state_mtime))
+        self._watch_runfolder(root_path, path)
+
+    def _watch_runfolder(self, root_path, path):
+        self._add_watch(path, _RUNFOLDER_EVENTS, "runfolder", root_path)
+        self._add_watch(os.path.join(path, _STATE_DIR), _STATE_DIR_EVENTS, "state_dir", root_path)
+
+    def _remove_runfolder(self, root_path, path):
+        with self._lock:
+            root = self._roots.get(root_path)
+            runfolder = root.runfolders.pop(path, None) if root else None
+            if runfolder is not None:
+                self._remove_from_state(path, runfolder.state)
+        if runfolder is not None and self._store is not None:
+            try:
+                self._store.remove([path])
+            except Exception:
+                self._logger.exception("Failed to remove the runfolder {0} from the store".format(path))
+        self._remove_watch(path)
+        self._remove_watch(os.path.join(path, _STATE_DIR))
+
+    def _load_store(self):
+        """Starts from the runfolders saved in the store, so that only the ones that changed are read"""
+        if self._store is None:
+            return
+        monitored_directories = set(os.path.normpath(d) for d in self._get_monitored_directories())
+        rows = self._store.load()
+        if not rows:
+            self._logger.info("The runfolder state store is empty, rebuilding it from the state files")
+            return
+        with self._lock:
+            for path, state, dir_mtime, state_mtime in rows:
+                root_path = os.path.dirname(path)
+                if root_path not in monitored_directories:
+                    continue
+                if root_path not in self._roots:
+                    self._roots[root_path] = _Root(root_path, self._scan_threads)
+                self._roots[root_path].runfolders[path] = _Runfolder(state, dir_mtime, state_mtime)
+                self._add_to_state(path, state)
+        self._logger.info("Loaded {0} runfolder states from the store".format(len(rows)))
+
+    def _save(self, changes):
+        """Saves the states and mtimes read, a list of (path, state, dir_mtime, state_mtime)"""
+        if self._store is None or not changes:
+            return
+        try:
+            self._store.save(changes)
+        except Exception:
+            # The state files are still there, so the index works without the store
+            self._logger.exception("Failed to save {0} runfolder states to the store".format(len(changes)))
+
+    def _remove_root(self, root_path):
+        with self._lock:
+            paths = list(self._roots[root_path].runfolders)
+        for path in paths:
+            self._remove_runfolder(root_path, path)
+        with self._lock:
+            root = self._roots.pop(root_path)
+        root.workers.shutdown()
+        self._remove_watch(root_path)
+
+    def _add_to_state(self, path, state):
+        self._by_state.setdefault(state, set()).add(path)
+        self._sorted_by_state.pop(state, None)
+        self._counter += 1
+
+    def _remove_from_state(self, path, state):
+        self._by_state.get(state, set()).discard(path)
+        self._sorted_by_state.pop(state, None)
+        self._counter += 1
+
+    def _sort_key(self, path):
+        root_path, name = os.path.split(path)
+        return self._root_order.get(root_path, len(self._root_order)), name
+
+    def _add_watch(self, path, mask, kind, root_path):
+        if self._inotify is None:
+            return
+        with self._watch_lock:
+            if path in self._watches:
+                return
+            self._watches[path] = None
+        # Adding a watch looks up the path, which hangs if the mount does, so it's done
+        # without holding the lock
+        try:
+            wd = self._inotify.add_watch(path, mask)
+        except OSError:
+            # The path doesn't exist (yet), or there are too many watches. Changes
+            # are then found by the rescans.
+            with self._watch_lock:
+                self._watches.pop(path, None)
+            return
+        with self._watch_lock:
+            if path in self._watches:
+                self._watches[path] = (wd, kind, root_path)
+                return
+        # Removed while it was being added
+        self._inotify.remove_watch(wd)
+
+    def _remove_watch(self, path):
+        if self._inotify is None:
+            return
+        with self._watch_lock:
+            watch = self._watches.pop(path, None)
+        if watch is not None:
+            self._inotify.remove_watch(watch[0])
+
+
+def _get_mtime(path):
+    """Returns the mtime of the path, or None if it doesn't exist or was changed just now"""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if time.time() - mtime < _RACY_SECONDS:
+        return None
+    return mtime
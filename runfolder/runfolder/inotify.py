@@ -0,0 +1,132 @@
+"""
+A minimal wrapper of the Linux inotify API, through ctypes so that no extension module
+is needed. inotify only sees changes made through the local kernel, so changes made on
+other hosts to a network file system, e.g. NFS, aren't reported.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+
+# struct inotify_event: int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def is_available():
+    """Returns True if inotify can be used on this platform"""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(_get_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class Inotify:
+    """
+    Watches paths for changes. Events are returned by read_events as tuples of the watched
+    path, the event mask and the name of the file in the watched directory that changed.
+    """
+
+    def __init__(self):
+        self._libc = _get_libc()
+        self._fd = self._libc.inotify_init1(_IN_CLOEXEC | _IN_NONBLOCK)
+        if self._fd < 0:
+            self._raise_errno("inotify_init1")
+        self._paths = {}
+
+    def add_watch(self, path, mask):
+        """
+        Watches the path for the events in mask. Returns the watch descriptor.
+
+        :raises OSError e.g. if the path doesn't exist, or there are too many watches
+        """
+        wd = self._libc.inotify_add_watch(self._fd, _encode(path), mask)
+        if wd < 0:
+            self._raise_errno(path)
+        self._paths[wd] = path
+        return wd
+
+    def remove_watch(self, wd):
+        if self._paths.pop(wd, None) is not None:
+            # Fails if the path has been removed, in which case the watch is already gone
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read_events(self, timeout):
+        """
+        Waits up to timeout seconds for events, and returns them as a list of
+        (path, mask, name). An IN_Q_OVERFLOW event, with path None, means that
+        events were lost.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += name_length
+            path = self._paths.get(wd)
+            if mask & IN_IGNORED:
+                # The watched path was removed, or the watch was
+                self._paths.pop(wd, None)
+            if path is not None or mask & IN_Q_OVERFLOW:
+                events.append((path, mask, name))
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._paths = {}
+
+    @staticmethod
+    def _raise_errno(filename):
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), filename)
+
+
+def _encode(path):
+    return path.encode(sys.getfilesystemencoding()) if not isinstance(path, bytes) else path
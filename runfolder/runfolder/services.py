@@ -1,6 +1,37 @@
 import os.path
 import socket
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
 import logging
+from arteria.schema import Schema, Field, string_types
+from arteria.web.serializers import register_serializer
+from runfolder.claims import RunfolderClaims
+from runfolder.index import RunfolderIndex
+from runfolder.state_store import RunfolderStateStore
+
+CONFIG_SCHEMA = Schema(
+    Field("monitored_directories", list, required=True,
+          convert=lambda directories: [os.path.normpath(directory) for directory in directories]),
+    # Seconds between rescans of the monitored directories, which find the changes inotify
+    # doesn't see, e.g. those made on other hosts to NFS mounts
+    Field("index_rescan_interval", (int, float), default=10, min_value=0.1),
+    Field("use_inotify", bool, default=True),
+    # The number of threads scanning the monitored directories, and whether the runfolders
+    # in them are also scanned concurrently
+    Field("scan_threads", int, default=4, min_value=1),
+    Field("scan_runfolders_in_parallel", bool, default=True),
+    # Seconds a monitored directory may take to scan before it's marked degraded and left
+    # out, e.g. because its mount hangs, and seconds before it's first retried
+    Field("scan_timeout", (int, float), default=30, min_value=0.1),
+    Field("degraded_retry_interval", (int, float), default=10, min_value=0.1),
+    # An SQLite database on a local file system that the runfolder states and their
+    # transitions are saved to, in addition to the state files. Optional.
+    Field("state_database", string_types, default=None),
+    # Seconds a claim of a runfolder lasts, unless the consumer renews it
+    Field("lease_seconds", (int, float), default=600, min_value=1),
+    name="RunfolderConfig")
 
 class RunfolderInfo:
     """Information about a runfolder. Status can be:
@@ -16,22 +47,59 @@ class RunfolderInfo:
     STATE_STARTED = "started"
     STATE_DONE = "done"
     STATE_ERROR = "error"
+    STATES = (STATE_NONE, STATE_READY, STATE_STARTED, STATE_DONE, STATE_ERROR)
 
     def __init__(self, host, path, state):
         self.host = host
         self.path = path
         self.state = state
+        self.link = None
 
     def __str__(self):
         return "{0}: {1}@{2}".format(self.state, self.path, self.host)
 
+    def to_dict(self):
+        return {"host": self.host, "path": self.path, "state": self.state, "link": self.link}
+
+register_serializer(RunfolderInfo)
+
 class RunfolderService:
     """Watches a set of directories on the server and reacts when one of them
        has a runfolder that's ready for processing"""
 
-    def __init__(self, configuration_svc, logger=None):
+    def __init__(self, configuration_svc, logger=None, rescan_interval=10, use_inotify=True,
+                 scan_threads=4, scan_runfolders_in_parallel=True, scan_timeout=30,
+                 degraded_retry_interval=10, state_database=None, lease_seconds=600):
+        """
+        :param configuration_svc: The config, with the monitored_directories
+        :param logger: The logger instance to use. Will default to one named like the module
+        :param rescan_interval: Seconds between rescans of the monitored directories by the index
+        :param use_inotify: If False, the index only finds changes by rescanning
+        :param scan_threads: The number of threads scanning each monitored directory
+        :param scan_runfolders_in_parallel: If True, the runfolders are also scanned concurrently
+        :param scan_timeout: Seconds a monitored directory may take to scan before it's degraded
+        :param degraded_retry_interval: Seconds before a degraded monitored directory is retried,
+                                        doubled for each failure in a row
+        :param state_database: The path of an SQLite database to save the states to, which
+                               lets the index start without reading every state file, and
+                               records when each state transition happened
+        :param lease_seconds: The default number of seconds a claim of a runfolder lasts
+        """
         self._configuration_svc = configuration_svc
         self._logger = logger or logging.getLogger(__name__)
+        self._store = RunfolderStateStore(state_database) if state_database else None
+        # The index calls the helpers through lambdas, so that they can be mocked out
+        self._index = RunfolderIndex(
+            lambda: self._monitored_directories(),
+            lambda path: self._subdirectories(path),
+            lambda path: self.get_runfolder_state(path),
+            rescan_interval=rescan_interval, use_inotify=use_inotify, scan_threads=scan_threads,
+            scan_subdirectories=scan_runfolders_in_parallel, scan_timeout=scan_timeout,
+            retry_interval=degraded_retry_interval, store=self._store, logger=self._logger)
+        self._claims = RunfolderClaims(
+            lambda path: self.get_runfolder_state(path),
+            lambda path, state: self.set_runfolder_state(path, state),
+            self._host(), lease_seconds=lease_seconds, logger=self._logger)
 
     # NOTE: These methods were added so that they could be easily mocked out.
     #       It would probably be nicer to move them inline and mock the system calls
@@ -50,7 +118,9 @@ class RunfolderService:
 
     @staticmethod
     def _subdirectories(path):
-        return os.listdir(path)
+        # The type of each entry comes with the directory listing, so unlike
+        # os.path.isdir this doesn't stat the entries, except for symlinks
+        return [entry.name for entry in scandir(path) if entry.is_dir()]
 
     def _validate_is_being_monitored(self, path):
         """
@@ -59,10 +129,24 @@ class RunfolderService:
 
         :raises PathNotMonitored
         """
-        monitored = any([path.startswith(mon) for mon in self._monitored_directories()])
+        path = os.path.normpath(path)
+        # Compared up to a separator, so that e.g. /data/mon1 doesn't match /data/mon10/rf1
+        monitored = any(path == mon or path.startswith(mon + os.sep)
+                        for mon in (os.path.normpath(mon) for mon in self._monitored_directories()))
         if not monitored:
             raise PathNotMonitored("The path {0} is not being monitored".format(path))
 
+    def _validate_is_not_degraded(self, path):
+        """
+        Validate that the monitored directory of the path isn't degraded, so that
+        requests don't hang on its mount
+
+        :raises MonitoredDirectoryDegraded
+        """
+        if self._index.is_degraded(path):
+            raise MonitoredDirectoryDegraded(
+                "The monitored directory of {0} is not responding".format(path))
+
     def create_runfolder(self, path):
         """
         Creates a runfolder at the path.
@@ -76,6 +160,7 @@ class RunfolderService:
         if os.path.exists(path):
             raise DirectoryAlreadyExists("The path {0} already exists and can't be overridden".format(path))
         os.makedirs(path)
+        self._index.update(path)
         self._logger.info(
             "Created a runfolder at {0} - intended for tests only".format(path))
 
@@ -98,6 +183,7 @@ class RunfolderService:
             raise CannotOverrideFile("The complete marker already exists at {0}".format(full_path))
 
         open(full_path, 'a').close()
+        self._index.update(path)
         self._logger.info(
             "Added the 'RTAComplete.txt' marker to '{0}' - intended for tests only".format(full_path))
 
@@ -106,10 +192,12 @@ class RunfolderService:
         Returns a RunfolderInfo by its Linux file path
 
         :raises PathNotMonitored
+        :raises MonitoredDirectoryDegraded
         :raises DirectoryDoesNotExist
         """
         self._logger.debug("get_runfolder_by_path({0})".format(path))
         self._validate_is_being_monitored(path)
+        self._validate_is_not_degraded(path)
 
         if not self._dir_exists(path):
             raise DirectoryDoesNotExist("Directory does not exist: '{0}'".format(path))
@@ -146,15 +234,21 @@ class RunfolderService:
                 state = RunfolderInfo.STATE_READY
         return state
 
-    @staticmethod
-    def set_runfolder_state(runfolder, state):
-        """Sets the state of a runfolder"""
+    def set_runfolder_state(self, runfolder, state):
+        """
+        Sets the state of a runfolder. The state file is written first, as other hosts and
+        tools read it, and then the index and the state database are updated.
+
+        :raises MonitoredDirectoryDegraded
+        """
+        self._validate_is_not_degraded(runfolder)
         arteria_dir = os.path.join(runfolder, ".arteria")
         state_file = os.path.join(arteria_dir, "state")
         if not os.path.exists(arteria_dir):
             os.makedirs(arteria_dir)
         with open(state_file, 'w') as f:
             f.write(state)
+        self._index.update(runfolder)
 
     def is_runfolder_ready(self, directory):
         state = self.get_runfolder_state(directory)
@@ -167,28 +261,108 @@ class RunfolderService:
     def next_runfolder(self):
         """Pulls for available run folders"""
         available = self.list_available_runfolders()
-        try:
-            first = available.next()
-        except StopIteration:
-            first = None
+        first = next(available, None)
 
         self._logger.info(
             "Searching for next available runfolder, found: {0}".format(first))
         return first
 
+    def claim_next_runfolder(self, owner="", lease_seconds=None):
+        """
+        Claims the next runfolder to process: a started one whose lease has expired, since
+        it has waited the longest, or else the first ready one. The claim sets the state to started, if the state file
+        still says ready, so only one consumer gets each runfolder, also across hosts.
+
+        Returns a tuple of the RunfolderInfo and the Lease, which the consumer should renew
+        while it works, or None if there's no runfolder to claim.
+
+        :param owner: Identifies the consumer in the lease and the logs
+        :param lease_seconds: Overrides the number of seconds the lease lasts
+        """
+        expired = []
+        for path in self._index.get_runfolders_in_state(RunfolderInfo.STATE_STARTED):
+            lease = self._claims.get_lease(path)
+            if lease is not None and lease.is_expired():
+                expired.append(path)
+        ready = self._index.get_runfolders_in_state(RunfolderInfo.STATE_READY)
+
+        # Consumers that lose the race for a runfolder try the next one
+        for path in expired + ready:
+            lease = self._claims.try_claim(path, owner, lease_seconds)
+            if lease is not None:
+                return RunfolderInfo(self._host(), path, RunfolderInfo.STATE_STARTED), lease
+        self._logger.debug("No runfolder to claim for {0}".format(owner))
+        return None
+
+    def renew_lease(self, path, lease_id, lease_seconds=None):
+        """
+        Extends the lease of a claimed runfolder, and returns it
+
+        :raises PathNotMonitored
+        :raises MonitoredDirectoryDegraded
+        :raises LeaseLost if the runfolder has been released, or claimed by someone else
+        """
+        self._validate_is_being_monitored(path)
+        self._validate_is_not_degraded(path)
+        return self._claims.renew(path, lease_id, lease_seconds)
+
+    def release_runfolder(self, path, lease_id, state):
+        """
+        Sets the state of a claimed runfolder, e.g. to done when it has been processed,
+        and removes its lease
+
+        :raises PathNotMonitored
+        :raises MonitoredDirectoryDegraded
+        :raises LeaseLost if the runfolder has been released, or claimed by someone else
+        """
+        self._validate_is_being_monitored(path)
+        self._validate_is_not_degraded(path)
+        self._claims.release(path, lease_id, state)
+
+    def get_available_runfolders(self):
+        """Returns a list of all the available runfolders on the host"""
+        return list(self.list_available_runfolders())
+
+    def get_runfolders_in_state(self, state):
+        """
+        Returns a list of the runfolders in the state, in the order of the monitored
+        directories and by name. Like the available runfolders, they're read from the index.
+        """
+        host = self._host()
+        return [RunfolderInfo(host, path, state) for path in self._index.get_runfolders_in_state(state)]
+
+    def get_state_transitions(self, path):
+        """
+        Returns the state transitions of the runfolder, oldest first, as dicts with the
+        from_state, to_state and the time it was seen. Requires a state database.
+
+        :raises StateDatabaseNotConfigured
+        """
+        if self._store is None:
+            raise StateDatabaseNotConfigured("No state_database is configured")
+        return self._store.get_transitions(os.path.normpath(path))
+
     def list_available_runfolders(self):
-        """Lists all the available runfolders on the host"""
+        """
+        Lists all the available runfolders on the host, in the order of the monitored
+        directories and by name. They are read from the index, which is kept up to date
+        in the background, so the monitored directories aren't scanned.
+        """
         self._logger.debug("get_available_runfolder")
-        for monitored_root in self._monitored_directories():
-            self._logger.debug("Checking subdirectories of {0}".format(monitored_root))
-            for subdir in self._subdirectories(monitored_root):
-                directory = os.path.join(monitored_root, subdir)
-                self._logger.debug("Found potential runfolder {0}".format(directory))
-                state = self.get_runfolder_state(directory)
-                if state == RunfolderInfo.STATE_READY:
-                    info = RunfolderInfo(self._host(),
-                                         directory, RunfolderInfo.STATE_READY)
-                    yield info
+        host = self._host()
+        for path in self._index.get_runfolders_in_state(RunfolderInfo.STATE_READY):
+            yield RunfolderInfo(host, path, RunfolderInfo.STATE_READY)
+
+    def get_version(self):
+        """Returns a version of the runfolders and states, which changes whenever they do"""
+        return self._index.get_version()
+
+    def get_health(self):
+        """
+        Returns the health of each monitored directory. The runfolders in degraded ones,
+        which didn't respond in time, are left out of the listings until they recover.
+        """
+        return self._index.get_health()
 
 class CannotOverrideFile(Exception):
     pass
@@ -202,3 +376,9 @@ class PathNotMonitored(Exception):
 class DirectoryAlreadyExists(Exception):
     pass
 
+class MonitoredDirectoryDegraded(Exception):
+    pass
+
+class StateDatabaseNotConfigured(Exception):
+    pass
+
@@ -0,0 +1,138 @@
+"""
+An SQLite database of the runfolder states, with the time of each state transition.
+
+The .arteria/state files remain the source of truth, which other hosts and tools read
+and write. The database is written through by the index whenever it reads a state, so
+that the index can start from it instead of reading every state file again. Queries by
+state are answered by the in-memory index. If the database is new or empty, it's rebuilt
+from the state files by the first scan.
+
+The database is opened in WAL mode, so reads don't block on writes, and can be shared
+by the worker processes of a host. It should be on a local file system, since SQLite's
+locking isn't reliable on NFS.
+"""
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runfolders (
+    path TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    dir_mtime REAL,
+    state_mtime REAL,
+    changed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    path TEXT NOT NULL,
+    from_state TEXT,
+    to_state TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_by_path ON transitions (path, at);
+"""
+
+
+class RunfolderStateStore:
+    """
+    Keeps the state of each runfolder, and the transitions between states. Can be used
+    from several threads, each of which gets its own connection.
+    """
+
+    def __init__(self, path, busy_timeout=30):
+        """
+        :param path: The path of the database file, which is created if it doesn't exist
+        :param busy_timeout: Seconds to wait for another connection writing to the database
+        """
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def load(self):
+        """Returns all the runfolders, as a list of (path, state, dir_mtime, state_mtime)"""
+        return self._connection().execute(
+            "SELECT path, state, dir_mtime, state_mtime FROM runfolders").fetchall()
+
+    def get_transitions(self, path):
+        """
+        Returns the state transitions of the runfolder at the path, oldest first, as dicts
+        with the from_state, which is None when the runfolder was first seen, the to_state
+        and the time it was seen, in seconds since the epoch
+        """
+        rows = self._connection().execute(
+            "SELECT from_state, to_state, at FROM transitions WHERE path = ? ORDER BY at, rowid",
+            (path,)).fetchall()
+        return [{"from_state": from_state, "to_state": to_state, "at": at} for from_state, to_state, at in rows]
+
+    def save(self, runfolders):
+        """
+        Saves the state and mtimes of the runfolders, a list of (path, state, dir_mtime,
+        state_mtime), in one transaction. A transition is recorded for each runfolder whose
+        state changed, so the same state seen by several processes is only recorded once.
+        """
+        if not runfolders:
+            return
+        now = time.time()
+        connection = self._connection()
+        with self._transaction(connection):
+            for path, state, dir_mtime, state_mtime in runfolders:
+                row = connection.execute(
+                    "SELECT state, changed_at FROM runfolders WHERE path = ?", (path,)).fetchone()
+                if row and row[0] == state:
+                    changed_at = row[1]
+                else:
+                    changed_at = now
+                    connection.execute("INSERT INTO transitions (path, from_state, to_state, at) VALUES (?, ?, ?, ?)",
+                                       (path, row[0] if row else None, state, now))
+                # INSERT OR REPLACE rather than an upsert, which older SQLite versions lack
+                connection.execute("INSERT OR REPLACE INTO runfolders VALUES (?, ?, ?, ?, ?)",
+                                   (path, state, dir_mtime, state_mtime, changed_at))
+
+    def remove(self, paths):
+        """Forgets the runfolders at the paths, which no longer exist. Their transitions are kept."""
+        if not paths:
+            return
+        connection = self._connection()
+        with self._transaction(connection):
+            connection.executemany("DELETE FROM runfolders WHERE path = ?", [(path,) for path in paths])
+
+    def close(self):
+        """Closes the connections of all threads of this process"""
+        with self._connections_lock:
+            for pid, connection in self._connections:
+                if pid == os.getpid():
+                    connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections can't be shared with a forked child process
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Commits aren't synced in WAL mode, only checkpoints are. The state files
+            # can rebuild whatever a crash loses.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            with self._connections_lock:
+                self._connections.append((os.getpid(), connection))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(connection):
+        # Takes the write lock up front, so that the reads in the transaction see the latest data
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,102 @@
+"""
+Compares full scans of a synthetic tree of runfolders spread over several monitored
+directories: with os.listdir and one monitored directory at a time, as
+list_available_runfolders used to, and with the index, with one thread and with
+several threads per monitored directory.
+
+Most runfolders are done, some are ready and some are still being sequenced, like on a
+host with a long history. With --latency-ms, every directory listing and state read
+sleeps, like a round trip to an NFS server, which is where the parallel scan pays off.
+
+Usage: python scan_benchmark.py [--runfolders 20000] [--roots 6] [--threads 8] [--latency-ms 0]
+"""
+import os
+import shutil
+import tempfile
+import time
+from optparse import OptionParser
+from runfolder.services import RunfolderService, RunfolderInfo
+
+
+def create_tree(base, runfolders, roots):
+    monitored_directories = [os.path.join(base, "mon{0}".format(index)) for index in range(roots)]
+    for index in range(runfolders):
+        path = os.path.join(monitored_directories[index % roots],
+                            "150415_D00457_{0:05d}_AC6281ANXX".format(index))
+        os.makedirs(os.path.join(path, "Data"))
+        if index % 10 != 0:
+            open(os.path.join(path, "RTAComplete.txt"), "w").close()
+        if index % 10 > 1:
+            os.makedirs(os.path.join(path, ".arteria"))
+            with open(os.path.join(path, ".arteria", "state"), "w") as f:
+                f.write(RunfolderInfo.STATE_DONE)
+    # Old enough for the index to trust the mtimes
+    old = time.time() - 60
+    for root, directories, _ in os.walk(base):
+        for directory in directories:
+            os.utime(os.path.join(root, directory), (old, old))
+    return monitored_directories
+
+
+def with_latency(fn, latency):
+    def slow(*args):
+        time.sleep(latency)
+        return fn(*args)
+    return slow
+
+
+def listdir_scan(runfolder_svc, monitored_directories, latency):
+    """The scan list_available_runfolders used to do for every request"""
+    listdir = with_latency(os.listdir, latency) if latency else os.listdir
+    ready = []
+    for monitored_root in monitored_directories:
+        for subdir in listdir(monitored_root):
+            directory = os.path.join(monitored_root, subdir)
+            if runfolder_svc.get_runfolder_state(directory) == RunfolderInfo.STATE_READY:
+                ready.append(directory)
+    return ready
+
+
+def create_service(monitored_directories, latency, threads):
+    runfolder_svc = RunfolderService({"monitored_directories": monitored_directories},
+                                     use_inotify=False, rescan_interval=3600, scan_threads=threads)
+    if latency:
+        runfolder_svc._subdirectories = with_latency(runfolder_svc._subdirectories, latency)
+        runfolder_svc.get_runfolder_state = with_latency(runfolder_svc.get_runfolder_state, latency)
+    return runfolder_svc
+
+
+def main():
+    parser = OptionParser(usage="%prog [--runfolders N] [--roots N] [--threads N] [--latency-ms MS]")
+    parser.add_option("--runfolders", dest="runfolders", type="int", default=20000)
+    parser.add_option("--roots", dest="roots", type="int", default=6)
+    parser.add_option("--threads", dest="threads", type="int", default=8)
+    parser.add_option("--latency-ms", dest="latency_ms", type="float", default=0)
+    (options, _) = parser.parse_args()
+    latency = options.latency_ms / 1000.0
+
+    base = tempfile.mkdtemp()
+    try:
+        monitored_directories = create_tree(base, options.runfolders, options.roots)
+
+        runfolder_svc = create_service(monitored_directories, latency, 1)
+        start = time.time()
+        ready = listdir_scan(runfolder_svc, monitored_directories, latency)
+        print("{0:<35} {1:8.0f} ms".format("listdir, one root at a time", 1000 * (time.time() - start)))
+
+        for name, threads in ("index, 1 thread", 1), ("index, {0} threads".format(options.threads), options.threads):
+            runfolder_svc = create_service(monitored_directories, latency, threads)
+            start = time.time()
+            found = runfolder_svc.get_available_runfolders()
+            print("{0:<35} {1:8.0f} ms".format(name + ", first scan", 1000 * (time.time() - start)))
+            assert sorted(info.path for info in found) == sorted(ready)
+
+            start = time.time()
+            runfolder_svc._index._rescan()
+            print("{0:<35} {1:8.0f} ms".format(name + ", rescan", 1000 * (time.time() - start)))
+            runfolder_svc._index.stop()
+    finally:
+        shutil.rmtree(base)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Compares encoding a list of 10k RunfolderInfo objects with jsonpickle, as
+BaseRestHandler.write_object used to, and with the serializer registry.
+
+Usage: python serialization_benchmark.py [count]
+"""
+import sys
+import timeit
+import jsonpickle
+from arteria.web import serializers
+from runfolder.services import RunfolderInfo
+
+
+def main(count):
+    runfolder_infos = []
+    for i in range(count):
+        info = RunfolderInfo("seqhost1", "/data/biotank1/runfolders/150415_D00457_{0:04d}_AC6281ANXX".format(i),
+                             RunfolderInfo.STATE_READY)
+        info.link = "http://arteria1:10800/api/1.0/runfolders/path{0}".format(info.path)
+        runfolder_infos.append(info)
+
+    cases = [("jsonpickle", lambda: jsonpickle.encode(runfolder_infos, unpicklable=False)),
+             ("encode_json ({0})".format("orjson" if serializers.orjson else "json"),
+              lambda: serializers.encode_json(runfolder_infos))]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print("{0:<25} {1:8.2f} ms".format(name, 1000 * seconds))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -52,12 +52,16 @@ class RestApiTestCase(BaseRestTest):
 
         # The runfolder should show up in /runfolders
         resp = self.get("./runfolders")
-        matching = [runfolder for runfolder in resp.body_obj if runfolder["path"] == path]
+        matching = [runfolder for runfolder in resp.body_obj["runfolders"] if runfolder["path"] == path]
         self.assertEqual(len(matching), 1)
 
         # TODO: Change state to "processing" and ensure it doesn't show up in /runfolders
         self.messages_logged.assert_changed_by_total(2)
 
+    def test_list_runfolders_under_load(self):
+        result = self.load_test("./runfolders", clients=8, seconds=10)
+        result.assert_slo(self, p99=1.0)
+
 
 if __name__ == '__main__':
     unittest.main()
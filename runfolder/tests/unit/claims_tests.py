@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from runfolder.claims import LeaseLost
+from runfolder.handlers import ClaimNextRunfolderHandler, RenewLeaseHandler, ReleaseRunfolderHandler
+from runfolder.services import RunfolderService
+
+
+def create_runfolders(root, count):
+    for index in range(count):
+        path = os.path.join(root, "rf{0:02d}".format(index))
+        os.makedirs(path)
+        open(os.path.join(path, "RTAComplete.txt"), "w").close()
+
+
+def create_service(root):
+    return RunfolderService({"monitored_directories": [root]}, use_inotify=False, rescan_interval=0.1)
+
+
+def claim_all(runfolder_svc, owner):
+    claimed = []
+    while True:
+        claim = runfolder_svc.claim_next_runfolder(owner)
+        if claim is None:
+            return claimed
+        claimed.append(claim[0].path)
+
+
+def claim_all_in_process(root, owner, results):
+    runfolder_svc = create_service(root)
+    results.put(claim_all(runfolder_svc, owner))
+    runfolder_svc._index.stop()
+
+
+class RunfolderClaimsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "mon1")
+        create_runfolders(self.root, 20)
+        self.runfolder_svc = create_service(self.root)
+
+    def tearDown(self):
+        self.runfolder_svc._index.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_each_runfolder_is_claimed_once_by_concurrent_threads(self):
+        with ThreadPoolExecutor(8) as pool:
+            claimed = list(pool.map(lambda owner: claim_all(self.runfolder_svc, owner), range(8)))
+        paths = [path for paths in claimed for path in paths]
+        self.assertEqual(sorted(paths), sorted(os.path.join(self.root, name) for name in os.listdir(self.root)))
+        self.assertEqual(self.runfolder_svc.get_available_runfolders(), [])
+        # The thread locks of the runfolders aren't kept once they're claimed
+        self.assertEqual(self.runfolder_svc._claims._thread_locks, {})
+
+    def test_each_runfolder_is_claimed_once_by_concurrent_processes(self):
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=claim_all_in_process, args=(self.root, owner, results))
+                     for owner in range(4)]
+        for process in processes:
+            process.start()
+        paths = [path for _ in processes for path in results.get(timeout=30)]
+        for process in processes:
+            process.join()
+        self.assertEqual(len(paths), 20)
+        self.assertEqual(len(set(paths)), 20)
+
+    def test_expired_leases_are_reclaimed(self):
+        runfolder_info, lease = self.runfolder_svc.claim_next_runfolder("worker1", lease_seconds=0.2)
+        self.assertEqual(self.runfolder_svc.get_runfolder_state(runfolder_info.path), "started")
+        self.runfolder_svc.renew_lease(runfolder_info.path, lease.lease_id, lease_seconds=0.2)
+        time.sleep(0.3)
+
+        # The expired lease comes before the ready runfolders
+        reclaimed_info, new_lease = self.runfolder_svc.claim_next_runfolder("worker2")
+        self.assertEqual(reclaimed_info.path, runfolder_info.path)
+        self.assertEqual(new_lease.owner, "worker2")
+        with self.assertRaises(LeaseLost):
+            self.runfolder_svc.renew_lease(runfolder_info.path, lease.lease_id)
+
+        self.runfolder_svc.release_runfolder(reclaimed_info.path, new_lease.lease_id, "done")
+        self.assertEqual(self.runfolder_svc.get_runfolder_state(reclaimed_info.path), "done")
+        with self.assertRaises(LeaseLost):
+            self.runfolder_svc.release_runfolder(reclaimed_info.path, new_lease.lease_id, "error")
+
+
+class ClaimHandlersTestCase(AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "mon1")
+        create_runfolders(self.root, 3)
+        self.runfolder_svc = create_service(self.root)
+        super(ClaimHandlersTestCase, self).setUp()
+
+    def tearDown(self):
+        super(ClaimHandlersTestCase, self).tearDown()
+        self.runfolder_svc._index.stop()
+        shutil.rmtree(self.tmp)
+
+    def get_app(self):
+        args = dict(runfolder_svc=self.runfolder_svc, config_svc={})
+        return tornado.web.Application([
+            (r"/api/1.0/runfolders/claim", ClaimNextRunfolderHandler, args),
+            (r"/api/1.0/runfolders/lease/path(/.*)", RenewLeaseHandler, args),
+            (r"/api/1.0/runfolders/release/path(/.*)", ReleaseRunfolderHandler, args),
+        ])
+
+    def fetch_json(self, url, method, body):
+        return self.http_client.fetch(self.get_url(url), method=method, body=json.dumps(body),
+                                      raise_error=False)
+
+    @gen_test
+    def test_claim_renew_and_release(self):
+        responses = yield [self.fetch_json("/api/1.0/runfolders/claim", "POST", {"owner": str(owner)})
+                           for owner in range(4)]
+        claims = [json.loads(response.body) for response in responses]
+        self.assertEqual(sorted(claim["path"] for claim in claims if claim),
+                         [os.path.join(self.root, name) for name in ("rf00", "rf01", "rf02")])
+        self.assertEqual(claims.count(None), 1)
+
+        claim = [claim for claim in claims if claim][0]
+        lease_id = claim["lease"]["lease_id"]
+        response = yield self.fetch_json("/api/1.0/runfolders/lease/path" + claim["path"], "PUT",
+                                         {"lease_id": lease_id, "lease_seconds": 60})
+        # Renewed for a shorter time than the claim's default lease
+        lease = json.loads(response.body)
+        self.assertEqual(lease["lease_id"], lease_id)
+        self.assertLess(lease["expires_at"], claim["lease"]["expires_at"])
+
+        response = yield self.fetch_json("/api/1.0/runfolders/release/path" + claim["path"], "POST",
+                                         {"lease_id": lease_id, "state": "done"})
+        self.assertEqual(response.code, 200)
+        response = yield self.fetch_json("/api/1.0/runfolders/lease/path" + claim["path"], "PUT",
+                                         {"lease_id": lease_id})
+        self.assertEqual(response.code, 409)
+        response = yield self.fetch_json("/api/1.0/runfolders/release/path" + claim["path"], "POST",
+                                         {"lease_id": lease_id, "state": "started"})
+        self.assertEqual(response.code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from runfolder import inotify
+from runfolder.services import RunfolderService, MonitoredDirectoryDegraded
+
+# Lists two monitored directories, one of which hangs for good, and exits
+HUNG_MOUNT_SCRIPT = """
+import sys, threading
+from runfolder.services import RunfolderService
+hung_root, root = sys.argv[1:]
+runfolder_svc = RunfolderService({"monitored_directories": [hung_root, root]}, use_inotify=False,
+                                 scan_timeout=0.2)
+subdirectories = runfolder_svc._subdirectories
+runfolder_svc._subdirectories = lambda path: threading.Event().wait() if path == hung_root else subdirectories(path)
+print(runfolder_svc.get_health()[hung_root]["status"])
+"""
+
+
+class RunfolderIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roots = [os.path.join(self.tmp, "mon1"), os.path.join(self.tmp, "mon2")]
+        for root in self.roots:
+            os.makedirs(root)
+        self.make_runfolder(self.roots[1], "rf1", ready=True)
+        self.make_runfolder(self.roots[0], "rf2", ready=True)
+        self.make_runfolder(self.roots[0], "rf3", ready=False)
+
+    def tearDown(self):
+        self.runfolder_svc._index.stop()
+        shutil.rmtree(self.tmp)
+
+    def make_runfolder(self, root, name, ready):
+        path = os.path.join(root, name)
+        os.makedirs(path)
+        if ready:
+            open(os.path.join(path, "RTAComplete.txt"), "w").close()
+        return path
+
+    def create_service(self, use_inotify, rescan_interval, scan_threads=4, **kwargs):
+        self.runfolder_svc = RunfolderService({"monitored_directories": self.roots},
+                                              rescan_interval=rescan_interval, use_inotify=use_inotify,
+                                              scan_threads=scan_threads, **kwargs)
+        return self.runfolder_svc
+
+    def ready_paths(self):
+        return [info.path for info in self.runfolder_svc.list_available_runfolders()]
+
+    def wait_for_ready_paths(self, expected):
+        deadline = time.time() + 5
+        while self.ready_paths() != expected and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.ready_paths(), expected)
+
+    def check_finds_external_changes(self):
+        rf1, rf2, rf3 = (os.path.join(self.roots[1], "rf1"), os.path.join(self.roots[0], "rf2"),
+                         os.path.join(self.roots[0], "rf3"))
+        # Ordered by monitored directory, then by name
+        self.assertEqual(self.ready_paths(), [rf2, rf1])
+
+        open(os.path.join(rf3, "RTAComplete.txt"), "w").close()
+        self.wait_for_ready_paths([rf2, rf3, rf1])
+
+        # A state file written by another process
+        os.makedirs(os.path.join(rf2, ".arteria"))
+        with open(os.path.join(rf2, ".arteria", "state"), "w") as f:
+            f.write("started")
+        self.wait_for_ready_paths([rf3, rf1])
+
+        rf4 = self.make_runfolder(self.roots[1], "rf4", ready=True)
+        shutil.rmtree(rf1)
+        self.wait_for_ready_paths([rf3, rf4])
+
+    @unittest.skipUnless(inotify.is_available(), "inotify is not available")
+    def test_finds_changes_with_inotify(self):
+        self.create_service(use_inotify=True, rescan_interval=60)
+        self.check_finds_external_changes()
+
+    def test_finds_changes_by_rescanning(self):
+        self.create_service(use_inotify=False, rescan_interval=0.1)
+        self.check_finds_external_changes()
+
+    def test_serial_and_parallel_scans_find_the_same_runfolders(self):
+        for index in range(250):
+            self.make_runfolder(self.roots[index % 2], "rf{0:03d}".format(index + 10), ready=index % 3 == 0)
+        open(os.path.join(self.roots[0], "not_a_runfolder.txt"), "w").close()
+
+        self.create_service(use_inotify=False, rescan_interval=60, scan_threads=1)
+        serial = self.ready_paths()
+        self.runfolder_svc._index.stop()
+        self.create_service(use_inotify=False, rescan_interval=60, scan_threads=8)
+        self.assertEqual(self.ready_paths(), serial)
+        self.assertEqual(len(serial), 2 + 84)
+
+    def test_own_changes_are_visible_right_away(self):
+        runfolder_svc = self.create_service(use_inotify=False, rescan_interval=60)
+        version = runfolder_svc.get_version()
+        rf2 = os.path.join(self.roots[0], "rf2")
+        runfolder_svc.set_runfolder_state(rf2, "started")
+        self.assertEqual(self.ready_paths(), [os.path.join(self.roots[1], "rf1")])
+        self.assertNotEqual(runfolder_svc.get_version(), version)
+
+    def test_versions_agree_between_processes_with_the_same_runfolders(self):
+        runfolder_svc = self.create_service(use_inotify=False, rescan_interval=60)
+        self.ready_paths()
+        # A second index, like the one of another worker process or after a restart
+        other_svc = RunfolderService({"monitored_directories": self.roots}, use_inotify=False,
+                                     rescan_interval=60)
+        self.addCleanup(other_svc._index.stop)
+        list(other_svc.list_available_runfolders())
+        self.assertEqual(other_svc.get_version(), runfolder_svc.get_version())
+
+        rf2 = os.path.join(self.roots[0], "rf2")
+        version = runfolder_svc.get_version()
+        runfolder_svc.set_runfolder_state(rf2, "started")
+        self.assertNotEqual(runfolder_svc.get_version(), version)
+        other_svc._index.update(rf2)
+        self.assertEqual(other_svc.get_version(), runfolder_svc.get_version())
+
+    def test_rescans_only_read_changed_runfolders(self):
+        runfolder_svc = self.create_service(use_inotify=False, rescan_interval=60)
+        reads = []
+        get_runfolder_state = runfolder_svc.get_runfolder_state
+        runfolder_svc.get_runfolder_state = lambda path: reads.append(path) or get_runfolder_state(path)
+        self.ready_paths()
+
+        # Pretend the runfolders were created a while ago, so their mtimes are trusted
+        for root in self.roots:
+            for path in [root] + [os.path.join(root, name) for name in os.listdir(root)]:
+                os.utime(path, (time.time() - 60, time.time() - 60))
+        runfolder_svc._index._rescan(force=True)
+        del reads[:]
+        runfolder_svc._index._rescan()
+        self.assertEqual(reads, [])
+
+    def test_runfolders_that_failed_to_be_read_are_read_on_the_next_rescan(self):
+        # Old enough mtimes, so an unchanged monitored directory isn't listed again
+        for root in self.roots:
+            for path in [root] + [os.path.join(root, name) for name in os.listdir(root)]:
+                os.utime(path, (time.time() - 60, time.time() - 60))
+        runfolder_svc = self.create_service(use_inotify=False, rescan_interval=60,
+                                            degraded_retry_interval=0.1)
+        rf1, rf2 = os.path.join(self.roots[1], "rf1"), os.path.join(self.roots[0], "rf2")
+        failures = [rf2]
+        get_runfolder_state = runfolder_svc.get_runfolder_state
+
+        def failing_get_runfolder_state(path):
+            if path in failures:
+                failures.remove(path)
+                raise IOError("Stale file handle")
+            return get_runfolder_state(path)
+        runfolder_svc.get_runfolder_state = failing_get_runfolder_state
+
+        self.assertEqual(self.ready_paths(), [rf1])
+        self.assertEqual(runfolder_svc.get_health()[self.roots[0]]["status"], "degraded")
+        time.sleep(0.2)
+        runfolder_svc._index._rescan()
+        self.assertEqual(self.ready_paths(), [rf2, rf1])
+        self.assertEqual(runfolder_svc.get_health()[self.roots[0]]["status"], "ok")
+
+    def test_hung_monitored_directory_is_left_out_until_it_recovers(self):
+        runfolder_svc = self.create_service(use_inotify=False, rescan_interval=0.1,
+                                            scan_timeout=0.5, degraded_retry_interval=0.1)
+        mount_responds = threading.Event()
+        self.addCleanup(mount_responds.set)
+        subdirectories = runfolder_svc._subdirectories
+
+        def hanging_subdirectories(path):
+            if path == self.roots[1]:
+                mount_responds.wait()
+            return subdirectories(path)
+        runfolder_svc._subdirectories = hanging_subdirectories
+
+        rf1, rf2 = os.path.join(self.roots[1], "rf1"), os.path.join(self.roots[0], "rf2")
+        self.assertEqual(self.ready_paths(), [rf2])
+        health = runfolder_svc.get_health()
+        self.assertEqual(health[self.roots[0]]["status"], "ok")
+        self.assertEqual(health[self.roots[1]]["status"], "degraded")
+        self.assertIn("Timed out", health[self.roots[1]]["error"])
+        with self.assertRaises(MonitoredDirectoryDegraded):
+            runfolder_svc.get_runfolder_by_path(rf1)
+
+        mount_responds.set()
+        self.wait_for_ready_paths([rf2, rf1])
+        self.assertEqual(runfolder_svc.get_health()[self.roots[1]]["status"], "ok")
+        self.assertEqual(runfolder_svc.get_runfolder_by_path(rf1).state, "ready")
+
+    def test_process_with_a_hung_monitored_directory_exits(self):
+        self.create_service(use_inotify=False, rescan_interval=60)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        process = subprocess.Popen([sys.executable, "-c", HUNG_MOUNT_SCRIPT] + self.roots,
+                                   stdout=subprocess.PIPE, env=env)
+        deadline = time.time() + 10
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if process.poll() is None:
+            process.kill()
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(output.decode().strip(), "degraded")
+
+if __name__ == '__main__':
+    unittest.main()
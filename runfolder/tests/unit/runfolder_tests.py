@@ -1,6 +1,15 @@
+import json
+import os
+import shutil
+import tempfile
+import time
 import unittest
 import logging
-from runfolder.services import RunfolderService
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from arteria.web.client import ArteriaClient, ArteriaClientError, RunfolderClient
+from runfolder.handlers import ListAvailableRunfoldersHandler, NextAvailableRunfolderHandler, RunfolderHandler
+from runfolder.services import RunfolderService, PathNotMonitored
 
 logger = logging.getLogger(__name__)
 
@@ -57,5 +66,90 @@ class RunfolderServiceTestCase(unittest.TestCase):
         expected = "ready: /data/testarteria1/mon1/runfolder001@localhost"
         self.assertEqual(str(runfolder), expected)
 
+    def test_only_paths_below_monitored_directories_are_monitored(self):
+        runfolder_svc = RunfolderService({"monitored_directories": ["/data/mon1/"]}, logger)
+        for path in "/data/mon1/rf1", "/data/mon1//rf1/", "/data/mon1":
+            runfolder_svc._validate_is_being_monitored(path)
+        for path in "/data/mon10/rf1", "/data/mon1/../mon2/rf1", "/data":
+            self.assertRaises(PathNotMonitored, runfolder_svc._validate_is_being_monitored, path)
+
+class ConcurrentRequestsTestCase(AsyncHTTPTestCase):
+
+    def get_app(self):
+        configuration_svc = {"monitored_directories": ["/data/testarteria1/mon1"]}
+        self.runfolder_svc = RunfolderService(configuration_svc, logger)
+        self.runfolder_svc._file_exists = lambda path: path.endswith("RTAComplete.txt")
+        self.runfolder_svc._host = lambda: "localhost"
+        self.scans = 0
+
+        def slow_subdirectories(path):
+            self.scans += 1
+            time.sleep(0.2)
+            return ["runfolder001"]
+        self.runfolder_svc._subdirectories = slow_subdirectories
+
+        args = dict(runfolder_svc=self.runfolder_svc, config_svc=configuration_svc)
+        return tornado.web.Application([
+            (r"/api/1.0/runfolders", ListAvailableRunfoldersHandler, args),
+            (r"/api/1.0/runfolders/next", NextAvailableRunfolderHandler, args)
+        ])
+
+    @gen_test
+    def test_simultaneous_requests_share_one_scan(self):
+        # The requests are answered from the index, which scans the directory once
+        for url in "/api/1.0/runfolders", "/api/1.0/runfolders/next":
+            responses = yield [self.http_client.fetch(self.get_url(url)) for _ in range(10)]
+            for response in responses:
+                body = json.loads(response.body)
+                if "runfolders" in body:
+                    self.assertEqual(body["health"]["/data/testarteria1/mon1"]["status"], "ok")
+                runfolder = body["runfolders"][0] if "runfolders" in body else body
+                self.assertEqual(runfolder["path"], "/data/testarteria1/mon1/runfolder001")
+                self.assertTrue(runfolder["link"].startswith("http://127.0.0.1"))
+        self.assertEqual(self.scans, 1)
+
+class RunfolderClientTestCase(AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "mon1")
+        os.makedirs(os.path.join(self.root, "rf1"))
+        open(os.path.join(self.root, "rf1", "RTAComplete.txt"), "w").close()
+        self.runfolder_svc = RunfolderService({"monitored_directories": [self.root]}, use_inotify=False,
+                                              rescan_interval=60)
+        super(RunfolderClientTestCase, self).setUp()
+        self.client = ArteriaClient(retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        super(RunfolderClientTestCase, self).tearDown()
+        self.runfolder_svc._index.stop()
+        shutil.rmtree(self.tmp)
+
+    def get_app(self):
+        args = dict(runfolder_svc=self.runfolder_svc, config_svc={})
+        return tornado.web.Application([
+            (r"/api/1.0/runfolders", ListAvailableRunfoldersHandler, args),
+            (r"/api/1.0/runfolders/path(/.*)", RunfolderHandler, args)
+        ])
+
+    @gen_test
+    def test_sets_the_state_through_the_client(self):
+        rf1 = os.path.join(self.root, "rf1")
+        runfolder_client = RunfolderClient(self.get_url("/api/1.0"), self.client)
+        runfolder = yield runfolder_client.set_runfolder_state(rf1, "started")
+        self.assertEqual((runfolder["path"], runfolder["state"]), (rf1, "started"))
+        with open(os.path.join(rf1, ".arteria", "state")) as f:
+            self.assertEqual(f.read(), "started")
+        runfolders = yield runfolder_client.list_runfolders()
+        self.assertEqual(runfolders["runfolders"], [])
+
+        for path, state, code in ((rf1, "bogus", 400), (os.path.join(self.root, "rf2"), "done", 404),
+                                  (os.path.join(self.tmp, "rf3"), "done", 400)):
+            with self.assertRaises(ArteriaClientError) as context:
+                yield runfolder_client.set_runfolder_state(path, state)
+            self.assertEqual(context.exception.code, code)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "rf2")))
+
 if __name__ == '__main__':
     unittest.main()
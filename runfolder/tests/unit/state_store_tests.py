@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from runfolder.services import RunfolderService
+from runfolder.state_store import RunfolderStateStore
+
+
+class RunfolderStateStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = RunfolderStateStore(os.path.join(self.tmp, "states.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_records_each_transition_once(self):
+        self.store.save([("/mon/rf1", "ready", 1.0, None), ("/mon/rf2", "none", 1.0, None)])
+        # Seen again, e.g. by another worker, with newer mtimes
+        self.store.save([("/mon/rf1", "ready", 2.0, None)])
+        self.store.save([("/mon/rf1", "started", 3.0, 3.0)])
+
+        transitions = self.store.get_transitions("/mon/rf1")
+        self.assertEqual([(t["from_state"], t["to_state"]) for t in transitions],
+                         [(None, "ready"), ("ready", "started")])
+        saved = dict((row[0], row[1:]) for row in self.store.load())
+        self.assertEqual(saved["/mon/rf1"], ("started", 3.0, 3.0))
+
+    def test_removes_runfolders_but_keeps_their_transitions(self):
+        self.store.save([("/mon/rf1", "ready", None, None), ("/mon/rf2", "done", None, None)])
+        self.store.remove(["/mon/rf1"])
+        self.assertEqual([row[:2] for row in self.store.load()], [("/mon/rf2", "done")])
+        self.assertEqual(len(self.store.get_transitions("/mon/rf1")), 1)
+
+
+class RunfolderServiceWithStateStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "mon1")
+        self.database = os.path.join(self.tmp, "states.db")
+        for name in "rf1", "rf2", "rf3":
+            os.makedirs(os.path.join(self.root, name))
+            open(os.path.join(self.root, name, "RTAComplete.txt"), "w").close()
+        self.services = []
+
+    def tearDown(self):
+        for runfolder_svc in self.services:
+            runfolder_svc._index.stop()
+        shutil.rmtree(self.tmp)
+
+    def create_service(self):
+        runfolder_svc = RunfolderService({"monitored_directories": [self.root]}, use_inotify=False,
+                                         rescan_interval=60, state_database=self.database)
+        self.reads = []
+        get_runfolder_state = runfolder_svc.get_runfolder_state
+        runfolder_svc.get_runfolder_state = lambda path: self.reads.append(path) or get_runfolder_state(path)
+        self.services.append(runfolder_svc)
+        return runfolder_svc
+
+    def backdate(self):
+        """Makes the mtimes old enough to be trusted"""
+        old = time.time() - 60
+        for directory, directories, files in os.walk(self.root):
+            for name in directories + files:
+                os.utime(os.path.join(directory, name), (old, old))
+
+    def test_rebuilds_from_the_state_files_and_starts_from_the_database(self):
+        rf1, rf2, rf3 = [os.path.join(self.root, name) for name in ("rf1", "rf2", "rf3")]
+        runfolder_svc = self.create_service()
+        self.assertEqual(len(runfolder_svc.get_available_runfolders()), 3)
+        runfolder_svc.set_runfolder_state(rf2, "started")
+        with open(os.path.join(rf2, ".arteria", "state")) as f:
+            self.assertEqual(f.read(), "started")
+        self.assertEqual([info.path for info in runfolder_svc.get_runfolders_in_state("started")], [rf2])
+        self.assertEqual([(t["from_state"], t["to_state"]) for t in runfolder_svc.get_state_transitions(rf2)],
+                         [(None, "ready"), ("ready", "started")])
+        runfolder_svc._index.stop()
+
+        # A restart only reads the runfolders that changed since
+        self.backdate()
+        runfolder_svc = self.create_service()
+        runfolder_svc.get_available_runfolders()
+        runfolder_svc._index.stop()
+        runfolder_svc = self.create_service()
+        open(os.path.join(rf3, "RunInfo.xml"), "w").close()
+        self.assertEqual([info.path for info in runfolder_svc.get_available_runfolders()], [rf1, rf3])
+        self.assertEqual(self.reads, [rf3])
+        states = dict(row[:2] for row in RunfolderStateStore(self.database).load())
+        self.assertEqual(states, {rf1: "ready", rf2: "started", rf3: "ready"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import os.path
 from .configuration import ConfigurationService
+from arteria.web.serializers import register_serializer
 import socket
 import subprocess
 
@@ -56,6 +57,11 @@ class ProcessInfo(object):
         return "{0} {3}: {1}@{2}".format(self.state, self.runfolder,
                                          self.host, self.pid)
 
+    # The Popen object in proc is left out, it can't be serialized
+    def to_dict(self):
+        return {"runfolder": self.runfolder, "host": self.host, "state": self.state,
+                "msg": self.msg, "pid": self.pid, "link": self.link}
+
     # Update the appropriate meta data for the process when it has been started
     def set_started(self, proc):
         self.host = ProcessService._host()
@@ -73,6 +79,9 @@ class ProcessInfo(object):
                            msg="No such process exists")
 
 
+register_serializer(ProcessInfo)
+
+
 class ExecString(object):
     """ Object for storing the string that will be executed. Content is semi
         standardised, as the called Perl scripts almost looks the same. It will
@@ -3,6 +3,7 @@ import tornado.web
 import jsonpickle
 from .siswrap import ProcessService, Logger, ProcessInfo, Wrapper
 from .configuration import ConfigurationService
+from arteria.web.serializers import encode_json, register_serializer
 import os
 import click
 
@@ -18,7 +19,7 @@ class BaseHandler(tornado.web.RequestHandler):
     def write_object(self, obj, http_code=200, reason="OK"):
         self.set_status(http_code, reason)
         self.set_header("Content-Type", "application/json")
-        resp = jsonpickle.encode(obj, unpicklable=False)
+        resp = encode_json(obj)
         self.write(resp)
 
     # Respond with different HTTP messages depending on the return code
@@ -165,6 +166,11 @@ class ApiHelpEntry(object):
         self.link = self.prefix + link
         self.description = description
 
+    def to_dict(self):
+        return {"link": self.link, "description": self.description}
+
+register_serializer(ApiHelpEntry)
+
 
 class ApiHelpHandler(BaseHandler):
     def get(self):
@@ -198,7 +204,7 @@ class SisApp(object):
             (r"/api/1.0", ApiHelpHandler),
             (r"/api/1.0/(?:qc|report)/run/([\w_-]+)", RunHandler),
             (r"/api/1.0/(?:qc|report)/status/(\d*)", StatusHandler)
-        ], debug=debug)
+        ], debug=debug, compress_response=True)
         return app
 
     @classmethod
@@ -4,6 +4,7 @@ import time
 import jsonpickle
 from siswrap.configuration import ConfigurationService
 from siswrap.siswrap import ProcessService
+from arteria.testhelpers import LoadTest
 # from siswrap.siswrap_ws import SisApp
 
 
@@ -242,5 +243,10 @@ class TestRestApi(object):
     def test_can_check_all_qc_statuses(self, monkeypatch):
         self.check_all_statuses("qc", 10, monkeypatch)
 
+    def test_qc_status_under_load(self):
+        url = self.get_url("qc") + "/status/"
+        result = LoadTest(lambda session: session.get(url), clients=8, seconds=10).run()
+        result.assert_slo(p99=1.0)
+
 if __name__ == '__main__':
     pytest.main()